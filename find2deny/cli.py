@@ -1,28 +1,35 @@
 import sys
+import os
 from os import path
 import argparse
 import logging
 import sqlite3
 import glob
 import hashlib
+import time
 
-from typing import List, Dict
+from typing import List, Dict, Set, Tuple
 from pprint import pprint, pformat
 
 from . config_parser import ParserConfigException, \
-    VERBOSITY, LOG_LEVELS, CONF_FILE, \
-    LOG_FILES, LOG_PATTERN, DATABASE_PATH, \
+    VERBOSITY, LOG_LEVELS, CONF_FILE, FOLLOW, FOLLOW_INTERVAL, \
+    LOG_FILES, LOG_PATTERN, DATABASE_PATH, WORKERS, SPLIT_SIZE, BATCH_SIZE, DECOMPRESS_COMMAND, PARSE_CACHE_SIZE, \
+    JOURNAL_MODE, SYNCHRONOUS, CACHE_SIZE, COMMIT_ENTRIES, COMMIT_SECONDS, \
+    RESOLVER, IP2ASN_FILE, RDAP_FALLBACK, RESOLVER_CACHE_TTL, RESOLVER_WORKERS, \
     WHITE_LIST, \
     JUDGMENT, RULES, \
-    BOT_REQUEST, MAX_REQUEST, INTERVAL_SECONDS, \
-    BLACKLIST_AGENT, \
+    BOT_REQUEST, MAX_REQUEST, INTERVAL_SECONDS, ENGINE, \
+    BLACKLIST_AGENT, BLACKLIST_AGENT_REGEX, \
     EXECUTION, SCRIPT, \
     parse_config_file
 
 from . import log_parser
+from . import log_batch
+from . import log_cache
 from . import judgment
 from . import execution
 from . import db_connection
+from . import resolver
 
 
 LOGGER = logging.getLogger(__name__)
@@ -53,6 +60,8 @@ def main():
     parser.add_argument("-v", f"--{VERBOSITY}",
                         choices=LOG_LEVELS,
                         help="how much information is printed out during processing log files")
+    parser.add_argument("-f", f"--{FOLLOW}", action="store_true",
+                        help="follow the uncompressed log files and judge new lines until the program is interrupted")
     _parser = parser
     cli_arg = vars( parser.parse_args(argv[1:]) )
     verbosity = cli_arg[VERBOSITY]
@@ -61,6 +70,8 @@ def main():
     file_based_config = parse_config_file(cli_arg[CONF_FILE])
     if verbosity is not None:
         file_based_config[VERBOSITY] = verbosity
+    if cli_arg[FOLLOW]:
+        file_based_config[FOLLOW] = True
     if logging.getLogger("root").isEnabledFor(logging.DEBUG): LOGGER.debug(pformat(file_based_config))
     validate_config(file_based_config)
     try:
@@ -89,33 +100,46 @@ def validate_config(config: Dict):
 def analyse_log_files(config: Dict):
     log_files = expand_log_files(config[LOG_FILES])
     conn = db_connection.get_connection(config[DATABASE_PATH])
+    writer = configure_database(config, conn)
     log_files = filter_processed_files(log_files, conn)
+    follow = config[FOLLOW] if FOLLOW in config else False
+    followed_files = [f for _, f in log_files if not log_parser.is_compressed(f)] if follow else []
+    log_files = [f for f in log_files if f[1] not in followed_files]
     LOGGER.info("Analyse %d file(s)", len(log_files))
+    judgment.set_resolver(construct_resolver(config, conn))
+    judgment.set_async_lookup(config[RESOLVER_WORKERS] if RESOLVER_WORKERS in config else 8)
     judge = construct_judgment(config)
     executor = execution.FileBasedUWFBlock(config[EXECUTION][0][RULES][SCRIPT])
     executor.begin_execute()
-    log_pattern = config[LOG_PATTERN]
+    fields = judge.required_fields()
+    LOGGER.info("Parse fields %s of log entries", sorted(fields))
     i = 0
+    log = None
+    batch_size = config[BATCH_SIZE] if BATCH_SIZE in config else 0
+    # entries of a batch are read before they are judged
+    progress = ReadProgress(conn) if batch_size > 0 else None
+    logs = iter_logs(log_files, config, fields, conn, progress)
     try:
-        for file_path in log_files:
-            LOGGER.info("Analyse file %s", file_path)
-            update_processed_file(file_path[0], file_path[1], conn)
-            logs = log_parser.parse_log_file(file_path[1], log_pattern)
-            for log in logs:
-                i += 1
-                LOGGER.debug("                       [%d] Process `%s'", i, log)
-                blocked, cause = judgment.is_ready_blocked(log, conn)
-                if blocked:
-                    LOGGER.info("IP %s is ready blocked", log.ip_str)
-                else:
-                    deny, cause = judge.should_deny(log, i)
-                    if deny:
-                        network = judgment.lookup_ip(log.ip_str)
-                        log.network = network
-                        executor.block(log, cause)
+        if batch_size > 0:
+            for entries in log_batch.iter_batches(logs, batch_size):
+                log = entries[-1]
+                judge_batch(judge, log_batch.LogBatch(entries, fields), i, executor, conn)
+                i += len(entries)
+                judgment.complete_lookups()
+                progress.save()
+        for log in logs:
+            i += 1
+            judge_log(judge, log, i, executor, conn)
+            judgment.complete_lookups()
+        if follow:
+            follow_log_files(followed_files, config, fields, judge, executor, conn, i)
     except KeyboardInterrupt:  # Will not work with python -m cProfile
         LOGGER.warning("Stop processing log files")
-        LOGGER.info("current log files: {}".format(file_path))
+        logs.close()
+        judgment.set_async_lookup(0)
+        judge.flush()
+        writer.commit()
+        LOGGER.info("current log files: {}".format(log.log_file if log else None))
         LOGGER.info("Write ready processed log entries to files")
         executor.end_execute()
         try:
@@ -123,10 +147,299 @@ def analyse_log_files(config: Dict):
         except Exception as ex:
             LOGGER.warning("Cannot close Sql DbConnection {}", ex)
         return 1
+    judgment.set_async_lookup(0)
+    judge.flush()
+    writer.commit()
     executor.end_execute()
     return 0
 
 
+def block_fn(executor: execution.AbstractIpBlockExecution, log: log_parser.LogEntry, cause: str):
+    """
+        returns a callback, which blocks the ip of the log entry when its network is found
+    """
+    def block(network: str):
+        log.network = network
+        executor.block(log, cause)
+    return block
+
+
+def judge_log(judge: judgment.AbstractIpJudgment, log: log_parser.LogEntry, entry_count: int,
+              executor: execution.AbstractIpBlockExecution, conn: sqlite3.Connection):
+    LOGGER.debug("                       [%d] Process `%s'", entry_count, log)
+    blocked, cause = judgment.is_ready_blocked(log, conn)
+    if blocked:
+        LOGGER.info("IP %s is ready blocked", log.ip_str)
+    else:
+        try:
+            deny, cause = judge.should_deny(log, entry_count)
+        except log_parser.CannotParseLogLineException as ex:
+            # e.g. the timestamp of the line, which is parsed when it is read
+            LOGGER.warning(ex)
+            return
+        if deny:
+            judgment.lookup_ip_async(log.ip, block_fn(executor, log, cause))
+
+
+def follow_log_files(log_files: List[str], config: Dict, fields: Set[str], judge: judgment.AbstractIpJudgment,
+                     executor: execution.AbstractIpBlockExecution, conn: sqlite3.Connection, entry_count: int = 0,
+                     polls: int = None):
+    """
+        follows the given log files (see `log_parser.LogFollower') and judges new lines as soon as they are written.
+        Blocks are emitted by `executor.flush' after each poll, the checkpoints of the files are moved forward after
+        the lines of a poll are judged and the state of the judgments is written to the database. The files are polled every `follow_interval' seconds (default 0.5) until
+        the program is interrupted.
+    :param polls: number of polls, None to poll until interrupted
+    """
+    interval = config[FOLLOW_INTERVAL] if FOLLOW_INTERVAL in config else 0.5
+    writer = db_connection.get_writer(conn)
+    follower = log_parser.LogFollower(log_files, config[LOG_PATTERN], fields,
+                                      lambda file_id: load_checkpoint(file_id, conn),
+                                      lambda file_id, file_path, position: save_checkpoint(file_id, file_path,
+                                                                                           position, conn))
+    LOGGER.info("Follow %d file(s)", len(log_files))
+    try:
+        while polls is None or polls > 0:
+            logs = follower.poll()
+            for log in logs:
+                entry_count += 1
+                judge_log(judge, log, entry_count, executor, conn)
+            if len(logs) > 0:
+                # networks of denied ips are needed to emit the blocks now
+                judgment.complete_lookups(wait=True)
+                executor.flush()
+                judge.flush()
+                writer.commit()
+                follower.checkpoint()
+            else:
+                time.sleep(interval)
+            if polls is not None:
+                polls -= 1
+    finally:
+        follower.close()
+
+
+def judge_batch(judge: judgment.AbstractIpJudgment, batch: log_batch.LogBatch, entry_count: int,
+                executor: execution.AbstractIpBlockExecution, conn: sqlite3.Connection):
+    """
+        judges a batch of log entries and blocks the ip of the first denied entry of each ip, which is not blocked yet.
+        Entries with unparsable timestamps are already dropped by `log_batch.LogBatch'; if another field cannot
+        be parsed, the batch is skipped.
+    """
+    blocked_ips = {log.ip for log in batch.entries if judgment.is_ready_blocked(log, conn)[0]}
+    try:
+        deny, causes = judge.should_deny_batch(batch, entry_count)
+    except log_parser.CannotParseLogLineException as ex:
+        LOGGER.warning("Skip batch of %d entries: %s", len(batch), ex)
+        return
+    for i in deny.nonzero()[0]:
+        log = batch.entries[i]
+        if log.ip not in blocked_ips:
+            blocked_ips.add(log.ip)
+            judgment.lookup_ip_async(log.ip, block_fn(executor, log, causes[i]))
+
+
+def configure_database(config: Dict, conn: sqlite3.Connection) -> db_connection.BatchWriter:
+    """
+        applies the configured pragmas to the connection and creates its writer, which commits every
+        `commit_entries' writes (default 1) or every `commit_seconds' seconds.
+    """
+    try:
+        db_connection.apply_pragmas(conn,
+                                    journal_mode=config[JOURNAL_MODE] if JOURNAL_MODE in config else None,
+                                    synchronous=config[SYNCHRONOUS] if SYNCHRONOUS in config else None,
+                                    cache_size=config[CACHE_SIZE] if CACHE_SIZE in config else None)
+    except ValueError as ex:
+        raise ParserConfigException(str(ex), ex)
+    commit_entries = config[COMMIT_ENTRIES] if COMMIT_ENTRIES in config else 1
+    commit_seconds = config[COMMIT_SECONDS] if COMMIT_SECONDS in config else None
+    return db_connection.configure_writer(conn, commit_entries, commit_seconds)
+
+
+class ReadProgress:
+    """
+        positions and processed marks of the files read by `iter_logs', which are stored by `save' when the read
+        entries are judged, e.g. after a batch of entries is judged.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        # path -> (identity, position) of files, which are read
+        self._positions: Dict[str, Tuple[str, List[int]]] = {}
+        # (content hash or None, path) of files, which are read completely
+        self._done: List[Tuple[str, str]] = []
+
+    def read(self, file_id: str, file_path: str, position: List[int]):
+        """
+            registers a file, its position is updated while it is read
+        """
+        self._positions[file_path] = (file_id, position)
+
+    def done(self, file_hash: str or None, file_path: str):
+        """
+            the file is read completely, it is marked as processed by `save'
+        """
+        self._done.append((file_hash, file_path))
+
+    def save(self):
+        for file_path, (file_id, position) in self._positions.items():
+            save_checkpoint(file_id, file_path, tuple(position), self.conn)
+        for file_hash, file_path in self._done:
+            update_processed_file(file_hash, file_path, self.conn)
+            self._positions.pop(file_path, None)
+        self._done = []
+
+
+def iter_logs(log_files: List[Tuple[str, str]], config: Dict, fields: Set[str], conn: sqlite3.Connection,
+              progress: ReadProgress = None):
+    """
+        parses the given files (pairs of content hash or None, and path) one after another, or concurrently
+        if `workers' > 1, and marks them as processed when all of their entries are read. Only the given attributes
+        of log entries are parsed.
+
+        Each file is parsed from its checkpoint on, the checkpoint is moved forward to the last judged line when the
+        file is parsed one after another, or to the end of all files when they are parsed concurrently.
+        If `progress' is given, checkpoints and processed marks are not stored, but given to `progress', so that
+        the caller stores them when the read entries are judged.
+
+        If `parse_cache_size' is configured, entries of files are read from the cache of parsed entries, and files
+        parsed from their first line on are put into the cache (see `log_cache.ParsedLogCache').
+        Otherwise compressed files without content hash are hashed while they are parsed, and marked as processed
+        when all of their entries are read.
+    """
+    log_pattern = config[LOG_PATTERN]
+    workers = config[WORKERS] if WORKERS in config else 1
+    split_size = config[SPLIT_SIZE] if SPLIT_SIZE in config else log_parser.SPLIT_SIZE
+    decompress_commands = config[DECOMPRESS_COMMAND] if DECOMPRESS_COMMAND in config else {}
+    cache = construct_parse_cache(config)
+    identities = {file_path: log_parser.file_identity(file_path) for _, file_path in log_files}
+    starts = {file_path: load_checkpoint(identity, conn) for file_path, identity in identities.items()}
+    # files, whose content hash is not computed by `filter_processed_files', are hashed to be found in the cache
+    cache_keys = {file_path: cache.key(file_hash or content_hash(file_path), log_pattern)
+                  for file_hash, file_path in log_files} if cache else {}
+    cached = {file_path: cache.load(key) for file_path, key in cache_keys.items()}
+    cached = {file_path: c for file_path, c in cached.items() if c is not None}
+    # files parsed from their first line on are put into the cache
+    store_keys = {file_path: key for file_path, key in cache_keys.items()
+                  if file_path not in cached and starts[file_path] == (0, 0)}
+    parse_fields = None if store_keys else fields
+    # the content of these files is hashed in the same pass as it is parsed
+    hash_files = {file_path for file_hash, file_path in log_files
+                  if file_hash is None and is_compressed_log(file_path)} if not cache else set()
+    if workers > 1:
+        LOGGER.info("Parse files with %d processes", workers)
+        positions = {}
+        hashes = {}
+        parsed = log_parser.iter_log_files([f[1] for f in log_files if f[1] not in cached], log_pattern, workers,
+                                           split_size, decompress_commands, parse_fields, starts, positions,
+                                           hash_files, hashes)
+        if store_keys:
+            parsed = cache.store(store_keys, parsed, positions)
+        if cached:
+            LOGGER.info("Read %d file(s) from cache", len(cached))
+            parsed = log_parser.merge_log_entries(
+                [c.iter_entries(file_path, starts[file_path], positions.setdefault(file_path, list(starts[file_path])))
+                 for file_path, c in cached.items()] + [parsed], log_parser.is_time_ordered(log_pattern))
+        yield from parsed
+        if progress is not None:
+            for file_path, position in positions.items():
+                progress.read(identities[file_path], file_path, position)
+            for file_hash, file_path in log_files:
+                if file_path in positions:
+                    progress.done(hashes.get(file_path, file_hash), file_path)
+            return
+        for file_path, position in positions.items():
+            save_checkpoint(identities[file_path], file_path, position, conn)
+        # files are marked as processed when their entries are judged
+        for file_hash, file_path in log_files:
+            # files, which cannot be read, have no position
+            if file_path in positions:
+                update_processed_file(hashes.get(file_path, file_hash), file_path, conn)
+    else:
+        for file_hash, file_path in log_files:
+            LOGGER.info("Analyse file %s", file_path)
+            hasher = hashlib.sha256() if file_path in hash_files else None
+            start = starts[file_path]
+            if start[1] > 0:
+                LOGGER.info("Skip %d processed lines of file %s", start[1], file_path)
+            position = list(start)
+            checkpoint = start
+            if progress is not None:
+                progress.read(identities[file_path], file_path, position)
+            if file_path in cached:
+                LOGGER.info("Read parsed entries of file %s from cache", file_path)
+                logs = cached[file_path].iter_entries(file_path, start, position)
+            else:
+                logs = log_parser.iter_log_file(file_path, log_pattern, decompress_commands,
+                                                None if file_path in store_keys else fields, start, position, hasher)
+                if file_path in store_keys:
+                    logs = cache.store({file_path: store_keys[file_path]}, logs, {file_path: position}, offsets=True)
+            try:
+                for log in logs:
+                    yield log
+                    # the entry is judged when the next one is requested
+                    checkpoint = tuple(position)
+                checkpoint = tuple(position)
+            except log_parser.CannotReadLogFileException as ex:
+                LOGGER.error("Cannot read file %s: %s", file_path, ex)
+                continue
+            finally:
+                logs.close()
+                if progress is None:
+                    save_checkpoint(identities[file_path], file_path, checkpoint, conn)
+            file_hash = file_hash if hasher is None else hasher.hexdigest()
+            if progress is not None:
+                progress.done(file_hash, file_path)
+            else:
+                update_processed_file(file_hash, file_path, conn)
+
+
+def construct_parse_cache(config: Dict) -> log_cache.ParsedLogCache or None:
+    """
+        creates the cache of parsed log entries in the directory `<database_path>.cache', if `parse_cache_size'
+        is configured
+    """
+    cache_size = config[PARSE_CACHE_SIZE] if PARSE_CACHE_SIZE in config else 0
+    if cache_size <= 0:
+        return None
+    try:
+        return log_cache.ParsedLogCache(config[DATABASE_PATH] + ".cache", cache_size)
+    except (ImportError, OSError) as ex:
+        LOGGER.warning("Cannot use cache of parsed log entries: %s", ex)
+        return None
+
+
+def load_checkpoint(file_id: str, conn: sqlite3.Connection) -> Tuple[int, int]:
+    """
+        reads the position (byte offset, line) after the last processed line of a file
+    :param file_id: identity of the file, see `log_parser.file_identity'
+    :return: byte offset and number of the line, (0, 0) if the file was not processed
+    """
+    if file_id is None:
+        return 0, 0
+    try:
+        row = conn.execute("SELECT byte_offset, line FROM log_file_checkpoint WHERE file_id = ?",
+                           (file_id,)).fetchone()
+    except sqlite3.OperationalError as ex:
+        LOGGER.warning("Cannot read table log_file_checkpoint %s", ex)
+        return 0, 0
+    return (row[0], row[1]) if row is not None else (0, 0)
+
+
+def save_checkpoint(file_id: str, file_path: str, position, conn: sqlite3.Connection):
+    """
+        stores the position (byte offset, line) after the last processed line of a file
+    """
+    if file_id is None:
+        return
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO log_file_checkpoint (file_id, path, byte_offset, line) "
+                         "VALUES (?, ?, ?, ?)", (file_id, file_path, position[0], position[1]))
+    except sqlite3.OperationalError as ex:
+        LOGGER.warning("Cannot update table log_file_checkpoint %s", ex)
+
+
 def expand_log_files(config_log_file: List[str]) -> List[str]:
     log_files = []
     for p in config_log_file:
@@ -143,24 +456,69 @@ def apache_access_log_file_chronological_decode(file_name):
     return -int(base_name[2]) if len(base_name) > 2 else 0
 
 
-def filter_processed_files(log_files:List[str], conn: sqlite3.Connection, key=apache_access_log_file_chronological_decode)->List[str]:
-    processed_files = []
+def filter_processed_files(log_files:List[str], conn: sqlite3.Connection, key=apache_access_log_file_chronological_decode)->List[Tuple[str, str]]:
+    """
+        removes processed files and sorts the other files chronologically. Only compressed files are marked as
+        processed (see `update_processed_file'), they are recognized by their fingerprint (see `file_fingerprint').
+        The content of a file is hashed only if its fingerprint is unknown, but its sample matches a processed file,
+        e.g. if the file was copied. In a database, which has processed files but no fingerprints (e.g. upgraded by
+        `find2deny-init-db'), all files are hashed once and the fingerprints of processed files are stored.
+    :return: list of (content hash, path), the content hash is None if it is not computed
+    """
+    processed_files = set()
+    fingerprints = {}
+    samples = set()
     try:
         with conn:
-            conn.row_factory = sqlite3.Row
-            c = conn.cursor()
-            for row in c.execute("SELECT content_hash, path FROM processed_log_file"):
-                processed_files.append(row[0])
+            for row in conn.execute("SELECT content_hash, path FROM processed_log_file"):
+                processed_files.add(row[0])
     except sqlite3.OperationalError:
         LOGGER.warning(
             "Cannot read table processed_files in database so use all expanded files")
-    log_files_hash = map(lambda f: (content_hash(f), f), log_files)
-    effective_log_files = sorted(filter(lambda hf: hf[0] not in processed_files, log_files_hash), key=lambda hf: key(hf[1]))
-    return list(effective_log_files)
-
-
-def update_processed_file(hash_content, file_path, conn: sqlite3.Connection):    # TODO: UNIT TEST
-    if file_path.endswith("gz"):
+    try:
+        with conn:
+            for fingerprint, sample, file_hash in conn.execute(
+                    "SELECT fingerprint, sample, content_hash FROM log_file_fingerprint"):
+                fingerprints[fingerprint] = file_hash
+                samples.add(sample)
+    except sqlite3.OperationalError:
+        LOGGER.warning("Cannot read table log_file_fingerprint in database so hash all processed files")
+        samples = None
+    # processed files without fingerprint can only be recognized by their content hash
+    migrate = samples is not None and len(fingerprints) == 0 and len(processed_files) > 0
+    hash_all = samples is None or migrate
+    effective_log_files = []
+    for file_path in log_files:
+        file_hash = None
+        if is_compressed_log(file_path):
+            fingerprint, sample = file_fingerprint(file_path)
+            file_hash = fingerprints.get(fingerprint)
+            if file_hash is None and (hash_all or sample in samples):
+                file_hash = content_hash(file_path)
+                if file_hash in processed_files and samples is not None:
+                    update_fingerprint(file_hash, file_path, conn)
+        if file_hash is None or file_hash not in processed_files:
+            effective_log_files.append((file_hash, file_path))
+    if migrate:
+        LOGGER.info("Fingerprints of processed files are stored")
+        try:
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO log_file_fingerprint (fingerprint, sample, content_hash) "
+                             "VALUES (?, NULL, NULL)", (FINGERPRINT_MIGRATED,))
+        except sqlite3.OperationalError as ex:
+            LOGGER.warning("Cannot update table log_file_fingerprint %s", ex)
+    return sorted(effective_log_files, key=lambda hf: key(hf[1]))
+
+
+def update_processed_file(hash_content, file_path, conn: sqlite3.Connection) -> str:    # TODO: UNIT TEST
+    """
+        marks a compressed file as processed and stores its fingerprint
+    :param hash_content: content hash of the file, computed if it is None
+    :return: the content hash
+    """
+    if is_compressed_log(file_path):
+        if hash_content is None:
+            hash_content = content_hash(file_path)
         try:
             with conn:
                 c = conn.cursor()
@@ -174,8 +532,61 @@ def update_processed_file(hash_content, file_path, conn: sqlite3.Connection):
                 )
         except sqlite3.OperationalError as ex:
             LOGGER.warning("Cannot update table processed_files %s", ex)
+        update_fingerprint(hash_content, file_path, conn)
     else:
         LOGGER.info("File %s is not compressed, so not mark it as processed", file_path)
+    return hash_content
+
+
+_COMPRESSED_SUFFIXES = (".gz", ".bz2", ".xz", ".zst")
+
+
+def is_compressed_log(file_path) -> bool:
+    """
+        compressed log files are rotated, they do not change any more and are processed only once. The compression
+        is detected by `log_parser.is_compressed', the suffix of the file is used if it cannot be read.
+    """
+    try:
+        return log_parser.is_compressed(file_path)
+    except OSError:
+        return file_path.endswith(_COMPRESSED_SUFFIXES)
+
+
+def update_fingerprint(hash_content, file_path, conn: sqlite3.Connection):
+    try:
+        fingerprint, sample = file_fingerprint(file_path)
+    except OSError:
+        return
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO log_file_fingerprint (fingerprint, sample, content_hash) "
+                         "VALUES (?, ?, ?)", (fingerprint, sample, hash_content))
+    except sqlite3.OperationalError as ex:
+        LOGGER.warning("Cannot update table log_file_fingerprint %s", ex)
+
+
+FINGERPRINT_SAMPLE_SIZE = 4096
+# fingerprint of a row, which records that the fingerprints of processed files are stored once
+FINGERPRINT_MIGRATED = "migrated"
+
+
+def file_fingerprint(file_path) -> Tuple[str, str]:
+    """
+        identifies a file without reading all of its content. The sample is the SHA-256 hash of the size, the first
+        and the last `FINGERPRINT_SAMPLE_SIZE' bytes of the file, the fingerprint hashes the sample with device,
+        inode and modification time of the file.
+    :return: (fingerprint, sample) as hex digests
+    """
+    stat = os.stat(file_path)
+    sample = hashlib.sha256(str(stat.st_size).encode())
+    with open(file_path, 'rb') as f:
+        sample.update(f.read(FINGERPRINT_SAMPLE_SIZE))
+        if stat.st_size > FINGERPRINT_SAMPLE_SIZE:
+            f.seek(max(FINGERPRINT_SAMPLE_SIZE, stat.st_size - FINGERPRINT_SAMPLE_SIZE))
+            sample.update(f.read(FINGERPRINT_SAMPLE_SIZE))
+    sample = sample.hexdigest()
+    fingerprint = hashlib.sha256(f"{stat.st_dev}:{stat.st_ino}:{stat.st_mtime_ns}:{sample}".encode()).hexdigest()
+    return fingerprint, sample
 
 
 def content_hash(file_path):
@@ -197,6 +608,36 @@ def construct_judgment(config) -> judgment.AbstractIpJudgment:
     return judgment.ChainedIpJudgment(db_connection.get_connection(config[DATABASE_PATH]), list_of_judgments, config[WHITE_LIST])
 
 
+def construct_resolver(config, conn: sqlite3.Connection = None) -> resolver.AbstractResolver:
+    ip_resolver = resolver_by_name(config)
+    ttl = config[RESOLVER_CACHE_TTL] if RESOLVER_CACHE_TTL in config else 30 * 24 * 3600
+    if conn is None or ttl <= 0:
+        return ip_resolver
+    try:
+        return resolver.CachedResolver(ip_resolver, conn, ttl)
+    except resolver.ResolverException as ex:
+        LOGGER.warning("Cannot cache resolved networks: %s", ex.errors)
+        return ip_resolver
+
+
+def resolver_by_name(config) -> resolver.AbstractResolver:
+    name = config[RESOLVER] if RESOLVER in config else "rdap"
+    if name == "rdap":
+        return resolver.RdapResolver()
+    elif name == "ip2asn":
+        if IP2ASN_FILE not in config:
+            raise ParserConfigException(f"A file ({IP2ASN_FILE}) must be configured if resolver {name} is used")
+        try:
+            ip2asn = resolver.Ip2AsnResolver(config[IP2ASN_FILE])
+        except resolver.ResolverException as ex:
+            raise ParserConfigException(ex.message, ex)
+        if RDAP_FALLBACK in config and config[RDAP_FALLBACK]:
+            return resolver.ChainedResolver([ip2asn, resolver.RdapResolver()])
+        return ip2asn
+    else:
+        raise ParserConfigException(f"Unknown resolver {name}")
+
+
 def judgment_by_name(judge, config):
     name = judge['name']
     rules = judge[RULES]
@@ -212,12 +653,21 @@ def judgment_by_name(judge, config):
             conn = db_connection.get_connection(database_path)
             max_request = rules[MAX_REQUEST] if MAX_REQUEST in rules else 500
             interval = rules[INTERVAL_SECONDS] if INTERVAL_SECONDS in rules else 60
-            return judgment.TimeBasedIpJudgment(conn, max_request, interval)
+            follow = config[FOLLOW] if FOLLOW in config else False
+            # followed log files are judged in memory, `sqlite' needs a query for each entry
+            engine = rules[ENGINE] if ENGINE in rules else ("memory" if follow else "sqlite")
+            if engine == "memory":
+                return judgment.SlidingWindowIpJudgment(conn, max_request, interval)
+            elif engine == "sqlite":
+                return judgment.TimeBasedIpJudgment(conn, max_request, interval)
+            else:
+                raise ParserConfigException(f"Unknown engine {engine} of Judgment {name}")
         else:
             _parser.error(f"A SQLite database ({DATABASE_PATH}) must be configured in global section if Judgment {name} is used")
     elif name == "user-agent-based-judgment":
         blacklist_agent = rules[BLACKLIST_AGENT] if BLACKLIST_AGENT in rules else []
-        return judgment.UserAgentBasedIpJudgment(blacklist_agent)
+        blacklist_agent_regex = rules[BLACKLIST_AGENT_REGEX] if BLACKLIST_AGENT_REGEX in rules else []
+        return judgment.UserAgentBasedIpJudgment(blacklist_agent, blacklist_agent_regex)
     else:
         raise ParserConfigException(f"Unknown judgment {name}")
 
@@ -7,12 +7,43 @@ from typing import Dict
 VERBOSITY = "verbosity"
 LOG_LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
 CONF_FILE = "config_file"
+# follow the uncompressed log files and judge lines as soon as they are written, until the program is interrupted
+FOLLOW = "follow"
+# seconds to wait for new lines of followed log files
+FOLLOW_INTERVAL = "follow_interval"
 
 
 # Apache Log file to be analysed
 LOG_FILES = "log_files"
 LOG_PATTERN = "log_pattern"
 DATABASE_PATH = "database_path"
+# number of processes to parse log files
+WORKERS = "workers"
+# uncompressed log files larger than this size (in bytes) are split to be parsed by several processes
+SPLIT_SIZE = "split_size"
+# number of log entries judged together on columns by NumPy, 0 (default) to judge entry by entry
+BATCH_SIZE = "batch_size"
+# table of compression format (gzip, bz2, xz, zstd) -> command to decompress log files in a separate process
+DECOMPRESS_COMMAND = "decompress_command"
+# parsed log entries are cached in directory `<database_path>.cache' up to this size in bytes, 0 (default) disables it
+PARSE_CACHE_SIZE = "parse_cache_size"
+# SQLite pragmas journal_mode (e.g. WAL), synchronous (e.g. NORMAL) and cache_size
+JOURNAL_MODE = "journal_mode"
+SYNCHRONOUS = "synchronous"
+CACHE_SIZE = "cache_size"
+# commit writes to database every this number of writes or this number of seconds
+COMMIT_ENTRIES = "commit_entries"
+COMMIT_SECONDS = "commit_seconds"
+
+# how networks of IPs are found: "rdap" (default) or "ip2asn" for a local data set in file ip2asn_file
+RESOLVER = "resolver"
+IP2ASN_FILE = "ip2asn_file"
+# with resolver "ip2asn", look up IPs not found in the data set by RDAP
+RDAP_FALLBACK = "rdap_fallback"
+# resolved networks are stored in database for this number of seconds, 0 disables the cache
+RESOLVER_CACHE_TTL = "resolver_cache_ttl"
+# number of threads to look up networks in background, 0 to look up synchronously
+RESOLVER_WORKERS = "resolver_workers"
 
 # Whitelist
 WHITE_LIST = "white_list"
@@ -26,10 +57,13 @@ BOT_REQUEST = "bot_request"
 
 # Configuration keys for user-agent-based-judgment
 BLACKLIST_AGENT = 'blacklist_agent'
+BLACKLIST_AGENT_REGEX = 'blacklist_agent_regex'
 
 # Configuration keys for time based judgment
 MAX_REQUEST = "max_request"
 INTERVAL_SECONDS = "interval_seconds"
+# "sqlite" (default, "memory" if log files are followed) or "memory" to count accesses in memory and write them to database in batches
+ENGINE = "engine"
 
 # execute
 EXECUTION = "execution"
@@ -2,9 +2,17 @@
 
 
 import sqlite3
+import time
+import logging
+from typing import Dict, List, Tuple
+
+LOGGER = logging.getLogger(__name__)
 
 conn = None
 
+JOURNAL_MODES = ["DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"]
+SYNCHRONOUS_MODES = ["OFF", "NORMAL", "FULL", "EXTRA"]
+
 
 def get_connection(sqlite_db_path) -> sqlite3.Connection:
     global conn
@@ -13,3 +21,100 @@ def get_connection(sqlite_db_path) -> sqlite3.Connection:
         # conn.execute("PRAGMA journal_mode=WAL;")
     return conn
 
+
+def apply_pragmas(connection: sqlite3.Connection, journal_mode: str = None, synchronous: str = None,
+                  cache_size: int = None):
+    """
+        sets pragmas of a connection, pragmas given as None are not changed.
+    :param connection: connection to a SQLite database
+    :param journal_mode: one of `JOURNAL_MODES', e.g. WAL
+    :param synchronous: one of `SYNCHRONOUS_MODES', e.g. NORMAL
+    :param cache_size: number of pages or, if negative, size in KiB of the page cache
+    :raise ValueError: if a value is not valid
+    """
+    if journal_mode is not None:
+        if journal_mode.upper() not in JOURNAL_MODES:
+            raise ValueError(f"journal_mode must be one of {JOURNAL_MODES}, not {journal_mode}")
+        mode = connection.execute(f"PRAGMA journal_mode={journal_mode.upper()}").fetchone()
+        LOGGER.info("SQLite journal_mode: %s", mode[0] if mode else None)
+    if synchronous is not None:
+        if str(synchronous).upper() not in SYNCHRONOUS_MODES:
+            raise ValueError(f"synchronous must be one of {SYNCHRONOUS_MODES}, not {synchronous}")
+        connection.execute(f"PRAGMA synchronous={str(synchronous).upper()}")
+    if cache_size is not None:
+        connection.execute(f"PRAGMA cache_size={int(cache_size)}")
+
+
+class BatchWriter:
+    """
+        writes to a SQLite database in transactions, which are committed every `commit_entries' writes or
+        every `commit_seconds' seconds, instead of one transaction per write.
+
+        Statements given to `execute' are executed at once in the current transaction, so they are visible
+        to queries on the same connection. Statements given to `buffer' are collected and executed by
+        `executemany' when the transaction is committed, they must not be read back before.
+    """
+    def __init__(self, connection: sqlite3.Connection, commit_entries: int = 1, commit_seconds: float = None):
+        self.conn = connection
+        self.commit_entries = commit_entries
+        self.commit_seconds = commit_seconds
+        self._buffers: Dict[str, List[Tuple]] = {}
+        self._count = 0
+        self._last_commit = time.monotonic()
+
+    def execute(self, sql: str, params: Tuple = ()) -> sqlite3.Cursor:
+        cursor = self.conn.execute(sql, params)
+        self._written(1)
+        return cursor
+
+    def executemany(self, sql: str, rows: List[Tuple]):
+        self.conn.executemany(sql, rows)
+        self._written(len(rows))
+
+    def buffer(self, sql: str, params: Tuple):
+        self._buffers.setdefault(sql, []).append(params)
+        self._written(1)
+
+    def _written(self, count: int):
+        self._count += count
+        if self._count >= self.commit_entries or \
+                (self.commit_seconds is not None and time.monotonic() - self._last_commit >= self.commit_seconds):
+            self.commit()
+
+    def commit(self):
+        """
+            executes the buffered statements and commits the current transaction
+        """
+        try:
+            for sql, rows in self._buffers.items():
+                self.conn.executemany(sql, rows)
+            self.conn.commit()
+        finally:
+            self._buffers = {}
+            self._count = 0
+            self._last_commit = time.monotonic()
+
+
+# connection -> writer of the connection
+_writers: Dict[sqlite3.Connection, BatchWriter] = {}
+
+
+def configure_writer(connection: sqlite3.Connection, commit_entries: int = 1, commit_seconds: float = None) \
+        -> BatchWriter:
+    """
+        creates the writer of a connection, writes buffered by an old writer are committed.
+    """
+    if connection in _writers:
+        _writers[connection].commit()
+    writer = _writers[connection] = BatchWriter(connection, commit_entries, commit_seconds)
+    return writer
+
+
+def get_writer(connection: sqlite3.Connection) -> BatchWriter:
+    """
+        returns the writer of a connection, by default every write is committed at once.
+    """
+    writer = _writers.get(connection)
+    if writer is None:
+        writer = _writers[connection] = BatchWriter(connection)
+    return writer
@@ -18,6 +18,12 @@ class AbstractIpBlockExecution(ABC):
     def end_execute(self):
         pass
 
+    def flush(self):
+        """
+            emits the blocks so far, e.g. while log files are followed
+        """
+        pass
+
 
 class FileBasedUWFBlock(AbstractIpBlockExecution):
     """
@@ -27,9 +33,11 @@ class FileBasedUWFBlock(AbstractIpBlockExecution):
     def __init__(self, destinate_path: str):
         self.__destinate_path = destinate_path
         self.__blocked_item = []
+        self.__written_item = 0
 
     def begin_execute(self):
         self.__blocked_item = []
+        self.__written_item = 0
         pass
 
     def block(self, log: LogEntry, cause: str = None):
@@ -46,8 +54,16 @@ class FileBasedUWFBlock(AbstractIpBlockExecution):
         pass
 
     def end_execute(self):
+        self.__write()
+        logging.info("Block %d IPs", len(self.__blocked_item))
+        pass
+
+    def flush(self):
+        if len(self.__blocked_item) != self.__written_item:
+            self.__write()
+
+    def __write(self):
         with open(self.__destinate_path, 'w') as f:
             f.write("#!/bin/bash\n")
             f.writelines(self.__blocked_item)
-        logging.info("Block %d IPs", len(self.__blocked_item))
-        pass
\ No newline at end of file
+        self.__written_item = len(self.__blocked_item)
\ No newline at end of file
@@ -2,23 +2,23 @@
 
 import functools
 import re
-import urllib
-import urllib.error
 from abc import ABC, abstractmethod
-from typing import List
+from collections import deque
+from typing import Callable, Deque, Dict, List, Set
 
-import ipaddress
 import pendulum
 from datetime import datetime
 import sqlite3
 import logging
 
-from ipwhois import IPWhois, exceptions, ASNRegistryError
 from importlib_resources import read_text
 
 from . log_parser import LogEntry, DATETIME_FORMAT_PATTERN
 from . import log_parser
 from . import db_connection
+from . log_batch import LogBatch, map_distinct, np, sliding_window_deny
+from . network_index import NetworkIndex, parse_network
+from . resolver import AbstractResolver, AsyncResolver, RdapResolver
 
 
 LOGGER = logging.getLogger(__name__)
@@ -29,7 +29,12 @@ def init_database(sqlite_db_path: str):
     conn = db_connection.get_connection(sqlite_db_path)
     try:
         with conn:
+            ipv4_tables = _rename_ipv4_tables(conn)
             conn.executescript(sql_script)
+            for table in ipv4_tables:
+                LOGGER.info("Migrate table %s to store IPv6", table)
+                conn.execute(f"INSERT INTO {table} SELECT * FROM {table}_ipv4")
+                conn.execute(f"DROP TABLE {table}_ipv4")
             conn.commit()
     except sqlite3.OperationalError as ex:
         LOGGER.error(ex)
@@ -37,35 +42,82 @@ def init_database(sqlite_db_path: str):
     pass
 
 
-def is_ready_blocked(log_entry: LogEntry, conn: sqlite3.Connection) -> (bool, str):
-    @functools.lru_cache(maxsize=2024)
-    def __cached_query(ip: int):
+def _rename_ipv4_tables(conn: sqlite3.Connection) -> List[str]:
+    """
+        databases created by older versions store ips in `INTEGER' columns, which cannot hold IPv6 addresses.
+        Such tables are renamed to `<table>_ipv4', so that they can be copied into the tables of the current schema.
+    :return: list of renamed tables
+    """
+    renamed = []
+    for table in ('block_network', 'log_ip'):
+        columns = conn.execute(f"PRAGMA table_info({table})").fetchall()
+        if any(column[1] == 'ip' and column[2].upper() == 'INTEGER' for column in columns):
+            conn.execute(f"ALTER TABLE {table} RENAME TO {table}_ipv4")
+            renamed.append(table)
+    return renamed
+
+
+# connection -> (ip as integer -> cause of block) of all ips in table block_network
+_blocked_ips: Dict[sqlite3.Connection, Dict[int, str]] = {}
+
+
+def _load_blocked_ips(conn: sqlite3.Connection) -> Dict[int, str]:
+    """
+        reads the table block_network once per connection, later changes are made by `update_deny'.
+    """
+    blocked_ips = _blocked_ips.get(conn)
+    if blocked_ips is None:
         try:
             with conn:
-                c = conn.cursor()
-                c.execute("SELECT COUNT(*), cause_of_block cause_of_block FROM block_network WHERE ip = ?", (ip,))
-                row = c.fetchone()
-                ip_count = row[0]
-                cause = row[1]
-                return (ip_count == 1), cause
+                rows = conn.execute("SELECT ip, cause_of_block FROM block_network").fetchall()
         except sqlite3.OperationalError as ex:
             raise JudgmentException("Access to Sqlite Db caused error; Diagnose: use `find2deny-init-db' to create a Database.", errors=ex)
-    return __cached_query(log_entry.ip)
+        blocked_ips = _blocked_ips[conn] = {log_parser.db_to_ip(ip): cause for ip, cause in rows}
+        LOGGER.info("Loaded %d blocked ip", len(blocked_ips))
+    return blocked_ips
+
+
+def is_ready_blocked(log_entry: LogEntry, conn: sqlite3.Connection) -> (bool, str):
+    blocked_ips = _load_blocked_ips(conn)
+    if log_entry.ip in blocked_ips:
+        return True, blocked_ips[log_entry.ip]
+    return False, None
 
 
-def update_deny(ip_network: str, log_entry: LogEntry, judge:str, cause_of_block:str, sqlite_db_path: str):
+def update_deny(ip_network: str, log_entry: LogEntry, judge:str, cause_of_block:str,
+                sqlite_db_path: str or sqlite3.Connection):
     insert_cmd = "INSERT OR IGNORE INTO block_network (ip, ip_network, block_since, judge, cause_of_block) VALUES (?, ?, ?, ?, ?)"
+    conn = sqlite_db_path if isinstance(sqlite_db_path, sqlite3.Connection) \
+        else db_connection.get_connection(sqlite_db_path)
     try:
-        with db_connection.get_connection(sqlite_db_path) as conn:
-            conn.execute(insert_cmd, (log_entry.ip, ip_network, local_datetime(), judge, cause_of_block))
+        # the table is read only once by `_load_blocked_ips', so inserts can be buffered
+        db_connection.get_writer(conn).buffer(
+            insert_cmd, (log_parser.ip_to_db(log_entry.ip), ip_network, local_datetime(), judge, cause_of_block))
     except sqlite3.OperationalError as ex:
         raise JudgmentException("Access to Sqlite Db caused error; Diagnose: use `find2deny-init-db' to create a Database.",errors=ex)
+    if conn in _blocked_ips:
+        _blocked_ips[conn].setdefault(log_entry.ip, cause_of_block)
     LOGGER.info("(%s) add %s to blocked network", log_entry.ip_str, ip_network)
     pass
 
 
 class AbstractIpJudgment(ABC):
 
+    def required_fields(self) -> Set[str]:
+        """
+            names of the attributes of `LogEntry', which this judgment reads. Other attributes are not parsed
+            from log files. The ip of a log entry is always parsed.
+        :return: set of attribute names, by default all attributes
+        """
+        return set(log_parser.LOG_ENTRY_FIELDS)
+
+    def flush(self):
+        """
+            writes state, which is kept in memory, to the database. It is called periodically and after the last
+            log entry is processed.
+        """
+        pass
+
     @abstractmethod
     def should_deny(self, log_entry: LogEntry, entry_count: int=0) -> (bool, str):
         """
@@ -76,18 +128,41 @@ class AbstractIpJudgment(ABC):
         """
         pass
 
+    def should_deny_batch(self, batch: LogBatch, entry_count: int = 0) -> tuple:
+        """
+            checks the log entries of a batch, by default one after another by `should_deny'. Judgments override it
+            by operations on the columns of the batch.
+        :param batch: log entries, the columns of `required_fields' are filled
+        :param entry_count: how many entries are processed before the batch
+        :return: boolean array, which is True for entries whose ip should be blocked, and list of causes
+        """
+        deny = np.zeros(len(batch), dtype=bool)
+        causes = [None] * len(batch)
+        for i, log_entry in enumerate(batch.entries):
+            deny[i], causes[i] = self.should_deny(log_entry, entry_count + i)
+        return deny, causes
+
 
 class ChainedIpJudgment(AbstractIpJudgment):
 
     def __init__(self, conn:sqlite3.Connection, chains: List[AbstractIpJudgment], white_list: List[str] = None):
-        self.__white_list:List[str] = white_list or []
+        self.__white_list: WhiteList = WhiteList(white_list or [])
         self.__judgment = chains
         # self.__log_db_path = log_db_path
         self.conn = conn # db_connection.get_connection(self.__log_db_path)
 
+    def required_fields(self) -> Set[str]:
+        fields = set()
+        for judgment in self.__judgment:
+            fields |= judgment.required_fields()
+        return fields
+
+    def flush(self):
+        for judgment in self.__judgment:
+            judgment.flush()
+
     def should_deny(self, log_entry: LogEntry, entry_count=0) -> bool:
-        white_list_fn = make_ip_check_fn(log_entry.ip_str)
-        white_lister = next((item for item in self.__white_list if white_list_fn(item)), None)
+        white_lister = self.__white_list.match(log_entry.ip)
         if white_lister:
             return False, "White listed by {}".format(white_lister)
         else:
@@ -97,56 +172,196 @@ class ChainedIpJudgment(AbstractIpJudgment):
             for judgment in self.__judgment:
                 deny, cause = judgment.should_deny(log_entry, entry_count)
                 if deny:
-                    ip_network = lookup_ip(log_entry.ip)
-                    update_deny(ip_network, log_entry,judgment.__class__.__name__, cause, self.conn)
+                    # the ip is blocked at once, it is written to database when its network is found
+                    _load_blocked_ips(self.conn).setdefault(log_entry.ip, cause)
+                    judge = judgment.__class__.__name__
+                    lookup_ip_async(log_entry.ip,
+                                    lambda ip_network: update_deny(ip_network, log_entry, judge, cause, self.conn))
                     return True, cause
             return False, None
 
+    def should_deny_batch(self, batch: LogBatch, entry_count: int = 0) -> tuple:
+        """
+            judges a batch like `should_deny' does entry by entry: each judgment gets the entries, which are neither
+            white listed nor denied by a judgment before. The first denied entry of an ip blocks the ip, all
+            following entries of the ip are denied as already blocked.
+        """
+        n = len(batch)
+        blocked_ips = _load_blocked_ips(self.conn)
+        white = np.array([self.__white_list.match(ip) is not None for ip in batch.ips], dtype=bool)[batch.ip_codes]
+        ready = np.array([ip in blocked_ips for ip in batch.ips], dtype=bool)[batch.ip_codes] & ~white
+        deny = ready.copy()
+        causes = [blocked_ips[batch.entries[i].ip] if ready[i] else None for i in range(n)]
+        judges = [None] * n
+        remaining = ~white & ~ready
+        for judgment in self.__judgment:
+            rows = np.flatnonzero(remaining)
+            if len(rows) == 0:
+                break
+            denied, denied_causes = judgment.should_deny_batch(batch.select(rows), entry_count)
+            for row, cause in zip(rows[denied], (c for d, c in zip(denied, denied_causes) if d)):
+                causes[row] = cause
+                judges[row] = judgment.__class__.__name__
+            deny[rows[denied]] = True
+            remaining[rows[denied]] = False
+        new_rows = np.flatnonzero(deny & ~ready)
+        if len(new_rows) > 0:
+            codes, first = np.unique(batch.ip_codes[new_rows], return_index=True)
+            first_row = np.full(len(batch.ips), n)
+            first_row[codes] = new_rows[first]
+            for row in new_rows[first]:
+                log_entry, judge, cause = batch.entries[row], judges[row], causes[row]
+                blocked_ips.setdefault(log_entry.ip, cause)
+                lookup_ip_async(log_entry.ip,
+                                lambda ip_network, log_entry=log_entry, judge=judge, cause=cause:
+                                update_deny(ip_network, log_entry, judge, cause, self.conn))
+            after_block = (np.arange(n) > first_row[batch.ip_codes]) & ~deny & ~white
+            for row in np.flatnonzero(after_block):
+                causes[row] = causes[first_row[batch.ip_codes[row]]]
+            deny |= after_block
+        return deny, causes
+
+
+class WhiteList:
+    """
+        white listed IPs and networks, given as single IPs, networks in CIDR notation or regular expressions of
+        IPs. IPs and networks are stored in a `NetworkIndex', regular expressions are compiled once. The entry
+        matching an IP is cached.
+    """
+    def __init__(self, white_list: List[str], cache_size: int = 65536):
+        self._white_list = white_list
+        self._networks = NetworkIndex()
+        self._patterns = []
+        for entry in white_list:
+            network = parse_network(entry)
+            if network is not None:
+                self._networks.add(network, entry)
+            else:
+                try:
+                    self._patterns.append((entry, re.compile(entry)))
+                except re.error as ex:
+                    raise JudgmentException(f"White list entry {entry} is neither a network nor a regular expression", ex)
+        self.match = functools.lru_cache(maxsize=cache_size)(self._match)
+
+    def _match(self, ip: int) -> str or None:
+        """
+            finds the entry of the white list, which matches the given ip
+        :param ip: ip as integer
+        :return: the matched entry or None
+        """
+        entry = self._networks.lookup(ip)
+        if entry is not None:
+            return entry
+        if len(self._patterns) > 0:
+            ip_str = log_parser.int_to_ip(ip)
+            return next((entry for entry, pattern in self._patterns if pattern.match(ip_str)), None)
+        return None
+
+    def __len__(self):
+        return len(self._white_list)
+
 
 def make_ip_check_fn(ip):
-    return lambda white_list: \
-        white_list == ip or is_ip_matched_network(ip, white_list) or is_ip_in_white_listed_network(ip, white_list)
+    """
+        returns a function, which checks whether the given ip matches an entry of a white list, see `WhiteList'
+    :param ip: ip as string
+    """
+    ip_int = log_parser.ip_to_int(ip)
+    return lambda white_list: _white_list_of(white_list).match(ip_int) is not None
 
 
-def is_ip_in_white_listed_network(ip, white_list_network):
-    try:
-        return ipaddress.ip_address(ip) in ipaddress.ip_network(white_list_network)
-    except Exception:
-        return False
+@functools.lru_cache(maxsize=256)
+def _white_list_of(entry: str) -> WhiteList:
+    return WhiteList([entry])
+
+
+def build_path_trie(paths) -> dict:
+    """
+        builds a prefix trie of the given paths. A node is a dict of characters to child nodes, a node where a path
+        ends holds the path and its position in `paths' under the key `None'.
+    :param paths: iterable of paths
+    :return: root node of the trie
+    """
+    root = {}
+    for idx, path in enumerate(paths):
+        node = root
+        for c in path:
+            node = node.setdefault(c, {})
+        if None not in node:
+            node[None] = (idx, path)
+    return root
 
 
-def is_ip_matched_network(ip, white_list_ip_reg):
-    pattern = re.compile(white_list_ip_reg)
-    return pattern.match(ip)
+def match_path_trie(trie: dict, request_path: str) -> str or None:
+    """
+        finds the path in a trie, which is a prefix of `request_path'. If more than one path is a prefix of
+        `request_path', the path which comes first in the list given to `build_path_trie' is returned.
+    :param trie: root node built by `build_path_trie'
+    :param request_path: path to be checked
+    :return: the matched path or None
+    """
+    matched = trie.get(None)
+    node = trie
+    for c in request_path:
+        node = node.get(c)
+        if node is None:
+            break
+        candidate = node.get(None)
+        if candidate is not None and (matched is None or candidate[0] < matched[0]):
+            matched = candidate
+    return matched[1] if matched is not None else None
 
 
 class PathBasedIpJudgment(AbstractIpJudgment):
     """
-
+        deny an ip in a log entry if the requested path starts with one of given paths. The paths are
+        stored in a prefix trie, so that the time to check a request does not depend on the number of paths.
     """
-    def __init__(self, bot_path: set = None):
+    def __init__(self, bot_path: set = None, cache_size: int = 4096):
         self._bot_path = bot_path if bot_path is not None else {}
+        trie = build_path_trie(self._bot_path)
+        # scanners request the same paths again and again
+        self._match_path = functools.lru_cache(maxsize=cache_size)(lambda path: match_path_trie(trie, path))
         pass
 
+    def required_fields(self) -> Set[str]:
+        return {'request'}
+
     def should_deny(self, log_entry: LogEntry, entry_count: int = 0) -> (bool, str):
+        match = self._match_request(log_entry.request)
+        if not match[0]:
+            return False, None
+        return True, self._cause(log_entry, match)
+
+    def should_deny_batch(self, batch: LogBatch, entry_count: int = 0) -> tuple:
+        matches = map_distinct(batch.request, self._match_request)
+        deny = np.fromiter((match[0] for match in matches), dtype=bool, count=len(matches))
+        causes = [None] * len(batch)
+        for i in np.flatnonzero(deny):
+            causes[i] = self._cause(batch.entries[i], matches[i])
+        return deny, causes
+
+    def _match_request(self, request: str) -> (bool, str, str):
+        """
+        :return: (blocked, requested path, matched resource), the path is None if the request is not conform to HTTP
+        """
         try:
-            request_path = log_entry.request.split(" ")[1]
-            request_resource = next((r for r in self._bot_path if request_path.startswith(r)), None)
-            blocked = request_resource is not None
-            cause = None
-            if blocked:
-                cause = "{} tried to access {} which matches non-existing resource {}".format(
-                         log_entry.ip_str, request_path, request_resource)
-                LOGGER.info(cause)
-            return blocked, cause
+            request_path = request.split(" ")[1]
         except IndexError:
-            if log_entry.request == "-":
-                return False, None
-            else:
-                cause = "{}-s  request >>{}<< is not conform to HTTP".format(
-                             log_entry.ip_str, log_entry.request)
-                LOGGER.info(cause)
-                return True, cause
+            return request != "-", None, None
+        request_resource = self._match_path(request_path)
+        return request_resource is not None, request_path, request_resource
+
+    @staticmethod
+    def _cause(log_entry: LogEntry, match: tuple) -> str:
+        _, request_path, request_resource = match
+        if request_path is None:
+            cause = "{}-s  request >>{}<< is not conform to HTTP".format(log_entry.ip_str, log_entry.request)
+        else:
+            cause = "{} tried to access {} which matches non-existing resource {}".format(
+                     log_entry.ip_str, request_path, request_resource)
+        LOGGER.info(cause)
+        return cause
 
     def __str__(self):
         return "PathBasedIpJudgment/bot_path:{}".format(self._bot_path)
@@ -165,6 +380,23 @@ class TimeBasedIpJudgment(AbstractIpJudgment):
         self._sqlite_db_path = sqlite_db_path
         self.conn = db_connection.get_connection(self._sqlite_db_path)
         self.count_ip = 0
+        self._batch_judgment: SlidingWindowIpJudgment = None
+
+    def required_fields(self) -> Set[str]:
+        return {'time'}
+
+    def flush(self):
+        if self._batch_judgment is not None:
+            self._batch_judgment.flush()
+
+    def should_deny_batch(self, batch: LogBatch, entry_count: int = 0) -> tuple:
+        """
+            the access rate of an ip depends on the decision on each entry before, so batches are judged by a sliding
+            window like `SlidingWindowIpJudgment' does, which also writes the table `log_ip'.
+        """
+        if self._batch_judgment is None:
+            self._batch_judgment = SlidingWindowIpJudgment(self.conn, self.allow_access, self.interval)
+        return self._batch_judgment.should_deny_batch(batch, entry_count)
 
     def __del__(self):
         pass
@@ -177,40 +409,16 @@ class TimeBasedIpJudgment(AbstractIpJudgment):
         :return:
         """
         self.count_ip = entry_count
-        if not self._ready_processed(log_entry):
-            return self._make_block_ip_decision(log_entry)
-        else:
-            return self._lookup_decision_cache(log_entry)
-
-    def _ready_processed(self, log_entry: LogEntry) -> bool:
-        sql_cmd = "SELECT count(*) FROM processed_log_ip WHERE ip = ? AND line = ? AND log_file = ?"
-        try:
-            with self.conn as conn:
-                conn.row_factory = sqlite3.Row
-                c = conn.cursor()
-                c.execute(sql_cmd, (log_entry.ip, log_entry.line, log_entry.log_file))
-                row = c.fetchone()
-            if not row or row is None:
-                return False
-            else:
-                LOGGER.debug("found %d processed ip in database log for entry %s ", row[0], log_entry)
-                ip_count = row[0]
-                return ip_count == 1
-        except sqlite3.OperationalError:
-            LOGGER.warning("Cannot make connection to database file %s", self._sqlite_db_path)
-            return False
+        return self._make_block_ip_decision(log_entry)
 
     def _make_block_ip_decision(self, log_entry: LogEntry) -> (bool, str):
-        ip_int = log_entry.ip
+        ip_db = log_parser.ip_to_db(log_entry.ip)
         try:
-            with self.conn as conn:
-                conn.row_factory = sqlite3.Row
-                c = conn.cursor()
-                c.execute("INSERT INTO processed_log_ip (ip, line, log_file) VALUES (?, ?, ?)",
-                          (log_entry.ip, log_entry.line, log_entry.log_file))
-                c.execute("SELECT ip, first_access, last_access, access_count FROM log_ip WHERE ip = ?",
-                          (ip_int,))
-                row = c.fetchone()
+            self.conn.row_factory = sqlite3.Row
+            c = self.conn.cursor()
+            c.execute("SELECT ip, first_access, last_access, access_count FROM log_ip WHERE ip = ?",
+                      (ip_db,))
+            row = c.fetchone()
         except sqlite3.OperationalError as ex:
             raise JudgmentException(
                 "Access to Sqlite Db caused error; Diagnose: use `find2deny-init-db' to create a Database.", errors=ex)
@@ -254,29 +462,16 @@ class TimeBasedIpJudgment(AbstractIpJudgment):
             else:raise JudgmentException("Logfile is not sorted by modified date: first access: {} last access: {}".
                                         format(row['first_access'], log_entry.time))
 
-    def _lookup_decision_cache(self, log_entry:LogEntry) -> (bool, str):
-        try:
-            with self.conn as conn:
-                for row in conn.execute("SELECT count(*) as count_ip, cause_of_block FROM block_network WHERE ip = ?", (log_entry.ip,)):
-                    pass
-            count = row['count_ip']
-            cause = row['cause_of_block'] or None
-            return (count == 1), cause
-        except sqlite3.OperationalError as ex:
-            raise JudgmentException(
-                "Access to Sqlite Db caused error; Diagnose: use `find2deny-init-db' to create a Database.", errors=ex)
-
     def _add_log_entry(self, log_entry: LogEntry):
         time_iso = log_entry['time'].strftime(DATETIME_FORMAT_PATTERN)
         sql_cmd = """INSERT INTO log_ip (ip, first_access, last_access, access_count) 
                                          VALUES (?, ?, ?, ?)"""
         try:
-            with self.conn as conn:
-                conn.execute(sql_cmd, (log_entry.ip,
-                                       time_iso,
-                                       time_iso,
-                                       1)
-                             )
+            db_connection.get_writer(self.conn).execute(sql_cmd, (log_parser.ip_to_db(log_entry.ip),
+                                                                  time_iso,
+                                                                  time_iso,
+                                                                  1)
+                                                        )
         except sqlite3.OperationalError:
             LOGGER.warning("Cannot insert new log to log_ip")
         pass
@@ -287,21 +482,27 @@ class TimeBasedIpJudgment(AbstractIpJudgment):
         :param access_count:
         :return:
         """
-        ip_network = lookup_ip(log_entry.ip)
         update_cmd = """UPDATE log_ip SET 
-            ip_network = ?,
             last_access = ?,
             access_count = ?,
             status = 1
             WHERE ip = ?
         """
         try:
-            with self.conn as conn:
-                conn.execute(update_cmd, (ip_network, log_entry.iso_time, access_count, log_entry.ip))
+            db_connection.get_writer(self.conn).execute(
+                update_cmd, (log_entry.iso_time, access_count, log_parser.ip_to_db(log_entry.ip)))
         except sqlite3.OperationalError:
             LOGGER.warning("Cannot update log_ip")
+        lookup_ip_async(log_entry.ip, lambda ip_network: self._update_network(log_entry, ip_network))
         pass
 
+    def _update_network(self, log_entry: LogEntry, ip_network: str):
+        try:
+            db_connection.get_writer(self.conn).execute(
+                "UPDATE log_ip SET ip_network = ? WHERE ip = ?", (ip_network, log_parser.ip_to_db(log_entry.ip)))
+        except sqlite3.OperationalError:
+            LOGGER.warning("Cannot update log_ip")
+
     def _update_access(self, log_entry: LogEntry, access_count: int):
         """
 
@@ -311,8 +512,8 @@ class TimeBasedIpJudgment(AbstractIpJudgment):
         """
         try:
             update_cmd = "UPDATE log_ip SET last_access = ?,  access_count = ? WHERE ip = ?"
-            with self.conn as conn:
-                conn.execute(update_cmd, (local_datetime(), access_count, log_entry.ip))
+            db_connection.get_writer(self.conn).execute(
+                update_cmd, (local_datetime(), access_count, log_parser.ip_to_db(log_entry.ip)))
             LOGGER.debug("update access_count of %s to %s", log_entry.ip_str, access_count)
         except sqlite3.OperationalError:
             print("Cannot update log_ip")
@@ -322,10 +523,210 @@ class TimeBasedIpJudgment(AbstractIpJudgment):
         return "TimeBasedIpBlocker/database:{}".format(self._sqlite_db_path)
 
 
+class SlidingWindowIpJudgment(AbstractIpJudgment):
+    """
+        deny an ip if it accessed the server more than `allow_access' times within `interval_second' seconds.
+
+        The timestamps of the last `allow_access' + 1 accesses of each ip are kept in memory, so decisions do not
+        need any database access. The table `log_ip' is updated in batches every `flush_entries' log entries
+        and by `flush'.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, allow_access: int = 10, interval_second: int = 10,
+                 flush_entries: int = 10000):
+        """
+        :param conn: connection to a SQLite Database
+        :param allow_access: number of access in a given time interval (next parameter)
+        :param interval_second: time interval in seconds
+        :param flush_entries: number of log entries after which the state is written to the database
+        """
+        self.allow_access = allow_access
+        self.interval = interval_second
+        self.conn = conn
+        self.flush_entries = flush_entries
+        # ip -> timestamps of last accesses
+        self._windows: Dict[int, Deque[float]] = {}
+        # ip -> [first access, last access, number of accesses since last flush, status] to be written to log_ip
+        self._changes: Dict[int, list] = {}
+        self._last_time = 0.0
+        self._count = 0
+
+    def required_fields(self) -> Set[str]:
+        return {'time'}
+
+    def should_deny(self, log_entry: LogEntry, entry_count: int = 0) -> (bool, str):
+        log_time = log_entry.time
+        timestamp = log_time.timestamp()
+        window = self._windows.get(log_entry.ip)
+        if window is None:
+            window = self._windows[log_entry.ip] = deque(maxlen=self.allow_access + 1)
+        window.append(timestamp)
+        self._last_time = max(self._last_time, timestamp)
+        deny = len(window) > self.allow_access and timestamp - window[0] <= self.interval
+        change = self._changes.get(log_entry.ip)
+        if change is None:
+            self._changes[log_entry.ip] = [log_time, log_time, 1, 1 if deny else 0]
+        else:
+            change[1] = log_time
+            change[2] += 1
+            change[3] = change[3] or (1 if deny else 0)
+        self._count += 1
+        if self._count >= self.flush_entries:
+            self.flush()
+        if deny:
+            cause = "{} accessed server {}-times in {} secs which is too much for rate {} accesses / {}".format(
+                log_entry.ip_str, len(window), timestamp - window[0], self.allow_access, self.interval)
+            LOGGER.info(cause)
+            return True, cause
+        return False, None
+
+    def should_deny_batch(self, batch: LogBatch, entry_count: int = 0) -> tuple:
+        """
+            judges a batch by `log_batch.sliding_window_deny'. The windows of the ips in the batch are put before the
+            entries of the batch, so that a batch continues where the batch or entry before stopped.
+        """
+        n = len(batch)
+        if n == 0:
+            return np.zeros(0, dtype=bool), []
+        prefix_codes, prefix_times = [], []
+        for code in np.unique(batch.ip_codes):
+            window = self._windows.get(batch.ips[code], ())
+            prefix_codes.extend([code] * len(window))
+            prefix_times.extend(window)
+        codes = np.concatenate((np.array(prefix_codes, dtype=np.int64), batch.ip_codes))
+        times = np.concatenate((np.array(prefix_times, dtype=np.float64), batch.time))
+        deny, seconds = sliding_window_deny(codes, times, self.allow_access, self.interval)
+        deny, seconds = deny[len(prefix_codes):], seconds[len(prefix_codes):]
+        # the last accesses of each ip become its window
+        for ip, ordered_times in _group_by_ip(batch.ips, codes, times, times):
+            self._windows[ip] = deque(ordered_times[-(self.allow_access + 1):].tolist(), maxlen=self.allow_access + 1)
+        for ip, rows in _group_by_ip(batch.ips, batch.ip_codes, batch.time, np.arange(n)):
+            first, last = batch.entries[rows[0]].time, batch.entries[rows[-1]].time
+            status = 1 if deny[rows].any() else 0
+            change = self._changes.get(ip)
+            if change is None:
+                self._changes[ip] = [first, last, len(rows), status]
+            else:
+                change[1] = last
+                change[2] += len(rows)
+                change[3] = change[3] or status
+        self._last_time = max(self._last_time, float(np.nanmax(batch.time)))
+        self._count += n
+        if self._count >= self.flush_entries:
+            self.flush()
+        causes = [None] * n
+        for i in np.flatnonzero(deny):
+            causes[i] = "{} accessed server {}-times in {} secs which is too much for rate {} accesses / {}".format(
+                batch.entries[i].ip_str, self.allow_access + 1, seconds[i], self.allow_access, self.interval)
+            LOGGER.info(causes[i])
+        return deny, causes
+
+    def flush(self):
+        """
+            writes the accesses since the last flush to the table `log_ip' and forgets the windows of ips,
+            which did not access the server within the last interval.
+        """
+        if len(self._changes) > 0:
+            rows = [(ip_db, ip_db, ip_db, first.strftime(DATETIME_FORMAT_PATTERN), last.strftime(DATETIME_FORMAT_PATTERN),
+                     ip_db, count, status, ip_db)
+                    for ip_db, (first, last, count, status) in
+                    ((log_parser.ip_to_db(ip), change) for ip, change in self._changes.items())]
+            try:
+                db_connection.get_writer(self.conn).executemany("""
+                    INSERT OR REPLACE INTO log_ip (ip, ip_network, first_access, last_access, access_count, status)
+                    VALUES (?,
+                        (SELECT ip_network FROM log_ip WHERE ip = ?),
+                        COALESCE((SELECT first_access FROM log_ip WHERE ip = ?), ?),
+                        ?,
+                        COALESCE((SELECT access_count FROM log_ip WHERE ip = ?), 0) + ?,
+                        MAX(?, COALESCE((SELECT status FROM log_ip WHERE ip = ?), 0))
+                    )
+                    """, rows)
+            except sqlite3.OperationalError as ex:
+                raise JudgmentException(
+                    "Access to Sqlite Db caused error; Diagnose: use `find2deny-init-db' to create a Database.",
+                    errors=ex)
+            LOGGER.debug("wrote %d ip to log_ip", len(rows))
+            self._changes = {}
+        self._count = 0
+        expired = [ip for ip, window in self._windows.items() if window[-1] < self._last_time - self.interval]
+        for ip in expired:
+            del self._windows[ip]
+
+    def __str__(self):
+        return "SlidingWindowIpJudgment/{} accesses / {} secs".format(self.allow_access, self.interval)
+
+
+def _group_by_ip(ips: List[int], ip_codes, times, values):
+    """
+        yields each ip with its values ordered by time
+    """
+    order = np.lexsort((times, ip_codes))
+    ordered_codes = ip_codes[order]
+    starts = np.flatnonzero(np.concatenate(([True], ordered_codes[1:] != ordered_codes[:-1])))
+    ends = np.append(starts[1:], len(order))
+    for start, end in zip(starts, ends):
+        yield ips[ordered_codes[start]], values[order[start:end]]
+
+
 def local_datetime() -> str:
     return pendulum.now().strftime(DATETIME_FORMAT_PATTERN)
 
 
+# resolver used by `lookup_ip'
+_resolver: AbstractResolver = RdapResolver()
+
+
+def set_resolver(ip_resolver: AbstractResolver):
+    """
+        sets the resolver used by `lookup_ip', e.g. an `Ip2AsnResolver' to find networks without network access
+    """
+    global _resolver
+    _resolver = ip_resolver
+    __lookup_ip.cache_clear()
+    if _async_resolver is not None:
+        set_async_lookup(_async_resolver.workers)
+    LOGGER.info("Resolve networks by %s", ip_resolver)
+
+
+# resolver looking up networks in background threads, see `set_async_lookup'
+_async_resolver: AsyncResolver = None
+
+
+def set_async_lookup(workers: int):
+    """
+        makes `lookup_ip_async' look up networks in `workers' background threads, or synchronously if `workers' is 0.
+        Lookups of the former background resolver are completed.
+    """
+    global _async_resolver
+    if _async_resolver is not None:
+        _async_resolver.shutdown()
+    _async_resolver = AsyncResolver(_resolver, workers) if workers > 0 else None
+
+
+def lookup_ip_async(ip: str or int, callback: Callable[[str], None]):
+    """
+        looks up the network of an ip like `lookup_ip' and calls `callback' with the network. The callback is called
+        at once, or by `complete_lookups' if the network is looked up in background, see `set_async_lookup'.
+    """
+    str_ip = ip if isinstance(ip, str) else log_parser.int_to_ip(ip)
+    if _async_resolver is None:
+        callback(__lookup_ip(str_ip))
+    else:
+        _async_resolver.submit(str_ip, lambda network: callback(network if network is not None else str_ip))
+
+
+def complete_lookups(wait: bool = False) -> int:
+    """
+        calls the callbacks of finished background lookups in the current thread
+    :param wait: wait until all lookups are finished
+    :return: number of finished lookups
+    """
+    if _async_resolver is None:
+        return 0
+    return _async_resolver.drain(wait)
+
+
 def lookup_ip(ip: str or int) -> str:
     str_ip = ip if isinstance(ip, str) else log_parser.int_to_ip(ip)
     return __lookup_ip(str_ip)
@@ -333,33 +734,67 @@ def lookup_ip(ip: str or int) -> str:
 
 @functools.lru_cache(maxsize=10240)
 def __lookup_ip(normed_ip: str) -> str:
-    try:
-        who = IPWhois(normed_ip).lookup_rdap()
-        cidr = who["network"]["cidr"]
-        asn_cidr = who["asn_cidr"]
-        return cidr if cidr == asn_cidr else (cidr + ' ' + asn_cidr)
-    except (urllib.error.HTTPError, exceptions.HTTPLookupError, exceptions.IPDefinedError, ASNRegistryError) as ex:
+    network = _resolver.resolve(normed_ip)
+    if network is None:
         LOGGER.warning("IP Lookup for %s fail", normed_ip)
         LOGGER.warning("return ip instead of network")
-        LOGGER.debug(ex)
         return normed_ip
+    return network
 
 
 class UserAgentBasedIpJudgment(AbstractIpJudgment):
     """
         deny an ip in a log entry if a log entry has a User-Agent String containing one of given
-        substring. The list of substrings is given by initialize this class
+        substring or matching one of given regular expressions. The lists are given by initialize this class.
+
+        Substrings and regular expressions are compiled into one regular expression (unless a regular expression
+        has capturing groups), verdicts are cached for each User-Agent String.
     """
-    def __init__(self, blacklist_agent: List[str]):
+    def __init__(self, blacklist_agent: List[str], blacklist_agent_regex: List[str] = None, cache_size: int = 4096):
         self._blacklist_agent = blacklist_agent
+        self._blacklist_agent_regex = blacklist_agent_regex if blacklist_agent_regex is not None else []
+        try:
+            patterns = [re.compile(re.escape(bl)) for bl in self._blacklist_agent] + \
+                       [re.compile(bl) for bl in self._blacklist_agent_regex]
+        except re.error as ex:
+            raise JudgmentException(f"Invalid regular expression in blacklist of User-Agent: {ex}", ex)
+        try:
+            # numbered backreferences would refer to other groups in the alternation
+            combined = re.compile("|".join(f"(?:{p.pattern})" for p in patterns)) \
+                if all(p.groups == 0 for p in patterns) else None
+        except re.error:
+            # regular expressions with global flags cannot be combined, they are searched one after another
+            combined = None
+        blacklist = self._blacklist_agent + self._blacklist_agent_regex
+
+        def match(ua: str) -> str or None:
+            if combined is not None and combined.search(ua) is None:
+                return None
+            # report the first entry of the blacklist like a sequential search
+            return next((bl for bl, p in zip(blacklist, patterns) if p.search(ua) is not None), None)
+        self._match_agent = functools.lru_cache(maxsize=cache_size)(match)
+
+    def required_fields(self) -> Set[str]:
+        return {'user_agent'}
 
     def should_deny(self, log_entry: LogEntry, entry_count: int = 0) -> (bool,str):
         ua = log_entry.user_agent
-        for bl in self._blacklist_agent:
-            if ua.find(bl) >= 0:
-                cleaned_ua = ua.replace("\n", ' ')
-                return True, f"{cleaned_ua} contains {bl}"
+        if ua is None:
+            return False, None
+        bl = self._match_agent(ua)
+        if bl is not None:
+            cleaned_ua = ua.replace("\n", ' ')
+            return True, f"{cleaned_ua} contains {bl}"
         return False, None
+
+    def should_deny_batch(self, batch: LogBatch, entry_count: int = 0) -> tuple:
+        matches = map_distinct(batch.user_agent, lambda ua: None if ua is None else self._match_agent(ua))
+        deny = np.fromiter((bl is not None for bl in matches), dtype=bool, count=len(matches))
+        causes = [None] * len(batch)
+        for i in np.flatnonzero(deny):
+            cleaned_ua = batch.user_agent[i].replace("\n", ' ')
+            causes[i] = f"{cleaned_ua} contains {matches[i]}"
+        return deny, causes
     pass
 
 
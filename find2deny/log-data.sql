@@ -1,5 +1,8 @@
+/*
+ip: IPv4 as INTEGER, IPv6 as 16 bytes BLOB (see log_parser.ip_to_db)
+*/
 CREATE TABLE IF NOT EXISTS block_network (
-    ip INTEGER PRIMARY KEY,
+    ip BLOB PRIMARY KEY,
     ip_network TEXT ,
     block_since TEXT,
     judge TEXT default  NULL,
@@ -7,7 +10,7 @@ CREATE TABLE IF NOT EXISTS block_network (
 );
 
 CREATE TABLE IF NOT EXISTS log_ip (
-    ip INTEGER PRIMARY KEY,
+    ip BLOB PRIMARY KEY,
     ip_network TEXT DEFAULT NULL ,
     first_access TEXT,
     last_access TEXT,
@@ -19,15 +22,43 @@ status: 0 => allow
         1 => block
 */
 
-CREATE TABLE IF NOT EXISTS processed_log_ip (
-    ip INTEGER,
-    line INTEGER,
-    log_file TEXT,
-    PRIMARY KEY (ip,line, log_file)
+/*
+processed_log_ip stored one row per judged line, it is replaced by log_file_checkpoint
+*/
+DROP TABLE IF EXISTS processed_log_ip;
+
+/*
+file_id: identity of the content of a log file (see log_parser.file_identity)
+byte_offset, line: position (in uncompressed content) after the last processed line
+*/
+CREATE TABLE IF NOT EXISTS log_file_checkpoint (
+    file_id TEXT PRIMARY KEY,
+    path TEXT,
+    byte_offset INTEGER,
+    line INTEGER
+);
+
+/*
+network: network in CIDR notation, result: networks found by a resolver for IPs in network,
+resolved_at: seconds since epoch
+*/
+CREATE TABLE IF NOT EXISTS resolved_network (
+    network TEXT PRIMARY KEY,
+    result TEXT,
+    resolved_at INTEGER
 );
 
 /*                         processed_log_file */
 CREATE TABLE IF NOT EXISTS processed_log_file (
     content_hash TEXT PRIMARY KEY,
     path TEXT
-);
\ No newline at end of file
+);
+
+/*                         log_file_fingerprint */
+/* content hash of processed files by their fingerprint, see `cli.file_fingerprint' */
+CREATE TABLE IF NOT EXISTS log_file_fingerprint (
+    fingerprint TEXT PRIMARY KEY,
+    sample TEXT,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS log_file_fingerprint_sample ON log_file_fingerprint (sample);
\ No newline at end of file
@@ -0,0 +1,139 @@
+# -*- encoding:utf8 -*-
+
+import itertools
+import logging
+import math
+from typing import Iterable, Iterator, List, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, it is needed only to judge log entries in batches
+    np = None
+
+from . log_parser import CannotParseLogLineException, LogEntry, LOG_ENTRY_FIELDS
+
+
+class LogBatch:
+    """
+        columns of a list of log entries, to be judged by `AbstractIpJudgment.should_deny_batch'.
+
+        IPs are factorized: `ip_codes[i]' is the index of the ip of the i-th entry in the list `ips' of distinct IPs,
+        since IPv6 addresses do not fit into NumPy integers. `time' holds seconds since epoch (NaN if unknown),
+        `status' the HTTP status codes, `request' and `user_agent' are object arrays of strings.
+        Only the columns of the given fields are filled, the others are None. Entries whose timestamp cannot be
+        parsed are dropped with a warning, like `log_parser' skips lines, which cannot be parsed.
+    """
+
+    def __init__(self, entries: List[LogEntry], fields: Set[str] = None):
+        if np is None:
+            raise ImportError("Package numpy is required to judge log entries in batches; "
+                              "install it by `pip install find2deny[batch]'")
+        fields = LOG_ENTRY_FIELDS if fields is None else fields
+        times = None
+        if 'time' in fields:
+            entries, times = _parse_times(entries)
+        n = len(entries)
+        self.entries = entries
+        self.ips: List[int] = []
+        codes = {}
+        ip_codes = np.empty(n, dtype=np.int64)
+        for i, entry in enumerate(entries):
+            code = codes.get(entry.ip)
+            if code is None:
+                code = codes[entry.ip] = len(self.ips)
+                self.ips.append(entry.ip)
+            ip_codes[i] = code
+        self.ip_codes = ip_codes
+        self.time = np.array(times, dtype=np.float64) if times is not None else None
+        self.status = np.fromiter((e.status for e in entries), dtype=np.int32, count=n) \
+            if 'status' in fields else None
+        self.request = _object_array([e.request for e in entries]) if 'request' in fields else None
+        self.user_agent = _object_array([e.user_agent for e in entries]) if 'user_agent' in fields else None
+
+    def select(self, rows) -> 'LogBatch':
+        """
+            returns a batch of the given rows (indices or boolean mask), the list `ips' is shared.
+        """
+        rows = np.flatnonzero(rows) if rows.dtype == np.bool_ else rows
+        batch = LogBatch.__new__(LogBatch)
+        batch.entries = [self.entries[i] for i in rows]
+        batch.ips = self.ips
+        batch.ip_codes = self.ip_codes[rows]
+        for column in ('time', 'status', 'request', 'user_agent'):
+            values = getattr(self, column)
+            setattr(batch, column, None if values is None else values[rows])
+        return batch
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def _parse_times(entries: List[LogEntry]) -> Tuple[List[LogEntry], List[float]]:
+    """
+    :return: the entries, whose time can be parsed, and their times in seconds since epoch (NaN if unknown)
+    """
+    parsed, times = [], []
+    for entry in entries:
+        try:
+            time = entry.time
+        except CannotParseLogLineException as ex:
+            logging.warning(ex)
+            continue
+        parsed.append(entry)
+        times.append(math.nan if time is None else time.timestamp())
+    return parsed, times
+
+
+def _object_array(values: list):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def iter_batches(logs: Iterable[LogEntry], batch_size: int) -> Iterator[List[LogEntry]]:
+    """
+        groups log entries into lists of `batch_size' entries
+    """
+    logs = iter(logs)
+    while True:
+        entries = list(itertools.islice(logs, batch_size))
+        if len(entries) == 0:
+            return
+        yield entries
+
+
+def map_distinct(values, fn) -> list:
+    """
+        applies `fn' once for each distinct value of a column and returns the list of results for all values.
+        Log entries repeat the same paths and User-Agents, so this is much less work than calling `fn' for each value.
+    """
+    distinct = {}
+    results = []
+    for value in values:
+        result = distinct.get(value, distinct)
+        if result is distinct:
+            result = distinct[value] = fn(value)
+        results.append(result)
+    return results
+
+
+def sliding_window_deny(ip_codes, times, allow_access: int, interval: float):
+    """
+        finds the accesses, which are at least the `allow_access'+1-th access of their ip within `interval' seconds,
+        like `judgment.SlidingWindowIpJudgment' does for one entry after another.
+    :param ip_codes: ip of each access
+    :param times: time of each access in seconds
+    :return: boolean array of denied accesses and array of the seconds between the access and the `allow_access'-th
+        access before it (NaN if there is none)
+    """
+    n = len(ip_codes)
+    order = np.lexsort((times, ip_codes))
+    codes, ordered_times = ip_codes[order], times[order]
+    seconds = np.full(n, np.nan)
+    if n > allow_access:
+        same_ip = codes[allow_access:] == codes[:n - allow_access]
+        delay = ordered_times[allow_access:] - ordered_times[:n - allow_access]
+        seconds[order[allow_access:]] = np.where(same_ip, delay, np.nan)
+    with np.errstate(invalid='ignore'):
+        deny = seconds <= interval
+    return deny, seconds
@@ -0,0 +1,277 @@
+# -*- encoding:utf8 -*-
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from array import array
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, it is needed only to cache parsed log entries
+    np = None
+
+from . log_parser import LogEntry
+
+
+LOGGER = logging.getLogger(__name__)
+
+# integer columns of a cached file; `offset' is the byte offset after the line of an entry, -1 if not known
+_NUMBER_COLUMNS = ('line', 'offset', 'ip_high', 'ip_low', 'status', 'byte')
+# text columns, stored as raw bytes and their lengths (-1 for None)
+_TEXT_COLUMNS = ('time', 'request', 'user', 'user_agent')
+_MAX_IP_LOW = 2 ** 64 - 1
+# number of entries, which are written or read at once
+CHUNK_SIZE = 65536
+# temporary directories older than this number of seconds are removed, even if their process seems to be alive
+STALE_TMP_SECONDS = 24 * 60 * 60
+
+
+class ParsedLogCache:
+    """
+        caches the entries of parsed log files in the directory `cache_dir', so that later runs (e.g. with new rules
+        on a new database) read them instead of decompressing and parsing the files again.
+
+        The entries of a file are stored in a sub directory, whose name is derived from the content hash of the file
+        and the log pattern. Each column of the entries is a file of raw integers or bytes, which is memory mapped
+        by NumPy to be read. If the cache grows above `max_size' bytes, the least recently used files are removed.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int):
+        if np is None:
+            raise ImportError("Package numpy is required to cache parsed log entries; "
+                              "install it by `pip install find2deny[batch]'")
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+        self.remove_stale()
+
+    @staticmethod
+    def key(file_hash: str, log_pattern) -> str:
+        """
+            the key of a file in the cache, entries of the same file parsed by another pattern are different
+        """
+        return hashlib.sha256(json.dumps([file_hash, log_pattern]).encode()).hexdigest()
+
+    def load(self, key: str) -> 'CachedLogFile' or None:
+        """
+        :return: the cached entries of the key, or None if they are not cached
+        """
+        directory = os.path.join(self.cache_dir, key)
+        try:
+            cached = CachedLogFile(directory)
+        except (IOError, ValueError, KeyError) as ex:
+            if os.path.exists(directory):
+                LOGGER.warning("Cannot read cache %s: %s", directory, ex)
+            return None
+        # the modification time of the directory orders the cache by last use
+        os.utime(directory)
+        return cached
+
+    def store(self, keys: Dict[str, str], entries: Iterable[LogEntry], positions: Dict[str, List[int]],
+              offsets: bool = False) -> Iterator[LogEntry]:
+        """
+            yields the given entries and writes the entries of the files in `keys' to the cache. Files are stored
+            only if all entries are read, i.e. if the generator is not closed before.
+        :param keys: path -> cache key of files, which are parsed from their first line on
+        :param entries: parsed entries of all fields
+        :param positions: path -> position after the last read line of a file, see `log_parser.iter_log_files'
+        :param offsets: True if the position is updated for each entry, otherwise only the position after
+            the last entry is stored
+        """
+        writers = {path: _ColumnWriter(os.path.join(self.cache_dir, "{}.{}.tmp".format(key, os.getpid())))
+                   for path, key in keys.items()}
+        complete = False
+        try:
+            for entry in entries:
+                writer = writers.get(entry.log_file)
+                if writer is not None:
+                    writer.append(entry, positions[entry.log_file][0] if offsets else -1)
+                yield entry
+            complete = True
+        finally:
+            for path, writer in writers.items():
+                if complete:
+                    writer.finish(os.path.join(self.cache_dir, keys[path]), positions[path])
+                    LOGGER.info("Cached %d entries of file %s", writer.count, path)
+                else:
+                    writer.abort()
+            if complete:
+                self.evict()
+
+    def remove_stale(self):
+        """
+            removes temporary directories of `store', whose process is killed before the files are stored
+        """
+        for name in os.listdir(self.cache_dir):
+            directory = os.path.join(self.cache_dir, name)
+            if name.endswith(".tmp") and os.path.isdir(directory) and _is_stale(directory):
+                LOGGER.info("Remove stale %s from cache", directory)
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def evict(self):
+        """
+            removes stale temporary directories and the least recently used files until the cache is not larger
+            than `max_size'
+        """
+        self.remove_stale()
+        cached = []
+        for name in os.listdir(self.cache_dir):
+            directory = os.path.join(self.cache_dir, name)
+            if os.path.isdir(directory) and not name.endswith(".tmp"):
+                size = sum(e.stat().st_size for e in os.scandir(directory))
+                cached.append((os.stat(directory).st_mtime, size, directory))
+        total = sum(size for _, size, _ in cached)
+        for _, size, directory in sorted(cached):
+            if total <= self.max_size:
+                break
+            LOGGER.info("Remove %s from cache", directory)
+            shutil.rmtree(directory, ignore_errors=True)
+            total -= size
+
+
+def _is_stale(tmp_directory: str) -> bool:
+    """
+        a temporary directory `{key}.{pid}.tmp' is stale if its process does not exist any more, or if it is older
+        than `STALE_TMP_SECONDS'
+    """
+    try:
+        if time.time() - os.stat(tmp_directory).st_mtime > STALE_TMP_SECONDS:
+            return True
+        pid = int(os.path.basename(tmp_directory).split(".")[-2])
+    except (OSError, ValueError, IndexError):
+        return False
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        # e.g. the process of another user
+        pass
+    return False
+
+
+class CachedLogFile:
+    """
+        entries of a log file in the cache
+    """
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        self.count: int = meta['count']
+        # position after the last line of the file
+        self.end: Tuple[int, int] = tuple(meta['end'])
+        self._directory = directory
+
+    def _column(self, name: str, dtype):
+        path = os.path.join(self._directory, name)
+        if os.path.getsize(path) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r')
+
+    def iter_entries(self, log_file_path: str, start: Tuple[int, int] = (0, 0), position: List[int] = None) \
+            -> Iterator[LogEntry]:
+        """
+            yields the cached entries like `log_parser.iter_log_file' does
+        :param log_file_path: path of the file, which has the cached content
+        :param start: position of the file, only entries after its line are read
+        :param position: if given, `[byte offset, line]' after the last read entry is stored in this list
+        """
+        numbers = {name: self._column(name + ".int", np.uint64 if name.startswith('ip') else np.int64)
+                   for name in _NUMBER_COLUMNS}
+        texts = {name: (self._column(name + ".data", np.uint8), self._column(name + ".length", np.int64))
+                 for name in _TEXT_COLUMNS}
+        text_starts = {name: np.concatenate(([0], np.cumsum(np.maximum(lengths, 0))))
+                       for name, (_, lengths) in texts.items()}
+        first = int(np.searchsorted(numbers['line'], start[1], side='right'))
+        for chunk_start in range(first, self.count, CHUNK_SIZE):
+            chunk_end = min(chunk_start + CHUNK_SIZE, self.count)
+            values = {name: column[chunk_start:chunk_end].tolist() for name, column in numbers.items()}
+            for name, (data, lengths) in texts.items():
+                values[name] = _split_text(data, text_starts[name][chunk_start:chunk_end + 1].tolist(),
+                                           lengths[chunk_start:chunk_end].tolist())
+            for i, line in enumerate(values['line']):
+                entry = LogEntry(log_file_path, line, ip=(values['ip_high'][i] << 64) | values['ip_low'][i],
+                                 time=values['time'][i], status=values['status'][i], request=values['request'][i],
+                                 byte=values['byte'][i], user=values['user'][i], user_agent=values['user_agent'][i])
+                if position is not None and values['offset'][i] >= 0:
+                    position[:] = [values['offset'][i], line]
+                yield entry
+        if position is not None:
+            position[:] = list(self.end)
+
+
+def _split_text(data, starts: List[int], lengths: List[int]) -> List[bytes or None]:
+    blob = data[starts[0]:starts[-1]].tobytes()
+    base = starts[0]
+    return [None if length < 0 else blob[start - base:start - base + length]
+            for start, length in zip(starts, lengths)]
+
+
+class _ColumnWriter:
+    """
+        writes the columns of entries into files of a temporary directory in chunks of `CHUNK_SIZE' entries
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.count = 0
+        self._numbers = {name: array('Q' if name.startswith('ip') else 'q') for name in _NUMBER_COLUMNS}
+        self._lengths = {name: array('q') for name in _TEXT_COLUMNS}
+        self._data = {name: open(os.path.join(directory, name + ".data"), 'wb') for name in _TEXT_COLUMNS}
+        self._files = {name + ".int": open(os.path.join(directory, name + ".int"), 'wb') for name in _NUMBER_COLUMNS}
+        self._files.update({name + ".length": open(os.path.join(directory, name + ".length"), 'wb')
+                            for name in _TEXT_COLUMNS})
+
+    def append(self, entry: LogEntry, offset: int):
+        numbers = self._numbers
+        numbers['line'].append(entry.line)
+        numbers['offset'].append(offset)
+        numbers['ip_high'].append(entry.ip >> 64)
+        numbers['ip_low'].append(entry.ip & _MAX_IP_LOW)
+        numbers['status'].append(entry.raw('status') or 0)
+        numbers['byte'].append(entry.raw('byte') or 0)
+        for name in _TEXT_COLUMNS:
+            value = entry.raw(name)
+            if value is None:
+                self._lengths[name].append(-1)
+            else:
+                self._lengths[name].append(len(value))
+                self._data[name].write(value)
+        self.count += 1
+        if len(numbers['line']) >= CHUNK_SIZE:
+            self._flush()
+
+    def _flush(self):
+        for name, values in self._numbers.items():
+            values.tofile(self._files[name + ".int"])
+            del values[:]
+        for name, values in self._lengths.items():
+            values.tofile(self._files[name + ".length"])
+            del values[:]
+
+    def _close(self):
+        for f in list(self._files.values()) + list(self._data.values()):
+            f.close()
+
+    def finish(self, directory: str, end: List[int]):
+        """
+            moves the written columns to `directory'
+        """
+        self._flush()
+        self._close()
+        with open(os.path.join(self.directory, "meta.json"), 'w') as f:
+            json.dump({'count': self.count, 'end': list(end)}, f)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.rename(self.directory, directory)
+
+    def abort(self):
+        self._close()
+        shutil.rmtree(self.directory, ignore_errors=True)
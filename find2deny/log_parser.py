@@ -1,14 +1,40 @@
+import bz2
+import contextlib
+import functools
 import gzip
+import hashlib
+import heapq
+import io
+import itertools
 import ipaddress
-from datetime import datetime
+import re
+import shlex
+import socket
+import subprocess
+import threading
+from datetime import datetime, timedelta, timezone
 import logging
-from typing import List
-
-import magic
+import lzma
+import mmap
+import os
+import pickle
+import tempfile
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Set, Tuple
 
 DATETIME_FORMAT_PATTERN = '%Y-%m-%d %H:%M:%S.%f%z'
 
 
+# attributes of LogEntry, which can be accessed by `entry[name]'
+_ENTRY_FIELDS = frozenset(['ip', 'time', 'status', 'request', 'user', 'user_agent', 'byte', 'log_file', 'line'])
+# attributes of LogEntry, which are parsed from a log line
+LOG_ENTRY_FIELDS = frozenset(['ip', 'time', 'status', 'request', 'user', 'user_agent', 'byte'])
+
+
+def _decode(value: bytes) -> str:
+    return value.decode('utf-8', errors='ignore')
+
+
 class LogEntry:
     """
     represents a Log Entry with following attribute:
@@ -18,7 +44,14 @@ class LogEntry:
         * 'request': the first line of the HTTP-request or None if not available
         * 'byte': response length in Byte
         * 'user': remote-user or None if not available
+        * 'user_agent': User-Agent-String of the request or None if not available
+
+    The attribute `time' can be given as raw timestamp of the log line (e.g. `27/Mar/2019:13:11:45 +0100'),
+    which is only converted to a `datetime' when it is read. Likewise the attributes `time', `request', `user'
+    and `user_agent' can be given as raw UTF-8 bytes, which are decoded when they are read.
     """
+    __slots__ = ('_log_file', '_line', '_ip', '_network', '_time', '_status', '_request', '_byte', '_user',
+                 '_user_agent')
 
     def __init__(self, log_file: str,
                  line: int,
@@ -31,16 +64,16 @@ class LogEntry:
                  user: str = None,
                  user_agent: str = None
                  ):
-        self.__ip = ip
-        self.__network = network
-        self.__time = time
-        self.__status = status
-        self.__request = request
-        self.__byte = byte
-        self.__user = user
-        self.__user_agent = user_agent
-        self.__log_file = log_file
-        self.__line = line
+        self._ip = ip
+        self._network = network
+        self._time = time
+        self._status = status
+        self._request = request
+        self._byte = byte
+        self._user = user
+        self._user_agent = user_agent
+        self._log_file = log_file
+        self._line = line
 
     @property
     def ip(self) -> int:
@@ -48,7 +81,7 @@ class LogEntry:
             the IP of the log entry, represents as an interger
         :return: the ip
         """
-        return self.__ip
+        return self._ip
 
     @ip.setter
     def ip(self, ip: str or int):
@@ -60,9 +93,9 @@ class LogEntry:
         :return:
         """
         if type(ip) == str:
-            self.__ip = LogEntry.ip_to_int(ip)
+            self._ip = ip_to_int(ip)
         elif type(ip) == int:
-            self.__ip = ip
+            self._ip = ip
         pass
 
     @property
@@ -71,7 +104,7 @@ class LogEntry:
             the network of ip of this Log, may be None
         :return:
         """
-        return self.__network
+        return self._network
 
     @network.setter
     def network(self, network: str):
@@ -80,7 +113,7 @@ class LogEntry:
         :param network:
         :return:
         """
-        self.__network = network
+        self._network = network
 
     @property
     def time(self) -> datetime:
@@ -88,7 +121,14 @@ class LogEntry:
             time of this log entry
         :return:
         """
-        return self.__time
+        if type(self._time) is bytes:
+            self._time = _decode(self._time)
+        if type(self._time) is str:
+            try:
+                self._time = parse_access_log_time(self._time)
+            except ValueError as ex:
+                raise CannotParseLogLineException(self._log_file, self._line, str(ex), errors=ex)
+        return self._time
 
     @time.setter
     def time(self, time: str or datetime):
@@ -97,114 +137,104 @@ class LogEntry:
         :param time: time of this log entry
         :return:
         """
-        self.__time = time
+        self._time = time
 
     @property
     def status(self) -> int:
-        return self.__status
+        return self._status
 
     @status.setter
     def status(self, status: int or str):
-        self.__status = int(status)
+        self._status = int(status)
         pass
 
     @property
     def request(self) -> str:
-        return self.__request
+        if type(self._request) is bytes:
+            self._request = _decode(self._request)
+        return self._request
+
+    @request.setter
+    def request(self, request: str):
+        self._request = request
 
     @property
     def byte(self) -> int:
-        return self.__byte
+        return self._byte
 
     @byte.setter
     def byte(self, byte: str or int):
-        self.__byte = int(byte)
-
-    @request.setter
-    def request(self, request: str):
-        self.__request = request
+        self._byte = int(byte)
 
     @property
     def user(self) -> str:
-        return self.__user
+        if type(self._user) is bytes:
+            self._user = _decode(self._user)
+        return self._user
 
     @user.setter
     def user(self, user: str):
-        self.__user = user
+        self._user = user
 
     @property
     def user_agent(self) -> str:
-        return self.__user_agent
+        if type(self._user_agent) is bytes:
+            self._user_agent = _decode(self._user_agent)
+        return self._user_agent
 
     @user_agent.setter
     def user_agent(self, user_agent: str):
-        self.__user_agent = user_agent
+        self._user_agent = user_agent
 
     @property
     def iso_time(self) -> str:
-        return self.__time.strftime(DATETIME_FORMAT_PATTERN) if self.__time else "N/A"
+        try:
+            time = self.time
+        except CannotParseLogLineException:
+            # the raw timestamp, which cannot be parsed
+            return self._time
+        return time.strftime(DATETIME_FORMAT_PATTERN) if time else "N/A"
 
     @property
     def ip_str(self):
-        return int_to_ip(self.__ip)
+        return int_to_ip(self._ip)
 
     @property
     def log_file(self) -> str:
-        return self.__log_file
+        return self._log_file
 
     @log_file.setter
     def log_file(self, log_file: str):
-        self.__log_file = log_file
+        self._log_file = log_file
 
     @property
     def line(self) -> int:
-        return self.__line
+        return self._line
 
     @line.setter
     def line(self, line:int):
-        self.__line = line
+        self._line = line
+
+    def raw(self, field: str):
+        """
+            the value of a parsed attribute before it is decoded: text attributes as UTF-8 bytes, the time as
+            timestamp of the log line
+        :param field: one of `LOG_ENTRY_FIELDS'
+        """
+        value = getattr(self, '_' + field)
+        if isinstance(value, datetime):
+            return value.strftime(ACCESS_LOG_TIME_PATTERN).encode()
+        return value.encode() if isinstance(value, str) else value
 
     def __getitem__(self, item):
-        if item == "ip":
-            return self.__ip
-        elif item == "time":
-            return self.__time
-        elif item == "status":
-            return self.__status
-        elif item == "request":
-            return self.__request
-        elif item == "user":
-            return self.__user
-        elif item == "user_agent":
-            return self.__user_agent
-        elif item == "byte":
-            return self.__byte
-        elif item == "log_file":
-            return self.__log_file
-        elif item == "line":
-            return self.__line
+        if item in _ENTRY_FIELDS:
+            return getattr(self, item)
         else:
             raise KeyError("{} does not have property {}".format(self.__class__.__name__, item))
 
     def __setitem__(self, key, value):
-        if key == "ip":
-            self.ip = value
-        elif key == "time":
-            self.time = value
-        elif key == "status":
-            self.status = value
-        elif key == "request":
-            self.request = value
-        elif key == "user":
-            self.user = value
-        elif key == "user_agent":
-            self.__user_agent = value
-        elif key == "byte":
-            self.byte = value
-        elif key == "log_file":
-            self.log_file = value
-        elif key == "line":
-            self.line = value
+        if key in _ENTRY_FIELDS:
+            setattr(self, key, value)
         else:
             raise KeyError("{} does not have property {}".format(self.__class__.__name__, key))
 
@@ -234,138 +264,886 @@ def parse_log_file(log_file_path, log_pattern) -> List[LogEntry]:
     %h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b
 
     """
+    return list(iter_log_file(log_file_path, log_pattern))
 
-    log_pattern = log_pattern.replace('&quot;', '"').split(' ')
-    logs = []
-    num_of_line = 0
-    file_reader_fn = open_log_file_fn(log_file_path)
+
+def iter_log_file(log_file_path, log_pattern, decompress_commands: Dict[str, str] = None, fields: Set[str] = None,
+                  start: Tuple[int, int] = (0, 0), position: List[int] = None, hasher=None) -> Iterator[LogEntry]:
+    """
+        like `parse_log_file', but yields log entries one by one while the file is read, so that
+        only a chunk of the file is kept in memory. The file is read as bytes, fields of a log entry
+        are decoded only if they are read.
+    :param log_file_path: path to the log file, may be compressed, see `open_log_file_fn'
+    :param log_pattern: log pattern of the file, see `parse_log_file'
+    :param decompress_commands: commands to decompress files, see `open_log_file_fn'
+    :param fields: attributes of `LogEntry' to be parsed, see `compile_log_pattern'
+    :param start: byte offset (in the uncompressed content) and number of the line, after which the file is parsed,
+        e.g. a `position' of an earlier run
+    :param position: if given, `[byte offset, line]' after the last read line is stored in this list while
+        the file is parsed. Then a last line without newline of an uncompressed file is not read, since it may
+        be written just now; it is read by the next run, which starts at the position.
+    :param hasher: if given, a hash like `hashlib.sha256()', which is updated with the raw (compressed) bytes of
+        the file while it is read, see `open_log_file_fn'. It holds the hash of the whole file when the generator
+        is exhausted.
+    :return: a generator of log entries in order of their lines
+    """
+    file_reader_fn = open_log_file_fn(log_file_path, binary=True, decompress_commands=decompress_commands,
+                                      hasher=hasher)
+    # a compressed file is complete, its last line does not grow
+    partial = position is None or is_compressed(log_file_path)
     with file_reader_fn(log_file_path) as logfile:
-        line = logfile.readline()
-        while line:
+        _skip_bytes(logfile, start[0])
+        yield from _parse_lines(log_file_path, log_pattern, iter_lines(logfile, partial=partial), fields=fields,
+                                start=start, position=position)
+
+
+def _skip_bytes(binary_file, offset: int):
+    """
+        moves the read position of a file forward by `offset' bytes, a file which cannot seek is read.
+    """
+    if offset <= 0:
+        return
+    if binary_file.seekable():
+        binary_file.seek(offset)
+    else:
+        while offset > 0:
+            chunk = binary_file.read(min(offset, READ_CHUNK_SIZE))
+            if not chunk:
+                break
+            offset -= len(chunk)
+
+
+def _parse_lines(log_file_path: str, log_pattern, lines: Iterable[bytes], counter: List[int] = None,
+                 fields: Set[str] = None, start: Tuple[int, int] = (0, 0), position: List[int] = None) \
+        -> Iterator[LogEntry]:
+    """
+        parses lines of a log file, lines which cannot be parsed are skipped. The number of read lines
+        is stored in `counter[0]', if `counter' is given. Lines are numbered from `start[1]' + 1 on.
+        `[byte offset, line]' after the last read line is stored in `position', if it is given.
+    """
+    parse_line = compile_log_pattern(log_pattern, binary=True, fields=fields)
+    num_of_line, offset = start[1], start[0]
+    if position is None:
+        for line in lines:
             num_of_line += 1
             try:
-                log_entry = parser_tomcat_log_line(log_file_path, num_of_line, line, log_pattern)
-                logs.append(log_entry)
-            except CannotParseLogIpException as ex:
+                yield parse_line(log_file_path, num_of_line, line)
+            except CannotParseLogLineException as ex:
                 logging.warning(ex)
-            line = logfile.readline()
-    logging.info("parsed %d lines", num_of_line)
-    return logs
+    else:
+        position[:] = [offset, num_of_line]
+        for line in lines:
+            num_of_line += 1
+            offset += len(line) + 1
+            position[0] = offset
+            position[1] = num_of_line
+            try:
+                yield parse_line(log_file_path, num_of_line, line)
+            except CannotParseLogLineException as ex:
+                logging.warning(ex)
+    logging.info("parsed %d lines", num_of_line - start[1])
+    if counter is not None:
+        counter[0] = num_of_line - start[1]
 
 
-def open_log_file_fn(file_path):
-    file_type = magic.from_file(file_path)
-    if file_type.startswith('gzip compressed data'):
-        return lambda fp: gzip.open(fp, 'rt', encoding="utf-8",errors='ignore')
-    else:
-        return lambda fp: open(fp)
+SPLIT_SIZE = 64 * 1024 * 1024
 
 
-def parser_tomcat_log_line(log_file_path: str, num_of_line: int, log_line: str, pattern: List[str]) -> LogEntry:
-    entry = LogEntry(log_file_path, num_of_line)
-    line_idx = 0
-    host = None
-    proxy_host = None
-
-    def _parser_word(log_line, start_idx):
-        word = ''
-        i = start_idx
-        for i in range(start_idx, len(log_line)):
-            c = log_line[i]
-            if c != ' ':
-                word += c
-            else:
-                i += 1
-                break
-        return (word, i)
-
-    def _parser_sentence(log_line, start_idx, begin_quote='"', end_quote='"'):
-        sentence = ''
-        if log_line[start_idx] != begin_quote:
-            logging.debug(log_line)
-            logging.debug(pattern)
-            logging.debug(f"{start_idx}+-6 -> {log_line[start_idx-6:start_idx+6]}")
-            raise TypeError(f"Expected {begin_quote} but found {log_line[start_idx]} at {start_idx}")
-        i = start_idx
-        for i in range(start_idx + 1, len(log_line)):
-            c = log_line[i]
-            last_c = log_line[i-1] if i > 0 else ""
-            if c == end_quote and (last_c != '\\'):
-                i += 2  # '"' and ' '
-                break
-            else:
-                sentence += c
-        return (sentence, i)
-
-    for idx, value in enumerate(pattern):
-        if value == '%h':
-            (entry_value, line_idx) = _parser_word(log_line, line_idx)
-            host = entry_value
-            proxy_host = None
-            logging.debug("Capture host %s", host)
-        elif value == '%{X-Forwarded-For}i':
-            (entry_value, line_idx) = _parser_word(log_line, line_idx)
-            proxy_host = entry_value
-            logging.debug("Capture proxy_host %s", proxy_host)
-            host = None
-        elif value == '%u':
-            (entry_value, line_idx) = _parser_word(log_line, line_idx)
-            entry.user = entry_value
-        elif value == '%t':
-            (entry_value, line_idx) = _parser_sentence(log_line, line_idx, begin_quote='[', end_quote=']')
-            entry.time = datetime.strptime(entry_value, '%d/%b/%Y:%H:%M:%S %z')
-        elif value == '"%r"':
-            (entry_value, line_idx) = _parser_sentence(log_line, line_idx)
-            entry.request = entry_value
-        elif value == '%s' or value == '%>s':
-            (entry_value, line_idx) = _parser_word(log_line, line_idx)
-            entry.status = int(entry_value)
-        elif value == '%b':
-            (entry_value, line_idx) = _parser_word(log_line, line_idx)
-            entry.byte = int(entry_value)
-        elif value == '"%{User-Agent}i"':
-            (entry_value, line_idx) = _parser_sentence(log_line, line_idx)
-            entry.user_agent = entry_value
-        else:
-            if value.startswith('"'):
-                logging.debug("ignore sentence pattern %s", value)
-                (entry_value, line_idx) = _parser_sentence(log_line, line_idx)
+def iter_log_files(log_file_paths: List[str], log_pattern, workers: int = 1, split_size: int = SPLIT_SIZE,
+                   decompress_commands: Dict[str, str] = None, fields: Set[str] = None,
+                   starts: Dict[str, Tuple[int, int]] = None, positions: Dict[str, List[int]] = None,
+                   hash_files: Set[str] = None, hashes: Dict[str, str] = None) -> Iterator[LogEntry]:
+    """
+        parses log files and yields their log entries. With `workers' > 1 the files are parsed concurrently
+        in a pool of `workers' processes, `workers' files at a time. The entries of these files are merged
+        in chronological order, so that the next files can be parsed while the entries are judged.
+        The files must be given in chronological order, as `cli.filter_processed_files' does.
+
+        Uncompressed files larger than `split_size' bytes are split into byte ranges (see `split_log_file'),
+        which are also parsed concurrently. The entries of the ranges are put together in order of their lines,
+        with the same line numbers as if the file were parsed at once.
+
+        Workers write the parsed entries into temporary files in chunks of `SPOOL_CHUNK_SIZE' entries, which are
+        read back one chunk at a time, so that parsed files are not kept in memory.
+    :param log_file_paths: paths of log files
+    :param log_pattern: log pattern of the files, see `parse_log_file'
+    :param workers: number of processes to parse files
+    :param split_size: minimal size of uncompressed files in bytes, which are split into ranges
+    :param decompress_commands: commands to decompress files, see `open_log_file_fn'
+    :param fields: attributes of `LogEntry' to be parsed, see `compile_log_pattern'
+    :param starts: path -> start of the file, see `iter_log_file'
+    :param positions: if given, path -> position after the last read line of the file, see `iter_log_file'.
+        With `workers' > 1 the position of a file is known when all entries of the file are read; files, which
+        cannot be read, are skipped and have no position.
+    :param hash_files: paths of files, which are hashed by SHA-256 while they are read, see `iter_log_file'.
+        These files are not split.
+    :param hashes: path -> hex digest of the files in `hash_files', which are read completely
+    :return: generator of log entries
+    """
+    starts = starts or {}
+    hash_files = hash_files or set()
+    if workers <= 1:
+        for log_file_path in log_file_paths:
+            position = None if positions is None else positions.setdefault(log_file_path, [0, 0])
+            hasher = hashlib.sha256() if log_file_path in hash_files else None
+            yield from iter_log_file(log_file_path, log_pattern, decompress_commands, fields,
+                                     starts.get(log_file_path, (0, 0)), position, hasher)
+            if hasher is not None and hashes is not None:
+                hashes[log_file_path] = hasher.hexdigest()
+        return
+    by_time = is_time_ordered(log_pattern)
+    if by_time and fields is not None:
+        # time is needed to merge the files
+        fields = set(fields) | {'time'}
+
+    # a last line without newline may be written just now, it is read by the run continuing at the position
+    partial = positions is None
+
+    def submit(log_file_path):
+        start = starts.get(log_file_path, (0, 0))
+        if is_compressed(log_file_path) or log_file_path in hash_files:
+            return [pool.submit(_parse_log_file_task, log_file_path, log_pattern, by_time, None, decompress_commands,
+                                fields, start, log_file_path in hash_files, partial)]
+        return [pool.submit(_parse_log_file_task, log_file_path, log_pattern, by_time, r, decompress_commands, fields,
+                            (0, 0), False, partial)
+                for r in split_log_file(log_file_path, split_size, start[0])]
+
+    def join(log_file_path, futures):
+        position = None if positions is None else positions.setdefault(log_file_path, [0, 0])
+        digests = []
+        try:
+            yield from _join_ranges(futures, starts.get(log_file_path, (0, 0)), position, digests)
+        except CannotReadLogFileException as ex:
+            logging.error("Cannot read file %s: %s", log_file_path, ex)
+            if positions is not None:
+                del positions[log_file_path]
+            return
+        if len(digests) > 0 and hashes is not None:
+            hashes[log_file_path] = digests[0]
+
+    windows = [log_file_paths[i:i + workers] for i in range(0, len(log_file_paths), workers)]
+    submitted = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = []
+            for idx, window in enumerate(windows):
+                if idx == 0:
+                    futures = [submit(p) for p in window]
+                    submitted += futures
+                parsed_files = [join(p, f) for p, f in zip(window, futures)]
+                if idx + 1 < len(windows):
+                    futures = [submit(p) for p in windows[idx + 1]]
+                    submitted += futures
+                yield from merge_log_entries(parsed_files, by_time)
+    finally:
+        # spool files of ranges, which are not read, e.g. if the generator is closed
+        for future in itertools.chain(*submitted):
+            if not future.cancelled() and future.exception() is None:
+                _remove_spool(future.result()[0])
+
+
+def split_log_file(log_file_path: str, split_size: int = SPLIT_SIZE, start: int = 0) -> List[Tuple[int, int]]:
+    """
+        splits an uncompressed file from byte offset `start' on into byte ranges `(start, end)' of about
+        `split_size' bytes. Every range but the last one ends with a newline.
+    """
+    size = os.path.getsize(log_file_path)
+    if size - start <= split_size:
+        return [(start, max(start, size))]
+    byte_ranges = []
+    with open(log_file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        while start < size:
+            newline = mm.find(b'\n', start + split_size - 1)
+            end = size if newline < 0 else newline + 1
+            byte_ranges.append((start, end))
+            start = end
+    return byte_ranges
+
+
+def is_time_ordered(log_pattern) -> bool:
+    """
+        True if the lines of the log pattern have a time, so that entries of several files can be merged by time
+    """
+    return '%t' in _split_log_pattern(log_pattern)
+
+
+def merge_log_entries(parsed_files: List[Iterable[LogEntry]], by_time: bool = True) -> Iterator[LogEntry]:
+    """
+        merges the log entries of several files, each of them sorted by time, into one chronological sequence.
+        Entries with the same time are taken in the order of the files, entries whose time cannot be parsed
+        are skipped.
+    :param parsed_files: log entries of files
+    :param by_time: False if the entries do not have a time, then the files are simply concatenated
+    """
+    if by_time:
+        return heapq.merge(*[_timed_entries(p) for p in parsed_files], key=_entry_time)
+    return itertools.chain(*parsed_files)
+
+
+def _entry_time(entry: LogEntry) -> datetime:
+    return entry.time
+
+
+def _timed_entries(logs: Iterable[LogEntry]) -> Iterator[LogEntry]:
+    """
+        skips entries whose time cannot be parsed, they cannot be merged by time
+    """
+    for entry in logs:
+        try:
+            entry.time
+        except CannotParseLogLineException as ex:
+            logging.warning(ex)
+            continue
+        yield entry
+
+
+def _join_ranges(futures: List[Future], start: Tuple[int, int] = (0, 0), position: List[int] = None,
+                 digests: List[str] = None) -> Iterator[LogEntry]:
+    """
+        yields the entries of the ranges of a file in order, and shifts their line numbers by the number
+        of lines in the previous ranges. The position after the last range is stored in `position', if given,
+        the hash computed by the task of a file in `digests'.
+    """
+    offset = start[1]
+    num_of_byte = start[0]
+    for future in futures:
+        spool_path, num_of_line, num_of_range_byte, digest = future.result()
+        if digest is not None and digests is not None:
+            digests.append(digest)
+        try:
+            for entry in _read_spool(spool_path):
+                entry.line += offset
+                yield entry
+        finally:
+            _remove_spool(spool_path)
+        offset += num_of_line
+        num_of_byte += num_of_range_byte
+    if position is not None:
+        position[:] = [num_of_byte, offset]
+
+
+def _parse_log_file_task(log_file_path: str, log_pattern, decode_time: bool, byte_range: Tuple[int, int] = None,
+                         decompress_commands: Dict[str, str] = None, fields: Set[str] = None,
+                         start: Tuple[int, int] = (0, 0), hash_content: bool = False, partial: bool = True) \
+        -> Tuple[str, int, int, str]:
+    """
+        parses a whole file after `start' (see `iter_log_file'), or only a byte range of an uncompressed file,
+        in a worker process. Line numbers of the entries are counted from the beginning of the range or `start'.
+        The entries are written into a temporary spool file, see `_read_spool'.
+    :param hash_content: hash the whole file by SHA-256 while it is read
+    :param partial: whether a last line without newline of an uncompressed file is read, see `iter_lines'
+    :return: the path of the spool file, the number of lines and the number of bytes in the file (after `start')
+        or range, and the hex digest of the file if `hash_content' is True, otherwise None
+    """
+    counter = [0]
+    position = [0, 0]
+    hasher = hashlib.sha256() if hash_content and byte_range is None else None
+    spool = tempfile.NamedTemporaryFile(prefix="find2deny-", suffix=".spool", delete=False)
+    try:
+        with spool:
+            if byte_range is None:
+                file_reader_fn = open_log_file_fn(log_file_path, binary=True,
+                                                  decompress_commands=decompress_commands, hasher=hasher)
+                partial = partial or is_compressed(log_file_path)
+                with file_reader_fn(log_file_path) as logfile:
+                    _skip_bytes(logfile, start[0])
+                    _write_spool(spool, _parse_lines(log_file_path, log_pattern, iter_lines(logfile, partial=partial),
+                                                     counter, fields, (0, 0), position), decode_time)
             else:
-                logging.debug("ignore word pattern %s", value)
-                (entry_value, line_idx) = _parser_word(log_line, line_idx)
-        logging.debug("parsed entry: %s", entry_value)
+                range_start, range_end = byte_range
+                if range_end > range_start:
+                    with open(log_file_path, 'rb') as f, \
+                            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        # only the last range may end with a line without newline
+                        lines = iter_lines(io.BytesIO(mm[range_start:range_end]), partial=partial)
+                        _write_spool(spool, _parse_lines(log_file_path, log_pattern, lines, counter, fields, (0, 0),
+                                                         position), decode_time)
+    except BaseException:
+        _remove_spool(spool.name)
+        raise
+    return spool.name, counter[0], position[0], None if hasher is None else hasher.hexdigest()
+
+
+# number of entries, which are written into a spool file at once
+SPOOL_CHUNK_SIZE = 16384
+
+
+def _write_spool(spool, logs: Iterable[LogEntry], decode_time: bool):
+    if decode_time:
+        # decode time in worker process, it is needed to merge the files
+        logs = _timed_entries(logs)
+    logs = iter(logs)
+    while True:
+        chunk = list(itertools.islice(logs, SPOOL_CHUNK_SIZE))
+        if len(chunk) == 0:
+            return
+        pickle.dump(chunk, spool, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _read_spool(spool_path: str) -> Iterator[LogEntry]:
+    """
+        reads the entries written by `_write_spool' one chunk at a time
+    """
+    with open(spool_path, 'rb') as spool:
+        while True:
+            try:
+                chunk = pickle.load(spool)
+            except EOFError:
+                return
+            yield from chunk
+
+
+def _remove_spool(spool_path: str):
+    try:
+        os.remove(spool_path)
+    except FileNotFoundError:
+        pass
+
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def iter_lines(binary_file, chunk_size: int = READ_CHUNK_SIZE, partial: bool = True) -> Iterator[bytes]:
+    """
+        reads a binary file in chunks of `chunk_size' bytes and splits them into lines.
+    :param binary_file: a file like object opened in binary mode
+    :param chunk_size: size of a chunk in bytes
+    :param partial: whether a last line without newline is yielded, it may be incomplete if the file is written
+    :return: generator of lines without the trailing newline
+    """
+    rest = b''
+    read = binary_file.read
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            break
+        lines = (rest + chunk).split(b'\n')
+        rest = lines.pop()
+        yield from lines
+    if rest and partial:
+        yield rest
+
+
+class LogFollower:
+    """
+        follows growing uncompressed log files like `tail -F': each `poll' parses the complete lines, which were
+        appended to the files since the last poll, at most `READ_CHUNK_SIZE' bytes of each file. The rest is read
+        by the next polls.
+
+        A file is identified by `file_identity', its position is loaded by `load_position' when it is opened and
+        stored by `save_position' when `checkpoint' is called. A log rotation is detected by a new inode behind
+        the path, then the rest of the old file is read before the new file is opened. If a file shrinks below the
+        read position (e.g. by `copytruncate'), it is read again from its beginning.
+    """
+
+    def __init__(self, log_file_paths: List[str], log_pattern, fields: Set[str] = None,
+                 load_position: Callable[[str], Tuple[int, int]] = None,
+                 save_position: Callable[[str, str, Tuple[int, int]], None] = None):
+        self._parse_line = compile_log_pattern(log_pattern, binary=True, fields=fields)
+        self._load_position = load_position or (lambda file_id: (0, 0))
+        self._save_position = save_position or (lambda file_id, path, position: None)
+        self._files = [_FollowedFile(p) for p in log_file_paths]
+        # identity -> (path, position) of files read since the last checkpoint
+        self._positions: Dict[str, Tuple[str, Tuple[int, int]]] = {}
+
+    def poll(self) -> List[LogEntry]:
+        """
+        :return: log entries of the lines appended since the last poll
+        """
+        logs = []
+        reopen = []
+        for followed in self._files:
+            try:
+                stat = os.stat(followed.path)
+            except FileNotFoundError:
+                stat = None
+            if followed.file is not None:
+                rotated = stat is None or (stat.st_dev, stat.st_ino) != followed.inode
+                truncated = not rotated and stat.st_size < followed.position[0] + len(followed.rest)
+                if not truncated:
+                    entries, complete = self._read(followed)
+                    logs += entries
+                    if rotated and not complete:
+                        # the rest of the rotated file is read by the next polls
+                        continue
+                if rotated or truncated:
+                    logging.info("File %s is %s", followed.path, "rotated" if rotated else "truncated")
+                    followed.close()
+                    if truncated:
+                        followed.truncated = True
+            if followed.file is None and stat is not None:
+                reopen.append(followed)
+        # new files are opened after the rest of rotated files is read, whose positions they may continue
+        for followed in reopen:
+            logs += self._open(followed)
+        return logs
+
+    def _open(self, followed: '_FollowedFile') -> List[LogEntry]:
+        try:
+            followed.file = open(followed.path, 'rb')
+        except IOError as ex:
+            logging.warning("Cannot open %s: %s", followed.path, ex)
+            return []
+        stat = os.fstat(followed.file.fileno())
+        followed.inode = (stat.st_dev, stat.st_ino)
+        followed.identity = None if followed.truncated else file_identity(followed.path)
+        followed.truncated = False
+        start = (0, 0)
+        if followed.identity is not None:
+            known = self._positions.get(followed.identity)
+            start = known[1] if known is not None else self._load_position(followed.identity)
+        if start[0] > stat.st_size:
+            start = (0, 0)
+        _skip_bytes(followed.file, start[0])
+        followed.position = list(start)
+        logging.info("Follow file %s from line %d", followed.path, start[1])
+        return self._read(followed)[0]
+
+    def _read(self, followed: '_FollowedFile') -> Tuple[List[LogEntry], bool]:
+        """
+            parses the complete lines of the next chunk of a file
+        :return: the log entries, and whether the end of the file is reached
+        """
+        data = followed.file.read(READ_CHUNK_SIZE)
+        complete = len(data) < READ_CHUNK_SIZE
+        if not data:
+            return [], complete
+        lines = (followed.rest + data).split(b'\n')
+        followed.rest = lines.pop()
+        if len(lines) == 0:
+            return [], complete
+        if followed.identity is None and followed.position[0] == 0:
+            followed.identity = hashlib.sha256(lines[0][:FILE_IDENTITY_SIZE]).hexdigest()
+        logs = []
+        offset, num_of_line = followed.position
+        for line in lines:
+            num_of_line += 1
+            offset += len(line) + 1
+            try:
+                logs.append(self._parse_line(followed.path, num_of_line, line))
+            except CannotParseLogLineException as ex:
+                logging.warning(ex)
+        followed.position = [offset, num_of_line]
+        if followed.identity is not None:
+            self._positions[followed.identity] = (followed.path, (offset, num_of_line))
+        return logs, complete
+
+    def checkpoint(self):
+        """
+            stores the positions of the files read since the last checkpoint
+        """
+        for identity, (path, position) in self._positions.items():
+            self._save_position(identity, path, position)
+        self._positions = {}
+
+    def close(self):
+        for followed in self._files:
+            followed.close()
+
+
+class _FollowedFile:
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+        self.inode = None
+        self.identity = None
+        # [byte offset, line] after the last complete line, and the incomplete line after it
+        self.position = [0, 0]
+        self.rest = b''
+        self.truncated = False
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.file = None
+        self.rest = b''
+
+
+# magic bytes at the beginning of compressed files
+_MAGIC_BYTES = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+)
+
+
+FILE_IDENTITY_SIZE = 4096
+
+
+def file_identity(file_path) -> str or None:
+    """
+        identifies the content of a log file by the SHA-256 hash of its first line (at most `FILE_IDENTITY_SIZE'
+        bytes of the uncompressed content). The identity does not change if lines are appended to the file, if the
+        file is renamed by a log rotation, or if it is compressed later.
+    :return: hex digest of the hash, or None if the file is empty
+    """
+    file_reader_fn = open_log_file_fn(file_path, binary=True)
+    with file_reader_fn(file_path) as logfile:
+        head = logfile.read(FILE_IDENTITY_SIZE)
+    if not head:
+        return None
+    return hashlib.sha256(head.split(b'\n', 1)[0]).hexdigest()
+
+
+def detect_compression(file_path) -> str:
+    """
+        detects the compression format of a file by its first bytes.
+    :return: one of `gzip', `bz2', `xz', `zstd', or None if the file is not compressed
+    """
+    with open(file_path, 'rb') as f:
+        head = f.read(6)
+    return next((name for (magic_bytes, name) in _MAGIC_BYTES if head.startswith(magic_bytes)), None)
+
+
+def is_compressed(file_path) -> bool:
+    return detect_compression(file_path) is not None
 
 
-    # update ip at the last attribute
-    logging.debug("host=%s proxy=%s", host, proxy_host)
+def _zstd_reader(raw):
     try:
-        if proxy_host is not None:
-            logging.debug("use proxy_host %s", proxy_host)
-            entry.ip = ip_to_int(proxy_host)
+        import zstandard
+    except ImportError as ex:
+        raise CannotReadLogFileException(
+            "Package zstandard is required to read zstd compressed files; install it by `pip install zstandard'",
+            errors=ex)
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, read_size=READ_CHUNK_SIZE),
+                             buffer_size=READ_CHUNK_SIZE)
+
+
+_DECOMPRESSORS = {
+    'gzip': lambda raw: gzip.GzipFile(fileobj=raw, mode='rb'),
+    'bz2': lambda raw: bz2.BZ2File(raw, mode='rb'),
+    'xz': lambda raw: lzma.LZMAFile(raw, mode='rb'),
+    'zstd': _zstd_reader
+}
+
+
+def open_log_file_fn(file_path, binary: bool = False, decompress_commands: Dict[str, str] = None, hasher=None):
+    """
+        returns a function to open the given log file, which may be compressed by gzip, bz2, xz or zstd.
+        The opened file yields text lines (UTF-8, undecodable bytes are ignored), or bytes if `binary' is True.
+    :param file_path: path of the log file
+    :param binary: open the file in binary mode
+    :param decompress_commands: compression format -> shell command, which decompresses its standard input to its
+        standard output, e.g. `{"gzip": "pigz -dc"}'; such files are decompressed in a separate process.
+    :param hasher: if given, a hash like `hashlib.sha256()', which is fed with the raw bytes of the file while they
+        are decompressed, so that the file is read only once to be hashed and parsed. When the opened file is
+        closed without an error, the rest of the raw file is hashed, too.
+    """
+    compression = detect_compression(file_path)
+    if compression is None:
+        if hasher is not None:
+            return lambda fp: _open_compressed(fp, lambda raw: io.BufferedReader(raw, READ_CHUNK_SIZE), binary,
+                                               hasher)
+        if binary:
+            return lambda fp: open(fp, 'rb', buffering=READ_CHUNK_SIZE)
+        return lambda fp: open(fp)
+    command = (decompress_commands or {}).get(compression)
+    if command:
+        return lambda fp: _open_by_command(fp, command, binary, hasher)
+    return lambda fp: _open_compressed(fp, _DECOMPRESSORS[compression], binary, hasher)
+
+
+class _TeeReader(io.RawIOBase):
+    """
+        reads a binary file and updates a hash with the read bytes
+    """
+
+    def __init__(self, raw, hasher):
+        self._raw = raw
+        self._hasher = hasher
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        num_of_byte = self._raw.readinto(buffer)
+        if num_of_byte:
+            self._hasher.update(memoryview(buffer)[:num_of_byte])
+        return num_of_byte
+
+    def read_rest(self):
+        """
+            hashes the bytes, which are not read yet, e.g. the trailer of a compressed file
+        """
+        for chunk in iter(lambda: self._raw.read(READ_CHUNK_SIZE), b""):
+            self._hasher.update(chunk)
+
+
+@contextlib.contextmanager
+def _open_compressed(file_path, decompressor, binary: bool, hasher=None):
+    with open(file_path, 'rb', buffering=READ_CHUNK_SIZE) as raw:
+        source = raw if hasher is None else _TeeReader(raw, hasher)
+        with decompressor(source) as decompressed:
+            yield decompressed if binary else io.TextIOWrapper(decompressed, encoding="utf-8", errors='ignore')
+        if hasher is not None:
+            source.read_rest()
+
+
+@contextlib.contextmanager
+def _open_by_command(file_path, command: str, binary: bool, hasher=None):
+    with open(file_path, 'rb') as raw:
+        try:
+            # the raw bytes are hashed while a thread writes them to the command
+            process = subprocess.Popen(shlex.split(command), stdin=raw if hasher is None else subprocess.PIPE,
+                                       stdout=subprocess.PIPE, bufsize=READ_CHUNK_SIZE)
+        except OSError as ex:
+            raise CannotReadLogFileException(
+                "Cannot decompress {} by `{}': {}".format(file_path, command, ex), errors=ex)
+        feeder = None
+        if hasher is not None:
+            feeder = threading.Thread(target=_feed_command, args=(raw, process.stdin, hasher), daemon=True)
+            feeder.start()
+        try:
+            yield process.stdout if binary else io.TextIOWrapper(process.stdout, encoding="utf-8", errors='ignore')
+        finally:
+            process.stdout.close()
+            if feeder is not None:
+                feeder.join()
+            return_code = process.wait()
+            if return_code != 0:
+                logging.warning("`%s' exits with %d by decompressing %s", command, return_code, file_path)
+
+
+def _feed_command(raw, stdin, hasher):
+    try:
+        for chunk in iter(lambda: raw.read(READ_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+            stdin.write(chunk)
+    except BrokenPipeError:
+        # the output of the command is closed before the whole file is read
+        pass
+    finally:
+        try:
+            stdin.close()
+        except BrokenPipeError:
+            pass
+
+
+# regular expressions of the three kinds of token in a log pattern
+_WORD_REGEX = r'[^ \r\n]*'
+_SENTENCE_REGEX = r'"([^"\\]*(?:\\.[^"\\]*)*)"'
+_TIME_REGEX = r'\[([^\]]*)\]'
+
+# log-pattern token -> attribute of LogEntry
+_PATTERN_FIELDS = {
+    '%h': 'ip',
+    '%{X-Forwarded-For}i': 'ip',
+    '%u': 'user',
+    '%t': 'time',
+    '"%r"': 'request',
+    '%s': 'status',
+    '%>s': 'status',
+    '%b': 'byte',
+    '"%{User-Agent}i"': 'user_agent'
+}
+
+
+ACCESS_LOG_TIME_PATTERN = '%d/%b/%Y:%H:%M:%S %z'
+
+_MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+           'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+
+@functools.lru_cache(maxsize=64)
+def _time_zone(offset: str) -> timezone:
+    sign = -1 if offset[0] == '-' else 1
+    minutes = sign * (int(offset[1:3]) * 60 + int(offset[3:5]))
+    return timezone.utc if minutes == 0 else timezone(timedelta(minutes=minutes))
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_access_log_time(value: str) -> datetime:
+    """
+        converts a timestamp of an access log like `27/Mar/2019:13:11:45 +0100' into a `datetime'. The result is
+        the same as `datetime.strptime(value, '%d/%b/%Y:%H:%M:%S %z')', but the fixed layout is decoded by slicing,
+        and recently parsed timestamps are cached, since a busy server writes many lines in the same second.
+        Timestamps in other layouts are given to `strptime'.
+    :param value: timestamp in access log
+    :return: the timestamp as `datetime'
+    """
+    month = _MONTHS.get(value[3:6])
+    if len(value) == 26 and month is not None and value[2] == value[6] == '/' \
+            and value[11] == value[14] == value[17] == ':' and value[20] == ' ' and value[21] in '+-':
+        try:
+            return datetime(int(value[7:11]), month, int(value[0:2]),
+                            int(value[12:14]), int(value[15:17]), int(value[18:20]),
+                            tzinfo=_time_zone(value[21:26]))
+        except ValueError:
+            pass
+    return datetime.strptime(value, ACCESS_LOG_TIME_PATTERN)
+
+
+def _parse_byte(value: str or bytes) -> int:
+    return 0 if value in _NO_BYTE else int(value)
+
+
+_NO_BYTE = ('-', b'-')
+
+
+# `time' is not listed, it is converted lazily by `LogEntry'
+_FIELD_CONVERTERS = {
+    'status': int,
+    'byte': _parse_byte
+}
+
+
+def _split_log_pattern(log_pattern: str or List[str]) -> List[str]:
+    if isinstance(log_pattern, str):
+        return log_pattern.replace('&quot;', '"').split(' ')
+    return list(log_pattern)
+
+
+def compile_log_pattern(log_pattern: str or List[str], binary: bool = False, fields: Set[str] = None):
+    """
+        compiles a log pattern like `%h %l %u %t "%r" %>s %O "%{Referer}i" "%{User-Agent}i"' into
+        a function `parse(log_file_path, num_of_line, log_line) -> LogEntry', which can be reused for
+        every line of a log file. A pattern can be given as string or as list of its tokens.
+
+        Tokens, which are not used by `LogEntry', are only jumped over. If `%h' and `%{X-Forwarded-For}i'
+        are both given, the last one in the pattern is used as ip of the log entry. The timestamp is kept
+        as raw string in the log entry and is converted when it is read.
+
+        If `binary' is True, the returned function parses lines given as bytes. Only the ip, the status and the
+        response length are decoded by parsing, all other fields are kept as bytes and are decoded when they
+        are read from the log entry.
+
+        If `fields' is given, only these attributes of `LogEntry' (and the ip) are taken from a line, tokens of other
+        attributes are jumped over like unknown tokens, the attributes keep their default values.
+    :param log_pattern: log pattern as string or list of tokens
+    :param binary: whether lines are given as bytes
+    :param fields: names of attributes of `LogEntry', which are needed, or None for all attributes
+    :return: a function to parse a line of a log file
+    """
+    tokens = _split_log_pattern(log_pattern)
+    captured_at = {}
+    for idx, token in enumerate(tokens):
+        field = _PATTERN_FIELDS.get(token)
+        if field is not None and (fields is None or field == 'ip' or field in fields):
+            captured_at[field] = idx
+    regex_parts = []
+    for idx, token in enumerate(tokens):
+        field = _PATTERN_FIELDS.get(token)
+        if token == '%t':
+            regex = _TIME_REGEX
+        elif token.startswith('"'):
+            regex = _SENTENCE_REGEX
+        else:
+            regex = '(' + _WORD_REGEX + ')'
+        if field is not None and captured_at.get(field) == idx:
+            regex = regex.replace('(', '(?P<{}>'.format(field), 1)
         else:
-            logging.debug("use host %s", host)
-            entry.ip = ip_to_int(host)
+            regex = regex.replace('(', '(?:', 1)
+        regex_parts.append(regex)
+    regex = ' '.join(regex_parts)
+    matcher = re.compile(regex.encode() if binary else regex).match
+    converters = [(f, c) for (f, c) in _FIELD_CONVERTERS.items() if f in captured_at]
+    has_ip = 'ip' in captured_at
+    convert_ip = _bytes_to_int if binary else ip_to_int
+
+    def parse(log_file_path: str, num_of_line: int, log_line: str) -> LogEntry:
+        m = matcher(log_line)
+        if m is None:
+            raise CannotParseLogLineException(log_file_path, num_of_line,
+                                              "line does not match log pattern {}".format(tokens))
+        values = m.groupdict()
+        try:
+            values['ip'] = convert_ip(values['ip']) if has_ip else ip_to_int(None)
+        except ipaddress.AddressValueError as ex:
+            raise CannotParseLogIpException(log_file_path, num_of_line, str(ex), errors=ex)
+        try:
+            for field, convert in converters:
+                values[field] = convert(values[field])
+        except ValueError as ex:
+            raise CannotParseLogLineException(log_file_path, num_of_line, str(ex), errors=ex)
+        return LogEntry(log_file_path, num_of_line, **values)
 
-        return entry
-    except ipaddress.AddressValueError as ex:
-        raise CannotParseLogIpException(log_file_path, num_of_line, str(ex), errors=ex)
+    return parse
 
 
+@functools.lru_cache(maxsize=65536)
+def _bytes_to_int(ip: bytes) -> int:
+    # latin-1 never fails, non ascii characters are rejected by ip_to_int
+    return ip_to_int(ip.decode('latin-1'))
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_compile_log_pattern(tokens: Tuple[str, ...]):
+    return compile_log_pattern(list(tokens))
+
+
+def parser_tomcat_log_line(log_file_path: str, num_of_line: int, log_line: str, pattern: List[str]) -> LogEntry:
+    parse = _cached_compile_log_pattern(tuple(_split_log_pattern(pattern)))
+    return parse(log_file_path, num_of_line, log_line)
+
+
+_IPV4_MAX = 2 ** 32 - 1
+
+
+@functools.lru_cache(maxsize=65536)
 def ip_to_int(ip: str) -> int:
     """
-    (2^(8*3))*a + (2^(8*2))*b + (2^8)*c + d
-    :param ip:
-    :return:
+    converts an IPv4 or IPv6 address into an integer. An IPv4 address a.b.c.d is converted into
+    (2^(8*3))*a + (2^(8*2))*b + (2^8)*c + d, an IPv6 address into its 128 bit value.
+    IPv4-mapped IPv6 addresses (e.g. `::ffff:1.2.3.4', as logged by dual-stack servers)
+    are converted like the embedded IPv4 address.
+
+    Note: IPv6 addresses less than 2^32 (e.g. `::1') cannot be distinguished from IPv4 addresses.
+    :param ip: the ip as string
+    :return: the ip as integer
     """
-    return int(ipaddress.IPv4Address(ip))
+    try:
+        if ':' in ip:
+            ip_int = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big')
+            return ip_int & _IPV4_MAX if (ip_int >> 32) == 0xffff else ip_int
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+    except (OSError, TypeError, ValueError) as ex:
+        raise ipaddress.AddressValueError("{!r} is not an IPv4 or IPv6 address".format(ip)) from ex
 
 
+@functools.lru_cache(maxsize=65536)
 def int_to_ip(ip: int) -> str:
-    return str(ipaddress.IPv4Address(ip))
+    if ip <= _IPV4_MAX:
+        return socket.inet_ntop(socket.AF_INET, ip.to_bytes(4, 'big'))
+    return socket.inet_ntop(socket.AF_INET6, ip.to_bytes(16, 'big'))
 
 
-class CannotParseLogIpException(Exception):
-    def __init__(self,log_file, line, message, errors=None):
+def ip_to_db(ip: int) -> int or bytes:
+    """
+        converts an ip from `ip_to_int' into the value stored in the column `ip' of the database:
+        IPv4 as integer, IPv6 as 16 bytes blob, since SQLite integers have only 64 bits.
+    """
+    return ip if ip <= _IPV4_MAX else ip.to_bytes(16, 'big')
+
+
+def db_to_ip(value: int or bytes) -> int:
+    """
+        inverse of `ip_to_db'
+    """
+    return value if isinstance(value, int) else int.from_bytes(value, 'big')
+
+
+class CannotParseLogLineException(Exception):
+    def __init__(self, log_file, line, message, errors=None):
         self.message = "({},{}) {}".format(log_file, line, message)
         self.errors = errors
-        super(CannotParseLogIpException, self).__init__(self.message)
+        self._args = (log_file, line, message, errors)
+        super(CannotParseLogLineException, self).__init__(self.message)
+
+    def __reduce__(self):
+        # the exception is raised in worker processes, see `iter_log_files'
+        return self.__class__, self._args
+
+
+class CannotParseLogIpException(CannotParseLogLineException):
+    def __init__(self,log_file, line, message, errors=None):
+        super(CannotParseLogIpException, self).__init__(log_file, line, message, errors=errors)
+
+
+class CannotReadLogFileException(Exception):
+    def __init__(self, message, errors=None):
+        self.message = message
+        self.errors = errors
+        super(CannotReadLogFileException, self).__init__(message)
@@ -0,0 +1,123 @@
+# -*- encoding:utf8 -*-
+
+import bisect
+import ipaddress
+from typing import Any, Dict, List, Tuple
+
+
+_MAX_IPV4 = 2 ** 32 - 1
+
+
+class NetworkIndex:
+    """
+        maps IP networks to values and finds the value of the most specific network containing an IP.
+
+        IPs are given as integers like `log_parser.ip_to_int' returns them. For each version of IP and each prefix
+        length there is a dict from network address to value, so a lookup costs at most one dict access per distinct
+        prefix length, independent of the number of networks.
+    """
+    def __init__(self):
+        # version -> prefix length -> network address -> value
+        self._networks: Dict[int, Dict[int, Dict[int, Any]]] = {4: {}, 6: {}}
+        # version -> prefix lengths in descending order
+        self._prefix_lengths: Dict[int, List[int]] = {4: [], 6: []}
+        self._size = 0
+
+    def add(self, network: str or ipaddress.IPv4Network or ipaddress.IPv6Network, value: Any):
+        """
+            adds a network to the index. If the network is already in the index, its value is not changed.
+        :param network: network as string (CIDR notation or a single IP) or `ipaddress' network
+        :param value: value to be returned by `lookup'
+        :raise ValueError: if network is not a valid network
+        """
+        if isinstance(network, str):
+            parsed = parse_network(network)
+            if parsed is None:
+                raise ValueError(f"{network} is not a valid network")
+            network = parsed
+        version = network.version
+        by_address = self._networks[version].setdefault(network.prefixlen, {})
+        if network.prefixlen not in self._prefix_lengths[version]:
+            self._prefix_lengths[version] = sorted(self._networks[version].keys(), reverse=True)
+        address = int(network.network_address)
+        if address not in by_address:
+            by_address[address] = value
+            self._size += 1
+
+    def lookup(self, ip: int, default: Any = None) -> Any:
+        """
+            finds the value of the network with the longest prefix, which contains the given ip
+        :param ip: ip as integer
+        :param default: value returned if no network contains the ip
+        :return: value of the network or `default'
+        """
+        version, bits = (4, 32) if ip <= _MAX_IPV4 else (6, 128)
+        networks = self._networks[version]
+        for prefix_length in self._prefix_lengths[version]:
+            value = networks[prefix_length].get(ip >> (bits - prefix_length) << (bits - prefix_length))
+            if value is not None:
+                return value
+        return default
+
+    def __contains__(self, ip: int) -> bool:
+        return self.lookup(ip) is not None
+
+    def __len__(self):
+        return self._size
+
+
+def parse_network(network: str) -> ipaddress.IPv4Network or ipaddress.IPv6Network or None:
+    """
+        parses a network in CIDR notation or a single IP, IPv4-mapped IPv6 networks are converted into IPv4 networks
+        like `log_parser.ip_to_int' converts IPs.
+    :param network: network as string
+    :return: network or None if the string is not a network
+    """
+    try:
+        network = ipaddress.ip_network(network)
+    except ValueError:
+        return None
+    if network.version == 6 and network.network_address.ipv4_mapped is not None and network.prefixlen >= 96:
+        return ipaddress.ip_network(
+            "{}/{}".format(network.network_address.ipv4_mapped, network.prefixlen - 96))
+    return network
+
+
+class RangeIndex:
+    """
+        maps non-overlapping ranges of IPs (as integers) to values, a lookup is a binary search over the sorted
+        starts of the ranges. Ranges must be added in ascending order, as they are in sorted data sets.
+    """
+    def __init__(self):
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        self._values: List[Any] = []
+
+    def add(self, start: int, end: int, value: Any):
+        """
+            adds the range `[start, end]' (both inclusive)
+        :raise ValueError: if the range does not start after the last added range
+        """
+        if end < start or (len(self._ends) > 0 and start <= self._ends[-1]):
+            raise ValueError(f"range [{start}, {end}] is empty or overlaps the previous range")
+        self._starts.append(start)
+        self._ends.append(end)
+        self._values.append(value)
+
+    def lookup(self, ip: int, default: Any = None) -> Any:
+        idx = bisect.bisect_right(self._starts, ip) - 1
+        if idx >= 0 and ip <= self._ends[idx]:
+            return self._values[idx]
+        return default
+
+    def range_of(self, ip: int) -> Tuple[int, int] or None:
+        """
+            returns the range `(start, end)' containing the ip, or None
+        """
+        idx = bisect.bisect_right(self._starts, ip) - 1
+        if idx >= 0 and ip <= self._ends[idx]:
+            return self._starts[idx], self._ends[idx]
+        return None
+
+    def __len__(self):
+        return len(self._starts)
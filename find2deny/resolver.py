@@ -0,0 +1,292 @@
+# -*- encoding:utf8 -*-
+
+import ipaddress
+import logging
+import queue
+import re
+import sqlite3
+import time
+import urllib.error
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from . import db_connection
+from . import log_parser
+from . network_index import NetworkIndex, RangeIndex, parse_network
+
+
+LOGGER = logging.getLogger(__name__)
+
+_MAX_IPV4 = 2 ** 32 - 1
+
+
+class AbstractResolver(ABC):
+    """
+        finds the network, to which an IP belongs
+    """
+
+    @abstractmethod
+    def resolve(self, ip: str) -> str or None:
+        """
+        :param ip: IP as string
+        :return: network(s) of the IP in CIDR notation, or None if the network cannot be found
+        """
+        pass
+
+    def resolve_cached(self, ip: str) -> str or None:
+        """
+            finds the network of an IP quickly without a lookup, e.g. in a cache. `AsyncResolver' calls it
+            in the main thread.
+        :return: network or None if the network must be looked up by `resolve_uncached'
+        """
+        return None
+
+    def resolve_uncached(self, ip: str) -> str or None:
+        """
+            looks up the network of an IP. `AsyncResolver' calls it in worker threads, so it must not use the
+            database connection.
+        """
+        return self.resolve(ip)
+
+    def store(self, ip: str, network: str):
+        """
+            stores the result of `resolve_uncached', `AsyncResolver' calls it in the main thread.
+        """
+        pass
+
+
+class RdapResolver(AbstractResolver):
+    """
+        looks up networks by RDAP over the internet
+    """
+
+    def resolve(self, ip: str) -> str or None:
+        from ipwhois import IPWhois, exceptions, ASNRegistryError
+        try:
+            who = IPWhois(ip).lookup_rdap()
+            cidr = who["network"]["cidr"]
+            asn_cidr = who["asn_cidr"]
+            return cidr if cidr == asn_cidr else (cidr + ' ' + asn_cidr)
+        except (urllib.error.HTTPError, exceptions.HTTPLookupError, exceptions.IPDefinedError, ASNRegistryError) as ex:
+            LOGGER.warning("RDAP lookup for %s fail", ip)
+            LOGGER.debug(ex)
+            return None
+
+    def __str__(self):
+        return "RdapResolver"
+
+
+class Ip2AsnResolver(AbstractResolver):
+    """
+        looks up networks in a local data set of IP ranges announced by autonomous systems, like the
+        files of https://iptoasn.com (`ip2asn-v4.tsv', `ip2asn-combined.tsv', may be compressed). Each line contains
+        tab separated the first IP, the last IP, the AS number, the country code and the AS description.
+        Ranges of AS number 0 are not routed and ignored.
+
+        The range of an IP is found by binary search, the network is the list of CIDRs covering the range.
+    """
+
+    def __init__(self, ip2asn_path: str):
+        self._path = ip2asn_path
+        self._ranges = RangeIndex()
+        rows = []
+        file_reader_fn = log_parser.open_log_file_fn(ip2asn_path)
+        try:
+            with file_reader_fn(ip2asn_path) as f:
+                for num_of_line, line in enumerate(f, 1):
+                    columns = line.rstrip('\n').split('\t')
+                    if len(columns) < 3 or columns[2] == '0':
+                        continue
+                    try:
+                        start, end = log_parser.ip_to_int(columns[0]), log_parser.ip_to_int(columns[1])
+                    except ipaddress.AddressValueError:
+                        LOGGER.warning("(%s,%d) invalid IP range", ip2asn_path, num_of_line)
+                        continue
+                    if (start <= _MAX_IPV4) != (end <= _MAX_IPV4):
+                        # IPv6 ranges overlapping the IPv4 integers
+                        continue
+                    rows.append((start, end, int(columns[2])))
+        except (IOError, ValueError) as ex:
+            raise ResolverException(f"Cannot read ip2asn file {ip2asn_path}", ex)
+        rows.sort()
+        for start, end, asn in rows:
+            try:
+                self._ranges.add(start, end, asn)
+            except ValueError:
+                LOGGER.warning("Range %s - %s of AS%d overlaps previous range",
+                               log_parser.int_to_ip(start), log_parser.int_to_ip(end), asn)
+        LOGGER.info("Loaded %d IP ranges from %s", len(self._ranges), ip2asn_path)
+
+    def resolve(self, ip: str) -> str or None:
+        ip_range = self._ranges.range_of(log_parser.ip_to_int(ip))
+        if ip_range is None:
+            return None
+        return ", ".join(str(n) for n in _range_networks(*ip_range))
+
+    def asn(self, ip: str) -> int or None:
+        """
+            returns the AS number of the range containing the ip, or None
+        """
+        return self._ranges.lookup(log_parser.ip_to_int(ip))
+
+    def __str__(self):
+        return "Ip2AsnResolver/{}".format(self._path)
+
+
+def _range_networks(start: int, end: int):
+    if end <= _MAX_IPV4:
+        return ipaddress.summarize_address_range(ipaddress.IPv4Address(start), ipaddress.IPv4Address(end))
+    return ipaddress.summarize_address_range(ipaddress.IPv6Address(start), ipaddress.IPv6Address(end))
+
+
+class ChainedResolver(AbstractResolver):
+    """
+        asks the given resolvers one after another, e.g. a local data set and RDAP as fallback
+    """
+
+    def __init__(self, resolvers: List[AbstractResolver]):
+        self._resolvers = resolvers
+
+    def resolve(self, ip: str) -> str or None:
+        for resolver in self._resolvers:
+            network = resolver.resolve(ip)
+            if network is not None:
+                return network
+        return None
+
+    def __str__(self):
+        return "ChainedResolver/{}".format(", ".join(str(r) for r in self._resolvers))
+
+
+class CachedResolver(AbstractResolver):
+    """
+        caches the networks found by another resolver in the table `resolved_network' for `ttl_seconds' seconds.
+        The networks of the cache are kept in a `NetworkIndex', so an IP in an already resolved network is answered
+        from the index without asking the other resolver.
+
+        A result like `54.36.148.0/22 54.36.0.0/16' of RDAP (network and network of the AS) is indexed by its first
+        network only, a list of networks like `134.97.0.0/29, 134.97.0.8/31' by all of them.
+    """
+
+    def __init__(self, ip_resolver: AbstractResolver, conn: sqlite3.Connection, ttl_seconds: int = 30 * 24 * 3600):
+        self._resolver = ip_resolver
+        self.conn = conn
+        self.ttl = ttl_seconds
+        self._networks = NetworkIndex()
+        expired_before = int(time.time()) - ttl_seconds
+        try:
+            rows = conn.execute("SELECT network, result FROM resolved_network WHERE resolved_at >= ?",
+                                (expired_before,)).fetchall()
+            db_connection.get_writer(conn).execute("DELETE FROM resolved_network WHERE resolved_at < ?",
+                                                   (expired_before,))
+        except sqlite3.OperationalError as ex:
+            raise ResolverException(
+                "Access to Sqlite Db caused error; Diagnose: use `find2deny-init-db' to create a Database.", ex)
+        for network, result in rows:
+            self._networks.add(network, result)
+        LOGGER.info("Loaded %d resolved networks", len(self._networks))
+
+    def resolve(self, ip: str) -> str or None:
+        result = self.resolve_cached(ip)
+        if result is not None:
+            return result
+        result = self.resolve_uncached(ip)
+        if result is not None:
+            self.store(ip, result)
+        return result
+
+    def resolve_cached(self, ip: str) -> str or None:
+        return self._networks.lookup(log_parser.ip_to_int(ip))
+
+    def resolve_uncached(self, ip: str) -> str or None:
+        return self._resolver.resolve(ip)
+
+    def store(self, ip: str, result: str):
+        resolved_at = int(time.time())
+        writer = db_connection.get_writer(self.conn)
+        # without the network of the AS, which RDAP gives after a space
+        networks = re.sub(r"(?<!,)\s+\S+$", "", result)
+        for network in (parse_network(n) for n in re.split(r",\s*", networks)):
+            if network is not None:
+                self._networks.add(network, result)
+                writer.buffer("INSERT OR REPLACE INTO resolved_network (network, result, resolved_at) VALUES (?, ?, ?)",
+                              (str(network), result, resolved_at))
+
+    def __str__(self):
+        return "CachedResolver/{}".format(self._resolver)
+
+
+class AsyncResolver:
+    """
+        looks up networks in a pool of `workers' threads, so that log entries can be judged while lookups are
+        running. Lookups of the same IP are coalesced into one lookup.
+
+        Results are handed over to the main thread by `drain', which calls the callbacks of the lookups.
+    """
+
+    def __init__(self, ip_resolver: AbstractResolver, workers: int = 8):
+        self._resolver = ip_resolver
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="resolver")
+        # ip -> callbacks waiting for the network of the ip
+        self._pending: Dict[str, List[Callable[[str], None]]] = {}
+        self._done = queue.Queue()
+
+    def submit(self, ip: str, callback: Callable[[str], None]):
+        """
+            looks up the network of an IP. `callback' is called with the network (or None) at once, if the network
+            is cached, otherwise by `drain' after the lookup.
+        """
+        callbacks = self._pending.get(ip)
+        if callbacks is not None:
+            callbacks.append(callback)
+            return
+        network = self._resolver.resolve_cached(ip)
+        if network is not None:
+            callback(network)
+            return
+        self._pending[ip] = [callback]
+        future = self._pool.submit(self._resolver.resolve_uncached, ip)
+        future.add_done_callback(lambda f: self._done.put((ip, f)))
+
+    def drain(self, wait: bool = False) -> int:
+        """
+            calls the callbacks of finished lookups
+        :param wait: wait until all lookups are finished
+        :return: number of finished lookups
+        """
+        count = 0
+        while len(self._pending) > 0:
+            try:
+                ip, future = self._done.get(block=wait)
+            except queue.Empty:
+                break
+            try:
+                network = future.result()
+            except Exception as ex:
+                LOGGER.warning("Lookup for %s fail: %s", ip, ex)
+                network = None
+            if network is not None:
+                self._resolver.store(ip, network)
+            for callback in self._pending.pop(ip):
+                callback(network)
+            count += 1
+        return count
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def shutdown(self):
+        self.drain(wait=True)
+        self._pool.shutdown()
+
+    def __str__(self):
+        return "AsyncResolver/{}".format(self._resolver)
+
+
+class ResolverException(Exception):
+    def __init__(self, message, errors=None):
+        self.message = message
+        self.errors = errors
+        super(ResolverException, self).__init__(message)
@@ -51,8 +51,12 @@ setup(
         ('find2deny',['test-data/rules.toml'])
     ],
     install_requires=[
-        'pendulum', 'ipaddress', 'ipwhois', 'importlib_resources', 'python-magic', 'toml'
+        'pendulum', 'ipaddress', 'ipwhois', 'importlib_resources', 'toml'
     ],
+    extras_require={
+        'zstd': ['zstandard'],
+        'batch': ['numpy']
+    },
     tests_require=['pytest', 'pytest-runner', 'pytest-cov'],
     setup_requires=["pytest-runner"],
     entry_points={
@@ -1,9 +1,15 @@
 import pytest
 import logging
+import bz2
+import gzip
 import sqlite3
 
 from find2deny import cli
 from find2deny import judgment
+from find2deny import execution
+from find2deny import log_batch
+from find2deny import log_parser
+from find2deny import resolver
 
 
 def test_expand_logfiles():
@@ -119,4 +125,219 @@ def test_update_ready_inserted_processed_file_2(prepare_test_data):
         expected_file_path = c.fetchone()[0]
     conn.close()
     assert expected_file_path == file_path
-    pass
\ No newline at end of file
+    pass
+
+def test_iter_logs_checkpoint(tmp_path):
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(read_text("find2deny", "log-data.sql"))
+    log_path = tmp_path / "access.log"
+    with open("test-data/access-log.txt", 'rb') as f:
+        log_path.write_bytes(f.read())
+    config = {"log_pattern": '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b'}
+    logs = cli.iter_logs([("0000", str(log_path))], config, {'request'}, conn)
+    for _ in range(5):
+        next(logs)
+    logs.close()
+    # the fifth entry is not judged yet
+    assert [log.line for log in cli.iter_logs([("0000", str(log_path))], config, {'request'}, conn)][0] == 5
+    assert list(cli.iter_logs([("0000", str(log_path))], config, {'request'}, conn)) == []
+    with open(log_path, 'ab') as f:
+        f.write(b'127.0.0.1 134.96.214.161 - - [27/Mar/2019:13:11:45 +0100] "GET / HTTP/1.1" 200 4286\n')
+    assert [log.line for log in cli.iter_logs([("0000", str(log_path))], config, {'request'}, conn)] == [40]
+    conn.close()
+
+
+def test_follow_log_files(tmp_path):
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(read_text("find2deny", "log-data.sql"))
+    log_path = tmp_path / "access.log"
+    log_path.write_bytes(b'1.1.1.1 - - [27/Mar/2019:13:11:45 +0100] "GET /phpmyadmin/ HTTP/1.1" 404 42\n')
+    script = tmp_path / "block-ip.sh"
+    config = {"log_pattern": '%h %l %u %t "%r" %s %b'}
+    judge = judgment.ChainedIpJudgment(conn, [judgment.PathBasedIpJudgment({"/phpmyadmin/"})])
+    executor = execution.FileBasedUWFBlock(str(script))
+    executor.begin_execute()
+    try:
+        judgment.set_resolver(resolver.ChainedResolver([]))
+        cli.follow_log_files([str(log_path)], config, {'request'}, judge, executor, conn, polls=1)
+        # the block is emitted while the file is followed
+        assert "ufw deny from 1.1.1.1" in script.read_text()
+        with open(log_path, 'ab') as f:
+            f.write(b'2.2.2.2 - - [27/Mar/2019:13:11:46 +0100] "GET /index.html HTTP/1.1" 200 42\n')
+        cli.follow_log_files([str(log_path)], config, {'request'}, judge, executor, conn, polls=1)
+        assert cli.load_checkpoint(log_parser.file_identity(str(log_path)), conn)[1] == 2
+        # the state of the judgments is written with the checkpoint
+        time_based = judgment.SlidingWindowIpJudgment(conn, flush_entries=10000)
+        judge = judgment.ChainedIpJudgment(conn, [time_based])
+        with open(log_path, 'ab') as f:
+            f.write(b'3.3.3.3 - - [27/Mar/2019:13:11:47 +0100] "GET /index.html HTTP/1.1" 200 42\n')
+        cli.follow_log_files([str(log_path)], config, {'time'}, judge, executor, conn, polls=1)
+        assert conn.execute("SELECT COUNT(*) FROM log_ip WHERE ip = ?",
+                            (log_parser.ip_to_int("3.3.3.3"),)).fetchone()[0] == 1
+    finally:
+        judgment.set_resolver(resolver.RdapResolver())
+        judgment._blocked_ips.pop(conn, None)
+        conn.close()
+
+
+def test_filter_processed_files_by_fingerprint(tmp_path, monkeypatch):
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(read_text("find2deny", "log-data.sql"))
+    processed = tmp_path / "access.log.2.gz"
+    processed.write_bytes(gzip.compress(b"processed content\n" * 1000))
+    hash_content = cli.update_processed_file(None, str(processed), conn)
+    assert hash_content == cli.content_hash(str(processed))
+    copied = tmp_path / "access.log.3.gz"
+    copied.write_bytes(processed.read_bytes())
+    new = tmp_path / "access.log.1.gz"
+    new.write_bytes(gzip.compress(b"new content\n"))
+    live = tmp_path / "access.log"
+    live.write_bytes(b"live content\n")
+    hashed = []
+    content_hash = cli.content_hash
+    monkeypatch.setattr(cli, "content_hash", lambda file_path: hashed.append(file_path) or content_hash(file_path))
+    log_files = cli.filter_processed_files([str(p) for p in (processed, copied, new, live)], conn)
+    assert log_files == [(None, str(new)), (None, str(live))]
+    # only the copy of the processed file is hashed, it has another fingerprint but the same sample
+    assert hashed == [str(copied)]
+    conn.close()
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_iter_logs_hashes_while_parsing(tmp_path, monkeypatch, workers):
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(read_text("find2deny", "log-data.sql"))
+    log_path = tmp_path / "access.log.2.gz"
+    with open("test-data/access-log.txt", 'rb') as f:
+        log_path.write_bytes(gzip.compress(f.read()))
+    expected = cli.content_hash(str(log_path))
+    monkeypatch.setattr(cli, "content_hash", lambda file_path: pytest.fail("file is read twice"))
+    config = {"log_pattern": '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b', "workers": workers}
+    assert len(list(cli.iter_logs([(None, str(log_path))], config, {'request'}, conn))) == 39
+    assert conn.execute("SELECT content_hash FROM processed_log_file WHERE path = ?",
+                        (str(log_path),)).fetchone()[0] == expected
+    assert cli.filter_processed_files([str(log_path)], conn) == []
+    conn.close()
+
+
+def test_judge_log_skips_unparsable_time(tmp_path):
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(read_text("find2deny", "log-data.sql"))
+    judge = judgment.ChainedIpJudgment(conn, [judgment.SlidingWindowIpJudgment(conn, allow_access=1)])
+    executor = execution.FileBasedUWFBlock(str(tmp_path / "block-ip.sh"))
+    log = log_parser.LogEntry("access.log", 1, ip=log_parser.ip_to_int("1.1.1.1"),
+                              time='27/Foo/2019:13:11:45 +0100')
+    cli.judge_log(judge, log, 1, executor, conn)
+    assert judge.should_deny(log_parser.LogEntry("access.log", 2, ip=log_parser.ip_to_int("1.1.1.1"),
+                                                 time='27/Mar/2019:13:11:45 +0100'))[0] is False
+    judgment._blocked_ips.pop(conn, None)
+    conn.close()
+
+
+def test_iter_logs_marks_bz2_file_processed(tmp_path):
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(read_text("find2deny", "log-data.sql"))
+    log_path = tmp_path / "access.log.2.bz2"
+    with open("test-data/access-log.txt", 'rb') as f:
+        log_path.write_bytes(bz2.compress(f.read()))
+    config = {"log_pattern": '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b'}
+    log_files = cli.filter_processed_files([str(log_path)], conn)
+    assert len(list(cli.iter_logs(log_files, config, {'request'}, conn))) == 39
+    assert cli.filter_processed_files([str(log_path)], conn) == []
+    conn.close()
+
+
+def test_iter_logs_progress_saved_after_batch(tmp_path):
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(read_text("find2deny", "log-data.sql"))
+    with open("test-data/access-log.txt", 'rb') as f:
+        lines = f.readlines()
+    old = tmp_path / "access.log.1.gz"
+    old.write_bytes(gzip.compress(b"".join(lines[:30])))
+    live = tmp_path / "access.log"
+    live.write_bytes(b"".join(lines[30:]))
+    config = {"log_pattern": '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b'}
+    progress = cli.ReadProgress(conn)
+    logs = cli.iter_logs([(None, str(old)), (None, str(live))], config, {'request'}, conn, progress)
+    batches = log_batch.iter_batches(logs, 32)
+    # the batch crosses into the second file, nothing is stored before it is judged
+    assert len(next(batches)) == 32
+    assert conn.execute("SELECT COUNT(*) FROM processed_log_file").fetchone()[0] == 0
+    assert cli.load_checkpoint(log_parser.file_identity(str(old)), conn) == (0, 0)
+    progress.save()
+    assert cli.filter_processed_files([str(old), str(live)], conn) == [(None, str(live))]
+    assert cli.load_checkpoint(log_parser.file_identity(str(live)), conn)[1] == 2
+    # the last batch is interrupted
+    assert len(next(batches)) == 7
+    logs.close()
+    assert cli.load_checkpoint(log_parser.file_identity(str(live)), conn)[1] == 2
+    conn.close()
+
+
+def test_filter_processed_files_without_fingerprints(tmp_path):
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(read_text("find2deny", "log-data.sql"))
+    processed = tmp_path / "access.log.2.gz"
+    processed.write_bytes(gzip.compress(b"processed content\n" * 1000))
+    # processed by a version without fingerprints
+    with conn:
+        conn.execute("INSERT INTO processed_log_file(content_hash, path) VALUES (?, ?)",
+                     (cli.content_hash(str(processed)), str(processed)))
+    assert cli.filter_processed_files([str(processed)], conn) == []
+    # the fingerprint is stored, the file is not hashed again
+    assert conn.execute("SELECT COUNT(*) FROM log_file_fingerprint WHERE content_hash IS NOT NULL").fetchone()[0] == 1
+    new = tmp_path / "access.log.1.gz"
+    new.write_bytes(gzip.compress(b"new content\n"))
+    assert cli.filter_processed_files([str(processed), str(new)], conn) == [(None, str(new))]
+    conn.close()
+
+
+def test_filter_processed_files_migrates_fingerprints_once(tmp_path, monkeypatch):
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(read_text("find2deny", "log-data.sql"))
+    # the processed file is deleted by logrotate, its hash never gets a fingerprint
+    with conn:
+        conn.execute("INSERT INTO processed_log_file(content_hash, path) VALUES ('1111', 'access.log.9.gz')")
+    new = tmp_path / "access.log.1.gz"
+    new.write_bytes(gzip.compress(b"new content\n"))
+    hashed = []
+    content_hash = cli.content_hash
+    monkeypatch.setattr(cli, "content_hash", lambda file_path: hashed.append(file_path) or content_hash(file_path))
+    for _ in range(2):
+        log_files = cli.filter_processed_files([str(new)], conn)
+        assert [p for _, p in log_files] == [str(new)]
+    assert hashed == [str(new)]
+    conn.close()
+
+
+def test_iter_logs_parallel_marks_processed_after_reading(tmp_path):
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(read_text("find2deny", "log-data.sql"))
+    log_files = []
+    for name in ("access.log.2.gz", "access.log.1.gz"):
+        log_path = tmp_path / name
+        with open("test-data/access-log.txt", 'rb') as f:
+            log_path.write_bytes(gzip.compress(f.read() + name.encode() + b"\n"))
+        log_files.append((cli.content_hash(str(log_path)), str(log_path)))
+    config = {"log_pattern": '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b', "workers": 2}
+    logs = cli.iter_logs(log_files, config, {'request'}, conn)
+    next(logs)
+    logs.close()
+    assert conn.execute("SELECT COUNT(*) FROM processed_log_file").fetchone()[0] == 0
+    assert len(list(cli.iter_logs(log_files, config, {'request'}, conn))) == 78
+    assert conn.execute("SELECT COUNT(*) FROM processed_log_file").fetchone()[0] == 2
+    conn.close()
+
+
+def test_iter_logs_skips_unreadable_file(tmp_path):
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(read_text("find2deny", "log-data.sql"))
+    log_path = tmp_path / "access.log.2.gz"
+    with open("test-data/access-log.txt", 'rb') as f:
+        log_path.write_bytes(gzip.compress(f.read()))
+    config = {"log_pattern": '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b',
+              "decompress_command": {'gzip': 'find2deny-missing-command -dc'}}
+    log_files = [(None, str(log_path)), (None, "test-data/access-log.txt")]
+    assert len(list(cli.iter_logs(log_files, config, {'request'}, conn))) == 39
+    assert conn.execute("SELECT COUNT(*) FROM processed_log_file").fetchone()[0] == 0
+    conn.close()
@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+
+import sqlite3
+import pytest
+
+from find2deny import db_connection
+
+
+def _count(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_batch_writer_commit_entries(tmp_path):
+    path = str(tmp_path / "batch.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+    writer = db_connection.BatchWriter(conn, commit_entries=3)
+    writer.execute("INSERT INTO t (x) VALUES (?)", (1,))
+    writer.buffer("INSERT INTO t (x) VALUES (?)", (2,))
+    # executed statements are visible on the same connection, but not committed
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 1
+    assert _count(path) == 0
+    writer.buffer("INSERT INTO t (x) VALUES (?)", (3,))
+    assert _count(path) == 3
+    writer.buffer("INSERT INTO t (x) VALUES (?)", (4,))
+    writer.commit()
+    assert _count(path) == 4
+    conn.close()
+
+
+def test_batch_writer_default_commits_every_write(tmp_path):
+    path = str(tmp_path / "batch.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    db_connection.get_writer(conn).buffer("INSERT INTO t (x) VALUES (?)", (1,))
+    assert _count(path) == 1
+    conn.close()
+
+
+def test_apply_pragmas(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "pragma.sqlite"))
+    db_connection.apply_pragmas(conn, journal_mode="wal", synchronous="NORMAL", cache_size=-4096)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+    assert conn.execute("PRAGMA cache_size").fetchone()[0] == -4096
+    with pytest.raises(ValueError):
+        db_connection.apply_pragmas(conn, journal_mode="WAL; DROP TABLE t")
+    conn.close()
@@ -1,7 +1,7 @@
 #!/usr/bin/python3
 
 
-from datetime import datetime
+from datetime import datetime, timedelta
 import time
 import pytest
 import logging
@@ -9,6 +9,7 @@ import logging
 
 from find2deny import log_parser
 from find2deny import judgment
+from find2deny import network_index
 import sqlite3
 
 
@@ -18,9 +19,6 @@ ip_data = [
     (log_parser.ip_to_int('5.6.7.8'), '2019-03-28 11:12:13.000+0100', '2019-03-28 11:12:22.000+0100', 30),
     (log_parser.ip_to_int('9.10.11.12'), '2019-03-28 11:12:13.000+0100', '2019-03-28 11:12:13.000+0100', 4),
 ]
-ip_processed_data = [
-    (log_parser.ip_to_int("1.2.3.4"), 1024, 'some-log-file.log')
-]
 
 
 def test_path_based_judgment_block():
@@ -58,24 +56,25 @@ def test_path_based_judgment_free():
     assert not block
 
 
-def test_time_based_judgment__ready_processed():
-    global test_db_path
-    processed_ip = ip_processed_data[0]
-    log_entry = log_parser.LogEntry(
-        processed_ip[2],
-        processed_ip[1],
-        ip=processed_ip[0],
-        time=datetime.strptime("2019-03-28 11:12:30.000+0100",
-                               judgment.DATETIME_FORMAT_PATTERN),
-        status=401,
-        byte=4286
-    )
-    conn = sqlite3.connect(test_db_path)
-    with conn:
-        blocker = judgment.TimeBasedIpJudgment(test_db_path)
-        is_processed = blocker._ready_processed(log_entry)
-        assert is_processed is True
-    conn.close()
+def test_match_path_trie():
+    trie = judgment.build_path_trie(["/wp-login.php", "/wp-", "/pma/", "/wp-admin/"])
+    assert judgment.match_path_trie(trie, "/wp-admin/install.php") == "/wp-"
+    assert judgment.match_path_trie(trie, "/wp-login.php?action=register") == "/wp-login.php"
+    assert judgment.match_path_trie(trie, "/pma") is None
+    assert judgment.match_path_trie(trie, "/") is None
+
+
+def test_path_based_judgment_many_paths():
+    bot_path = ["/bot-{}/".format(i) for i in range(10000)] + ["/manager/html"]
+    blocker = judgment.PathBasedIpJudgment(bot_path)
+    entry = log_parser.LogEntry("dummy-log.txt", 1, ip=log_parser.ip_to_int('111.21.253.2'),
+                                request="GET /manager/html/list HTTP/1.1")
+    (block, cause) = blocker.should_deny(entry)
+    assert block
+    assert cause.endswith("matches non-existing resource /manager/html")
+    entry.request = "GET /bot-42/index.php HTTP/1.1"
+    (block, cause) = blocker.should_deny(entry)
+    assert cause.endswith("matches non-existing resource /bot-42/")
 
 
 from importlib_resources import read_text
@@ -102,7 +101,6 @@ def _prepare_test_data(caplog):
     conn = sqlite3.connect(test_db_path)
     with conn:
         conn.executemany("INSERT INTO log_ip (ip, first_access, last_access, access_count) VALUES (?, ? , ?, ?)", ip_data)
-        conn.executemany("INSERT INTO processed_log_ip (ip, line, log_file) VALUES (?, ?, ?)", ip_processed_data)
     conn.close()
     print("**********************init database done")
 
@@ -133,6 +131,27 @@ def test_update_deny(_prepare_test_data):
     assert cause_of_block == cause
 
 
+def test_update_deny_ipv6(_prepare_test_data):
+    global test_db_path
+    log_entry = log_parser.LogEntry(
+        "some-log-file.log",
+        3,
+        ip=log_parser.ip_to_int("2001:db8::1"),
+        time=datetime.strptime("2019-03-28 11:15:33.000+0100",
+                               judgment.DATETIME_FORMAT_PATTERN),
+        status=404,
+        request="GET /wp-login.php",
+        byte=152
+    )
+    judgment.update_deny("2001:db8::/32", log_entry, "judge of party", "just for fun", test_db_path)
+    conn = sqlite3.connect(test_db_path)
+    c = conn.cursor()
+    c.execute("SELECT ip FROM block_network WHERE ip_network = ?", ("2001:db8::/32",))
+    row = c.fetchone()
+    conn.close()
+    assert log_parser.db_to_ip(row[0]) == log_entry.ip
+
+
 def test_time_based_judgment_should_deny__add_new_entry_to_log(_prepare_test_data):
     global test_db_path
     ip = log_parser.ip_to_int('8.7.6.5')
@@ -158,11 +177,6 @@ def test_time_based_judgment_should_deny__add_new_entry_to_log(_prepare_test_dat
         row = c.fetchone()
         ip_count = row[0]
         assert ip_count == 1
-        c.execute("SELECT COUNT(*) FROM processed_log_ip WHERE ip = ? AND line = ? AND log_file = ?",
-                  (ip, line, log_file))
-        row2 = c.fetchone()
-        ip_count = row2[0]
-        assert ip_count == 1
     conn.close()
 
 
@@ -217,6 +231,37 @@ def test_time_based_judgment_update_access_time(_prepare_test_data):
     conn.close()
 
 
+def test_sliding_window_judgment():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(read_text("find2deny", "log-data.sql"))
+    blocker = judgment.SlidingWindowIpJudgment(conn, allow_access=3, interval_second=10, flush_entries=2)
+    ip = log_parser.ip_to_int('5.6.7.8')
+    start = datetime.strptime("2019-03-28 11:12:00.000+0100", judgment.DATETIME_FORMAT_PATTERN)
+    decisions = []
+    for second in [0, 20, 40, 41, 42, 43]:
+        log_entry = log_parser.LogEntry("some-log-file.log", second, ip=ip,
+                                        time=start + timedelta(seconds=second))
+        decisions.append(blocker.should_deny(log_entry)[0])
+    assert decisions == [False, False, False, False, False, True]
+    blocker.flush()
+    row = conn.execute("SELECT first_access, access_count, status FROM log_ip WHERE ip = ?", (ip,)).fetchone()
+    assert row == ("2019-03-28 11:12:00.000000+0100", 6, 1)
+    conn.close()
+
+
+def test_is_ready_blocked():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(read_text("find2deny", "log-data.sql"))
+    ip = log_parser.ip_to_int('2001:db8::1')
+    conn.execute("INSERT INTO block_network (ip, ip_network, cause_of_block) VALUES (?, ?, ?)",
+                 (log_parser.ip_to_db(ip), "2001:db8::/32", "just for fun"))
+    log_entry = log_parser.LogEntry("some-log-file.log", 1, ip=ip)
+    assert judgment.is_ready_blocked(log_entry, conn) == (True, "just for fun")
+    log_entry.ip = log_parser.ip_to_int('1.2.3.4')
+    assert judgment.is_ready_blocked(log_entry, conn) == (False, None)
+    conn.close()
+
+
 def test_user_agent_based_judgment():
     ip = log_parser.ip_to_int('9.10.11.12')
     log_entry = log_parser.LogEntry(
@@ -245,6 +290,42 @@ def test_user_agent_based_judgment_2():
     assert deny is True
 
 
+def test_user_agent_based_judgment_regex():
+    ip = log_parser.ip_to_int('54.36.150.103')
+    blocker = judgment.UserAgentBasedIpJudgment(['http://www.semrush.com', 'AhrefsBot'], [r'(?i)python-requests/\d'])
+    log_entry = log_parser.LogEntry("some-log-file.log", 2, ip=ip, user_agent="Python-Requests/2.22.0")
+    deny, cause = blocker.should_deny(log_entry)
+    assert deny is True
+    assert cause.endswith(r"contains (?i)python-requests/\d")
+    log_entry.user_agent = "Mozilla/5.0 (compatible; AhrefsBot/6.1; +http://www.semrush.com/)"
+    deny, cause = blocker.should_deny(log_entry)
+    assert cause.endswith("contains http://www.semrush.com")
+    log_entry.user_agent = "Mozilla/5.0 (X11; Linux x86_64; rv:68.0) Gecko/20100101 Firefox/68.0"
+    assert blocker.should_deny(log_entry) == (False, None)
+
+
+def test_user_agent_based_judgment_regex_backreference():
+    blocker = judgment.UserAgentBasedIpJudgment([], [r'(x+)\1y', r'(bot)-\1'])
+    log_entry = log_parser.LogEntry("some-log-file.log", 2, ip=log_parser.ip_to_int('54.36.150.103'),
+                                    user_agent="bot-bot")
+    assert blocker.should_deny(log_entry) == (True, r"bot-bot contains (bot)-\1")
+
+
+def test_user_agent_based_judgment_no_user_agent():
+    blocker = judgment.UserAgentBasedIpJudgment(['AhrefsBot'])
+    log_entry = log_parser.LogEntry("some-log-file.log", 2, ip=log_parser.ip_to_int('54.36.150.103'))
+    assert blocker.should_deny(log_entry) == (False, None)
+
+
+def test_required_fields():
+    path_based = judgment.PathBasedIpJudgment({"/pma/"})
+    agent_based = judgment.UserAgentBasedIpJudgment(['http://ahrefs.com'])
+    assert path_based.required_fields() == {'request'}
+    assert agent_based.required_fields() == {'user_agent'}
+    chain = judgment.ChainedIpJudgment(None, [path_based, agent_based])
+    assert chain.required_fields() == {'request', 'user_agent'}
+
+
 def test_lookup():
     ip = "134.96.210.150"
     expected_network = "134.96.0.0/16"
@@ -308,4 +389,38 @@ def test_white_list_reg():
     ip = "134.96.214.15"
     white_list_fn = judgment.make_ip_check_fn(ip)
     white_list = [r"134\.96\.\d+\.\d+"]
-    assert next((item for item in white_list if white_list_fn(item)), None) == white_list[0]
\ No newline at end of file
+    assert next((item for item in white_list if white_list_fn(item)), None) == white_list[0]
+
+def test_white_list_subnet_ipv6():
+    ip = log_parser.int_to_ip(log_parser.ip_to_int("2001:db8::1"))
+    white_list_fn = judgment.make_ip_check_fn(ip)
+    white_list = ["134.96.0.0/16", "2001:db8::/32"]
+    assert next((item for item in white_list if white_list_fn(item)), None) == white_list[1]
+
+
+def test_white_list_index():
+    white_list = judgment.WhiteList(["134.96.214.15", "134.96.0.0/16", "2001:db8::/32", r"10\.1\.\d+\.\d+"])
+    assert white_list.match(log_parser.ip_to_int("134.96.214.15")) == "134.96.214.15"
+    assert white_list.match(log_parser.ip_to_int("134.96.1.2")) == "134.96.0.0/16"
+    assert white_list.match(log_parser.ip_to_int("2001:db8::1")) == "2001:db8::/32"
+    assert white_list.match(log_parser.ip_to_int("10.1.2.3")) == r"10\.1\.\d+\.\d+"
+    assert white_list.match(log_parser.ip_to_int("134.95.96.7")) is None
+    assert white_list.match(log_parser.ip_to_int("::ffff:134.96.1.2")) == "134.96.0.0/16"
+
+
+def test_white_list_invalid_entry():
+    with pytest.raises(judgment.JudgmentException):
+        judgment.WhiteList(["134.96.0.0/16", "134.96.(0"])
+
+
+def test_network_index_longest_prefix():
+    index = network_index.NetworkIndex()
+    for i in range(1000):
+        index.add("10.{}.0.0/16".format(i % 256) if i < 256 else "172.16.{}.0/24".format(i % 256), i)
+    index.add("10.1.2.0/24", "specific")
+    index.add("::ffff:192.168.0.0/112", "mapped")
+    assert index.lookup(log_parser.ip_to_int("10.1.2.3")) == "specific"
+    assert index.lookup(log_parser.ip_to_int("10.1.3.3")) == 1
+    assert index.lookup(log_parser.ip_to_int("192.168.3.4")) == "mapped"
+    assert log_parser.ip_to_int("11.1.2.3") not in index
+    assert index.lookup(log_parser.ip_to_int("::1"), "none") == "none"
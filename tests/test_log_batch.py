@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+
+import sqlite3
+from datetime import datetime, timedelta
+import pytest
+from importlib_resources import read_text
+
+from find2deny import judgment
+from find2deny import log_parser
+from find2deny import resolver
+
+np = pytest.importorskip("numpy")
+from find2deny import log_batch
+
+
+START = datetime.strptime("2019-03-28 11:12:00.000+0100", judgment.DATETIME_FORMAT_PATTERN)
+
+
+def _entries():
+    accesses = [
+        # ip, second, request, user agent
+        ('1.2.3.4', 0, 'GET /index.html HTTP/1.1', 'Mozilla/5.0'),
+        ('5.6.7.8', 1, 'GET /phpmyadmin/index.php HTTP/1.1', 'Mozilla/5.0'),
+        ('1.2.3.4', 2, 'GET /index.html HTTP/1.1', 'Mozilla/5.0'),
+        ('2001:db8::1', 3, 'GET /wp-login.php HTTP/1.1', 'python-requests/2.21'),
+        ('1.2.3.4', 4, 'GET /about.html HTTP/1.1', 'Mozilla/5.0'),
+        ('9.10.11.12', 5, '\\x16\\x03\\x01', None),
+        ('1.2.3.4', 6, 'GET /index.html HTTP/1.1', 'Mozilla/5.0'),
+        ('9.10.11.12', 7, '-', 'Mozilla/5.0'),
+        ('1.2.3.4', 30, 'GET /index.html HTTP/1.1', 'Mozilla/5.0'),
+        ('5.6.7.8', 31, 'GET /index.html HTTP/1.1', 'Mozilla/5.0'),
+        ('1.2.3.4', 32, 'GET /index.html HTTP/1.1', 'Mozilla/5.0'),
+    ]
+    return [log_parser.LogEntry("access.log", line, ip=log_parser.ip_to_int(ip), time=START + timedelta(seconds=second),
+                                status=200, request=request, user_agent=ua)
+            for line, (ip, second, request, ua) in enumerate(accesses, 1)]
+
+
+def _should_deny_each(judge, entries):
+    return [judge.should_deny(entry) for entry in entries]
+
+
+def _should_deny_batch(judge, entries):
+    deny, causes = judge.should_deny_batch(log_batch.LogBatch(entries))
+    return list(zip(deny.tolist(), causes))
+
+
+def test_log_batch_columns():
+    entries = _entries()
+    batch = log_batch.LogBatch(entries, fields={'time'})
+    assert len(batch) == len(entries)
+    assert len(batch.ips) == 4
+    assert batch.ips[batch.ip_codes[3]] == log_parser.ip_to_int('2001:db8::1')
+    assert batch.time[1] - batch.time[0] == 1.0
+    assert batch.request is None
+    selected = batch.select(batch.ip_codes == batch.ip_codes[0])
+    assert len(selected) == 6
+    assert [e.line for e in selected.entries] == [1, 3, 5, 7, 9, 11]
+
+
+def test_log_batch_drops_unparsable_time():
+    entries = _entries()
+    entries[1].time = '27/Foo/2019:13:11:45 +0100'
+    batch = log_batch.LogBatch(entries, fields={'time', 'request'})
+    assert len(batch) == len(entries) - 1
+    assert [e.line for e in batch.entries[:2]] == [1, 3]
+    assert len(batch.request) == len(batch.time) == len(batch)
+
+
+def test_iter_batches():
+    assert [len(b) for b in log_batch.iter_batches(range(7), 3)] == [3, 3, 1]
+
+
+def test_path_based_judgment_batch():
+    judge = judgment.PathBasedIpJudgment({"/phpmyadmin/", "/wp-login.php"})
+    entries = _entries()
+    assert _should_deny_batch(judge, entries) == _should_deny_each(judge, entries)
+    assert [d for d, _ in _should_deny_batch(judge, entries)].count(True) == 3
+
+
+def test_user_agent_based_judgment_batch():
+    judge = judgment.UserAgentBasedIpJudgment(["python-requests"])
+    entries = _entries()
+    assert _should_deny_batch(judge, entries) == _should_deny_each(judge, entries)
+    assert _should_deny_batch(judge, entries)[3] == (True, "python-requests/2.21 contains python-requests")
+
+
+def _log_ip(conn):
+    return conn.execute("SELECT ip, first_access, last_access, access_count, status FROM log_ip ORDER BY ip").fetchall()
+
+
+def test_sliding_window_judgment_batch():
+    entries = _entries()
+    conn_each, conn_batch = sqlite3.connect(":memory:"), sqlite3.connect(":memory:")
+    for conn in (conn_each, conn_batch):
+        conn.executescript(read_text("find2deny", "log-data.sql"))
+    each = judgment.SlidingWindowIpJudgment(conn_each, allow_access=3, interval_second=10)
+    batched = judgment.SlidingWindowIpJudgment(conn_batch, allow_access=3, interval_second=10)
+    expected = [d for d, _ in _should_deny_each(each, entries)]
+    assert expected == [False] * 6 + [True] + [False] * 4
+    # the second batch continues the windows of the first batch
+    decisions = [d for d, _ in _should_deny_batch(batched, entries[:5]) + _should_deny_batch(batched, entries[5:])]
+    assert decisions == expected
+    each.flush()
+    batched.flush()
+    assert _log_ip(conn_batch) == _log_ip(conn_each)
+    conn_each.close()
+    conn_batch.close()
+
+
+def test_sliding_window_deny():
+    codes = np.array([0, 1, 0, 0, 1, 0])
+    times = np.array([0.0, 0.0, 1.0, 2.0, 50.0, 20.0])
+    deny, seconds = log_batch.sliding_window_deny(codes, times, 2, 10)
+    assert deny.tolist() == [False, False, False, True, False, False]
+    assert seconds[3] == 2.0
+    assert seconds[5] == 19.0
+
+
+def test_chained_judgment_batch():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(read_text("find2deny", "log-data.sql"))
+    chain = judgment.ChainedIpJudgment(conn, [
+        judgment.PathBasedIpJudgment({"/phpmyadmin/"}),
+        judgment.SlidingWindowIpJudgment(conn, allow_access=3, interval_second=10)
+    ], white_list=["9.10.11.0/24"])
+    try:
+        judgment.set_resolver(resolver.ChainedResolver([]))
+        deny, causes = chain.should_deny_batch(log_batch.LogBatch(_entries()))
+        assert deny.tolist() == [False, True, False, False, False, False, True, False, True, True, True]
+        assert causes[9] == causes[1]
+        assert causes[8] == causes[10] == causes[6]
+        assert conn.execute("SELECT COUNT(*) FROM block_network").fetchone()[0] == 2
+    finally:
+        judgment.set_resolver(resolver.RdapResolver())
+        judgment._blocked_ips.pop(conn, None)
+        conn.close()
@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+
+import os
+import sqlite3
+import pytest
+from importlib_resources import read_text
+
+from find2deny import cli
+from find2deny import log_parser
+
+pytest.importorskip("numpy")
+from find2deny import log_cache
+
+
+LOG_PATTERN = '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b'
+
+
+def _fields(entry):
+    return entry.line, entry.ip, entry.time, entry.status, entry.request, entry.byte, entry.user, entry.user_agent
+
+
+def _store(cache, key, log_path):
+    position = [0, 0]
+    logs = log_parser.iter_log_file(log_path, LOG_PATTERN, position=position)
+    return list(cache.store({log_path: key}, logs, {log_path: position}, offsets=True)), position
+
+
+def test_cache_parsed_entries(tmp_path):
+    cache = log_cache.ParsedLogCache(str(tmp_path / "cache"), 10 * 1024 * 1024)
+    key = cache.key("0000", LOG_PATTERN)
+    assert key != cache.key("0000", "%h %t")
+    assert cache.load(key) is None
+    parsed, end = _store(cache, key, "test-data/access-log.txt")
+    cached = cache.load(key)
+    assert cached.count == len(parsed)
+    assert cached.end == tuple(end)
+    assert [_fields(e) for e in cached.iter_entries("test-data/access-log.txt")] == [_fields(e) for e in parsed]
+    # continue after a checkpoint
+    position = [0, 0]
+    entries = cached.iter_entries("access.log.1", (0, 5), position)
+    first = next(entries)
+    assert (first.log_file, first.line) == ("access.log.1", 6)
+    assert position[1] == 6
+    list(entries)
+    assert position == end
+
+
+def test_cache_ipv6_and_missing_values(tmp_path):
+    log_path = tmp_path / "access.log"
+    log_path.write_bytes(b'127.0.0.1 2001:db8::1 - - [27/Mar/2019:13:11:45 +0100] "GET / HTTP/1.1" 200 -\n')
+    cache = log_cache.ParsedLogCache(str(tmp_path / "cache"), 1024 * 1024)
+    parsed, _ = _store(cache, "ipv6", str(log_path))
+    cached = list(cache.load("ipv6").iter_entries(str(log_path)))
+    assert cached[0].ip_str == "2001:db8::1"
+    assert [_fields(e) for e in cached] == [_fields(e) for e in parsed]
+
+
+def test_cache_not_stored_if_not_complete(tmp_path):
+    cache = log_cache.ParsedLogCache(str(tmp_path / "cache"), 1024 * 1024)
+    position = [0, 0]
+    logs = cache.store({"test-data/access-log.txt": "partial"},
+                       log_parser.iter_log_file("test-data/access-log.txt", LOG_PATTERN, position=position),
+                       {"test-data/access-log.txt": position}, offsets=True)
+    next(logs)
+    logs.close()
+    assert cache.load("partial") is None
+    assert os.listdir(str(tmp_path / "cache")) == []
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = log_cache.ParsedLogCache(str(tmp_path / "cache"), 1024 * 1024)
+    for key in ("a", "b"):
+        _store(cache, key, "test-data/access-log.txt")
+    os.utime(str(tmp_path / "cache" / "a"), (1, 1))
+    os.utime(str(tmp_path / "cache" / "b"), (2, 2))
+    cache.load("a")
+    size = sum(e.stat().st_size for e in os.scandir(str(tmp_path / "cache" / "a")))
+    cache.max_size = size
+    cache.evict()
+    assert cache.load("a") is not None
+    assert cache.load("b") is None
+
+
+def test_iter_logs_from_cache(tmp_path):
+    log_path = tmp_path / "access.log.2"
+    with open("test-data/access-log.txt", 'rb') as f:
+        log_path.write_bytes(f.read())
+    config = {"log_pattern": LOG_PATTERN, "database_path": str(tmp_path / "ipdb.sqlite"),
+              "parse_cache_size": 1024 * 1024}
+    runs = []
+    for workers in (1, 1, 2):
+        # a new database for each run
+        conn = sqlite3.connect(":memory:")
+        conn.executescript(read_text("find2deny", "log-data.sql"))
+        config["workers"] = workers
+        runs.append([(e.line, e.ip, e.request) for e in cli.iter_logs([("0000", str(log_path))], config,
+                                                                      {'request'}, conn)])
+        conn.close()
+    assert len(os.listdir(str(tmp_path / "ipdb.sqlite.cache"))) == 1
+    assert runs[0] == runs[1] == runs[2]
+    assert len(runs[0]) == 39
+
+
+def test_cache_removes_stale_tmp_directories(tmp_path):
+    cache_dir = tmp_path / "cache"
+    running = cache_dir / "a.{}.tmp".format(os.getpid())
+    # no process has the pid 2^22 + 1, larger than the maximum pid of Linux
+    killed = cache_dir / "b.{}.tmp".format(2 ** 22 + 1)
+    old = cache_dir / "c.{}.tmp".format(os.getppid())
+    for directory in (running, killed, old):
+        directory.mkdir(parents=True)
+        (directory / "line.int").write_bytes(b"\0" * 8)
+    os.utime(str(old), (1, 1))
+    log_cache.ParsedLogCache(str(cache_dir), 1024 * 1024)
+    assert os.listdir(str(cache_dir)) == [running.name]
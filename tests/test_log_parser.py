@@ -2,6 +2,13 @@
 
 
 from datetime import datetime
+import bz2
+import gzip
+import hashlib
+import io
+import lzma
+import os
+import pickle
 import pytest
 import logging
 import pprint
@@ -95,4 +102,492 @@ def test_ignore_bad_source_ip():
         log_parser.parser_tomcat_log_line("no-name.log", 1024, line, pattern)
         assert False
     except log_parser.CannotParseLogIpException as ex:
-        assert True
\ No newline at end of file
+        assert True
+
+def test_compile_log_pattern():
+    line = '127.0.0.1 134.96.214.161 - someone [27/Mar/2019:13:11:45 +0100] "GET /mathcoach/gfx/muetze.ico HTTP/1.1" 200 4286\n'
+    parse = log_parser.compile_log_pattern('%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b')
+    entry = parse("no-name.log", 1024, line)
+    assert entry.ip == log_parser.ip_to_int('134.96.214.161')
+    assert entry.user == 'someone'
+    assert entry.time == datetime.strptime('27/Mar/2019:13:11:45 +0100', '%d/%b/%Y:%H:%M:%S %z')
+    assert entry.request == 'GET /mathcoach/gfx/muetze.ico HTTP/1.1'
+    assert entry.status == 200
+    assert entry.byte == 4286
+    assert entry.line == 1024
+
+
+def test_compile_log_pattern_fields():
+    line = '127.0.0.1 134.96.214.161 - someone [27/Mar/2019:13:11:45 +0100] "GET /mathcoach/gfx/muetze.ico HTTP/1.1" 200 bad\n'
+    parse = log_parser.compile_log_pattern('%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b', fields={'request'})
+    entry = parse("no-name.log", 1024, line)
+    assert entry.ip == log_parser.ip_to_int('134.96.214.161')
+    assert entry.request == 'GET /mathcoach/gfx/muetze.ico HTTP/1.1'
+    assert entry.user is None
+    assert entry.time is None
+    assert entry.status == 0
+    assert entry.byte == 0
+
+
+def test_compile_log_pattern_not_matched_line():
+    parse = log_parser.compile_log_pattern('%h %l %u %t "%r" %>s %O')
+    try:
+        parse("no-name.log", 1, '1.2.3.4 - - "GET / HTTP/1.1" 200 12')
+        assert False
+    except log_parser.CannotParseLogLineException:
+        assert True
+
+
+def test_parse_log_file():
+    logs = log_parser.parse_log_file("test-data/access-log.txt", '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b')
+    assert len(logs) == 39
+    assert logs[0].ip_str == '134.96.214.161'
+    assert logs[0].line == 1
+    assert logs[-1].line == 39
+
+
+def test_iter_log_file():
+    logs = log_parser.iter_log_file("test-data/access-log.txt", '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b')
+    first = next(logs)
+    assert first.line == 1
+    assert first.ip_str == '134.96.214.161'
+    assert sum(1 for _ in logs) == 38
+
+
+def test_log_entry_lazy_time():
+    entry = log_parser.LogEntry("no-name.log", 1, ip=log_parser.ip_to_int('1.2.3.4'), time='27/Mar/2019:13:11:45 +0100')
+    assert not hasattr(entry, '__dict__')
+    assert entry['time'] == datetime.strptime('27/Mar/2019:13:11:45 +0100', '%d/%b/%Y:%H:%M:%S %z')
+    assert entry.iso_time == '2019-03-27 13:11:45.000000+0100'
+
+
+def test_log_entry_unknown_key():
+    entry = log_parser.LogEntry("no-name.log", 1)
+    try:
+        entry['referer'] = 'http://local.host/'
+        assert False
+    except KeyError:
+        assert True
+
+
+def test_parse_access_log_time():
+    for value in ['27/Mar/2019:13:11:45 +0100', '01/Apr/2019:07:11:42 +0000', '31/Dec/2019:23:59:59 -0530',
+                  '29/Feb/2020:00:00:00 +1400']:
+        expected = datetime.strptime(value, '%d/%b/%Y:%H:%M:%S %z')
+        parsed = log_parser.parse_access_log_time(value)
+        assert parsed == expected
+        assert parsed.utcoffset() == expected.utcoffset()
+
+
+def test_parse_access_log_time_fallback():
+    assert log_parser.parse_access_log_time('1/Mar/2019:13:11:45 +0100') == \
+        datetime.strptime('1/Mar/2019:13:11:45 +0100', '%d/%b/%Y:%H:%M:%S %z')
+    try:
+        log_parser.parse_access_log_time('30/Feb/2019:13:11:45 +0100')
+        assert False
+    except ValueError:
+        assert True
+
+
+def test_parse_access_log_time_cache():
+    timestamps = ['27/Mar/2019:13:{:02d}:{:02d} +0100'.format(s // 60, s % 60) for s in range(3600)] * 3
+    log_parser.parse_access_log_time.cache_clear()
+    parsed = [log_parser.parse_access_log_time(value) for value in timestamps]
+    assert parsed == [datetime.strptime(value, '%d/%b/%Y:%H:%M:%S %z') for value in timestamps]
+    # each distinct timestamp is parsed once
+    cache_info = log_parser.parse_access_log_time.cache_info()
+    assert cache_info.misses == 3600
+    assert cache_info.hits == 2 * 3600
+
+
+def test_ip_to_int_ipv6():
+    for ip in ['2001:db8::1', 'fe80::1ff:fe23:4567:890a', '2a00:1450:4001:82a::200e']:
+        ip_int = log_parser.ip_to_int(ip)
+        assert ip_int > 2 ** 32
+        assert log_parser.int_to_ip(ip_int) == ip
+
+
+def test_ip_to_int_ipv4_mapped():
+    assert log_parser.ip_to_int('::ffff:134.96.214.161') == log_parser.ip_to_int('134.96.214.161')
+
+
+def test_ip_to_db():
+    ipv4 = log_parser.ip_to_int('134.96.214.161')
+    ipv6 = log_parser.ip_to_int('2001:db8::1')
+    assert log_parser.ip_to_db(ipv4) == ipv4
+    assert len(log_parser.ip_to_db(ipv6)) == 16
+    assert log_parser.db_to_ip(log_parser.ip_to_db(ipv6)) == ipv6
+
+
+def test_parse_tomcat_log_line_ipv6():
+    line = '2001:db8::1 - - [02/Oct/2019:08:38:31 +0200] "GET /wp-login.php HTTP/1.1" 404 152 "-" "curl/7.58.0"'
+    pattern = '%h %l %u %t "%r" %>s %O "%{Referer}i" "%{User-Agent}i"'.split(' ')
+    entry = log_parser.parser_tomcat_log_line("no-name.log", 1024, line, pattern)
+    assert entry.ip == log_parser.ip_to_int('2001:db8::1')
+    assert entry.ip_str == '2001:db8::1'
+
+
+def test_iter_lines():
+    lines = [b'first line', b'', b'third line', b'last line without newline']
+    data = io.BytesIO(b'\n'.join(lines))
+    assert list(log_parser.iter_lines(data, chunk_size=3)) == lines
+
+
+def test_compile_log_pattern_binary():
+    line = '93.242.172.189 - - [01/Apr/2019:07:11:42 +0000] "GET /\xfc HTTP/1.1" 200 738 "-" "Mozilla/5.0 \xe4"'
+    pattern = '%h %l %u %t "%r" %>s %O "%{Referer}i" "%{User-Agent}i"'
+    entry = log_parser.compile_log_pattern(pattern, binary=True)("no-name.log", 1, line.encode('latin-1'))
+    assert entry.ip == log_parser.ip_to_int('93.242.172.189')
+    assert entry.status == 200
+    assert entry.user == '-'
+    assert entry.request == 'GET / HTTP/1.1'
+    assert entry.user_agent == 'Mozilla/5.0 '
+    assert entry.time == datetime.strptime('01/Apr/2019:07:11:42 +0000', '%d/%b/%Y:%H:%M:%S %z')
+
+
+def test_iter_log_file_gz(tmp_path):
+    log_file = str(tmp_path / "access.log.2.gz")
+    with open("test-data/access-log.txt", 'rb') as src, gzip.open(log_file, 'wb') as dst:
+        dst.write(src.read())
+    pattern = '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b'
+    logs = list(log_parser.iter_log_file(log_file, pattern))
+    with open("test-data/access-log.txt") as f:
+        expected = [log_parser.parser_tomcat_log_line("test-data/access-log.txt", i + 1, line, pattern)
+                    for i, line in enumerate(f)]
+    assert len(logs) == len(expected)
+    for entry, expected_entry in zip(logs, expected):
+        for field in ['ip', 'time', 'status', 'request', 'user', 'user_agent', 'byte', 'line']:
+            assert entry[field] == expected_entry[field]
+
+
+def _write_log_file(path, seconds, ip):
+    with open(path, 'w') as f:
+        for s in seconds:
+            f.write('{} - - [27/Mar/2019:13:11:{:02d} +0100] "GET / HTTP/1.1" 200 12 "-" "-"\n'.format(ip, s))
+    return str(path)
+
+
+def test_iter_log_files_parallel(tmp_path):
+    pattern = '%h %l %u %t "%r" %>s %O "%{Referer}i" "%{User-Agent}i"'
+    log_files = [
+        _write_log_file(tmp_path / "access.log.2", [0, 3, 6, 9], '1.1.1.1'),
+        _write_log_file(tmp_path / "access.log.1", [1, 4, 7], '2.2.2.2'),
+        _write_log_file(tmp_path / "access.log", [10, 11], '3.3.3.3'),
+    ]
+    sequential = list(log_parser.iter_log_files(log_files, pattern))
+    parallel = list(log_parser.iter_log_files(log_files, pattern, workers=2))
+    assert len(parallel) == len(sequential) == 9
+    assert [e.time.second for e in parallel] == [0, 1, 3, 4, 6, 7, 9, 10, 11]
+    assert [(e.log_file, e.line) for e in parallel[:2]] == [(log_files[0], 1), (log_files[1], 1)]
+
+
+def test_iter_log_files_parallel_unparsable_time(tmp_path):
+    pattern = '%h %l %u %t "%r" %>s %O "%{Referer}i" "%{User-Agent}i"'
+    log_files = [
+        _write_log_file(tmp_path / "access.log.1", [1, 4, 7], '2.2.2.2'),
+        _write_log_file(tmp_path / "access.log", [10, 11], '3.3.3.3'),
+    ]
+    with open(log_files[0], 'a') as f:
+        f.write('2.2.2.2 - - [27/Foo/2019:13:11:08 +0100] "GET / HTTP/1.1" 200 12 "-" "-"\n')
+    logs = list(log_parser.iter_log_files(log_files, pattern, workers=2))
+    assert [e.time.second for e in logs] == [1, 4, 7, 10, 11]
+
+
+def test_iter_log_files_parallel_spool(tmp_path, monkeypatch):
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    monkeypatch.setattr(log_parser.tempfile, "tempdir", str(spool_dir))
+    monkeypatch.setattr(log_parser, "SPOOL_CHUNK_SIZE", 5)
+    pattern = '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b'
+    gz_path = _compress_access_log(tmp_path, "access.log.2.gz", gzip.compress)
+    paths = [gz_path, "test-data/access-log.txt", gz_path]
+    logs = list(log_parser.iter_log_files(paths, pattern, workers=2, split_size=500))
+    assert len(logs) == 3 * 39
+    assert list(spool_dir.iterdir()) == []
+    logs = log_parser.iter_log_files(paths, pattern, workers=2, split_size=500)
+    next(logs)
+    logs.close()
+    assert list(spool_dir.iterdir()) == []
+
+
+def test_cannot_parse_log_line_exception_pickle():
+    ex = log_parser.CannotParseLogIpException("access.log", 3, "bad ip", errors=ValueError("bad ip"))
+    unpickled = pickle.loads(pickle.dumps(ex))
+    assert type(unpickled) is log_parser.CannotParseLogIpException
+    assert unpickled.message == ex.message == "(access.log,3) bad ip"
+
+
+def test_iter_log_files_parallel_fields(tmp_path):
+    pattern = '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b'
+    logs = list(log_parser.iter_log_files(["test-data/access-log.txt"] * 2, pattern, workers=2, fields={'request'}))
+    assert len(logs) == 78
+    assert all(log.request is not None and log.status == 0 for log in logs)
+    assert all(log.time is not None for log in logs)
+
+
+def test_split_log_file():
+    log_file = "test-data/access-log.txt"
+    with open(log_file, 'rb') as f:
+        data = f.read()
+    byte_ranges = log_parser.split_log_file(log_file, split_size=500)
+    assert len(byte_ranges) > 1
+    assert byte_ranges[0][0] == 0
+    assert byte_ranges[-1][1] == len(data)
+    for (start, end), (next_start, _) in zip(byte_ranges, byte_ranges[1:]):
+        assert end == next_start
+        assert data[end - 1:end] == b'\n'
+
+
+def test_iter_log_file_start(tmp_path):
+    pattern = '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b'
+    position = []
+    logs = log_parser.iter_log_file("test-data/access-log.txt", pattern, position=position)
+    for _ in range(10):
+        next(logs)
+    assert position[1] == 10
+    rest = list(log_parser.iter_log_file("test-data/access-log.txt", pattern, start=tuple(position)))
+    assert [log.line for log in rest] == list(range(11, 40))
+    assert rest[0].request == log_parser.parse_log_file("test-data/access-log.txt", pattern)[10].request
+    gz_path = tmp_path / "access-log.txt.gz"
+    with open("test-data/access-log.txt", 'rb') as f:
+        gz_path.write_bytes(gzip.compress(f.read()))
+    rest_gz = list(log_parser.iter_log_file(str(gz_path), pattern, start=tuple(position)))
+    assert [log.line for log in rest_gz] == list(range(11, 40))
+
+
+def test_iter_log_file_cut_mid_line(tmp_path):
+    pattern = '%h %l %u %t "%r" %s %b'
+    lines = [b'1.1.1.1 - - [27/Mar/2019:13:11:45 +0100] "GET / HTTP/1.1" 200 42\n',
+             b'2.2.2.2 - - [27/Mar/2019:13:11:46 +0100] "GET / HTTP/1.1" 200 42\n',
+             b'3.3.3.3 - - [27/Mar/2019:13:11:47 +0100] "GET / HTTP/1.1" 200 12345\n',
+             b'4.4.4.4 - - [27/Mar/2019:13:11:48 +0100] "GET / HTTP/1.1" 200 42\n']
+    log_path = tmp_path / "access.log"
+    # the server is writing the third line
+    log_path.write_bytes(lines[0] + lines[1] + lines[2][:-4])
+    position = []
+    assert [e.line for e in log_parser.iter_log_file(str(log_path), pattern, position=position)] == [1, 2]
+    assert position == [len(lines[0] + lines[1]), 2]
+    positions = {}
+    logs = list(log_parser.iter_log_files([str(log_path)], pattern, workers=2, split_size=60, positions=positions))
+    assert [e.line for e in logs] == [1, 2]
+    assert positions[str(log_path)] == position
+    with open(log_path, 'ab') as f:
+        f.write(lines[2][-4:] + lines[3])
+    rest = list(log_parser.iter_log_file(str(log_path), pattern, start=tuple(position)))
+    assert [(e.line, e.byte) for e in rest] == [(3, 12345), (4, 42)]
+
+
+def test_parse_log_file_without_last_newline(tmp_path):
+    pattern = '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b'
+    log_path = tmp_path / "access.log.1"
+    with open("test-data/access-log.txt", 'rb') as f:
+        log_path.write_bytes(f.read().rstrip(b'\n'))
+    assert len(log_parser.parse_log_file(str(log_path), pattern)) == 39
+    assert len(list(log_parser.iter_log_files([str(log_path)] * 2, pattern, workers=2, split_size=500))) == 78
+
+
+def test_file_identity(tmp_path):
+    plain_path = tmp_path / "access.log"
+    plain_path.write_bytes(b'first line\nsecond line\n')
+    identity = log_parser.file_identity(str(plain_path))
+    with open(plain_path, 'ab') as f:
+        f.write(b'third line\n')
+    assert log_parser.file_identity(str(plain_path)) == identity
+    gz_path = tmp_path / "access.log.1.gz"
+    gz_path.write_bytes(gzip.compress(plain_path.read_bytes()))
+    assert log_parser.file_identity(str(gz_path)) == identity
+    empty_path = tmp_path / "empty.log"
+    empty_path.write_bytes(b'')
+    assert log_parser.file_identity(str(empty_path)) is None
+
+
+def test_iter_log_files_start_positions(tmp_path):
+    pattern = '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b'
+    size = os.path.getsize("test-data/access-log.txt")
+    gz_path = tmp_path / "access-log.txt.gz"
+    with open("test-data/access-log.txt", 'rb') as f:
+        gz_path.write_bytes(gzip.compress(f.read()))
+    paths = ["test-data/access-log.txt", str(gz_path)]
+    positions = {}
+    logs = list(log_parser.iter_log_files(paths, pattern, workers=2, split_size=1024, positions=positions))
+    assert len(logs) == 78
+    assert positions == {path: [size, 39] for path in paths}
+    starts = {path: (size, 39) for path in paths}
+    assert list(log_parser.iter_log_files(paths, pattern, workers=2, split_size=1024, starts=starts)) == []
+
+
+def test_iter_log_files_split(tmp_path):
+    pattern = '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b'
+    log_file = str(tmp_path / "access.log")
+    with open("test-data/access-log.txt") as src, open(log_file, 'w') as dst:
+        lines = src.readlines()
+        dst.writelines(lines[:10] + ["this line is not a log entry\n"] + lines[10:])
+    sequential = list(log_parser.iter_log_files([log_file], pattern))
+    parallel = list(log_parser.iter_log_files([log_file], pattern, workers=3, split_size=700))
+    assert len(parallel) == len(sequential) == 39
+    assert [(e.line, e.ip) for e in parallel] == [(e.line, e.ip) for e in sequential]
+    assert parallel[-1].line == 40
+
+
+def _compress_access_log(tmp_path, file_name, compress):
+    log_file = str(tmp_path / file_name)
+    with open("test-data/access-log.txt", 'rb') as src, open(log_file, 'wb') as dst:
+        dst.write(compress(src.read()))
+    return log_file
+
+
+@pytest.mark.parametrize("compression,compress", [
+    ('gzip', gzip.compress),
+    ('bz2', bz2.compress),
+    ('xz', lzma.compress),
+])
+def test_read_compressed_file(tmp_path, compression, compress):
+    log_file = _compress_access_log(tmp_path, "access.log.2." + compression, compress)
+    assert log_parser.detect_compression(log_file) == compression
+    logs = list(log_parser.iter_log_file(log_file, '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b'))
+    assert len(logs) == 39
+    with log_parser.open_log_file_fn(log_file)(log_file) as f:
+        assert f.readline().startswith('127.0.0.1 134.96.214.161 - - [27/Mar/2019:13:11:45 +0100]')
+
+
+def test_read_zstd_file(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    log_file = _compress_access_log(tmp_path, "access.log.2.zst", zstandard.ZstdCompressor().compress)
+    assert log_parser.detect_compression(log_file) == 'zstd'
+    logs = list(log_parser.iter_log_file(log_file, '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b'))
+    assert len(logs) == 39
+
+
+def test_detect_compression_plain_file():
+    assert log_parser.detect_compression("test-data/access-log.txt") is None
+
+
+def test_read_file_by_decompress_command(tmp_path):
+    log_file = _compress_access_log(tmp_path, "access.log.2.gz", gzip.compress)
+    logs = list(log_parser.iter_log_file(log_file, '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b',
+                                         decompress_commands={'gzip': 'gzip -dc'}))
+    assert len(logs) == 39
+    assert logs[-1].line == 39
+
+
+@pytest.mark.parametrize("decompress_commands", [None, {'gzip': 'gzip -dc'}])
+def test_hash_compressed_file_while_parsing(tmp_path, decompress_commands):
+    pattern = '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b'
+    log_file = _compress_access_log(tmp_path, "access.log.2.gz", gzip.compress)
+    with open(log_file, 'rb') as f:
+        expected = hashlib.sha256(f.read()).hexdigest()
+    hasher = hashlib.sha256()
+    logs = list(log_parser.iter_log_file(log_file, pattern, decompress_commands, hasher=hasher))
+    assert len(logs) == 39
+    assert hasher.hexdigest() == expected
+    # skipped lines are hashed, too
+    position = []
+    logs = log_parser.iter_log_file("test-data/access-log.txt", pattern, position=position)
+    for _ in range(30):
+        next(logs)
+    hasher = hashlib.sha256()
+    logs = list(log_parser.iter_log_file(log_file, pattern, decompress_commands, start=tuple(position),
+                                         hasher=hasher))
+    assert len(logs) == 9
+    assert hasher.hexdigest() == expected
+
+
+def test_iter_log_files_hashes(tmp_path):
+    pattern = '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b'
+    paths = [_compress_access_log(tmp_path, "access.log.2.bz2", bz2.compress), "test-data/access-log.txt"]
+    expected = {}
+    for path in paths:
+        with open(path, 'rb') as f:
+            expected[path] = hashlib.sha256(f.read()).hexdigest()
+    for workers in (1, 2):
+        hashes = {}
+        logs = list(log_parser.iter_log_files(paths, pattern, workers=workers, split_size=500,
+                                              hash_files=set(paths), hashes=hashes))
+        assert len(logs) == 78
+        assert hashes == expected
+
+
+def test_read_file_by_missing_decompress_command(tmp_path):
+    log_file = _compress_access_log(tmp_path, "access.log.2.gz", gzip.compress)
+    commands = {'gzip': 'find2deny-missing-command -dc'}
+    with pytest.raises(log_parser.CannotReadLogFileException):
+        list(log_parser.iter_log_file(log_file, '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b',
+                                      decompress_commands=commands))
+    positions = {}
+    logs = list(log_parser.iter_log_files([log_file, "test-data/access-log.txt"],
+                                          '%h %{X-Forwarded-For}i %l %u %t &quot;%r&quot; %s %b', workers=2,
+                                          decompress_commands=commands, positions=positions))
+    assert len(logs) == 39
+    assert list(positions) == ["test-data/access-log.txt"]
+
+
+FOLLOW_PATTERN = '%h %l %u %t "%r" %s %b'
+
+
+def _access_line(ip, path="/"):
+    return f'{ip} - - [27/Mar/2019:13:11:45 +0100] "GET {path} HTTP/1.1" 200 42\n'.encode()
+
+
+def test_log_follower_appended_lines(tmp_path):
+    log_path = tmp_path / "access.log"
+    log_path.write_bytes(_access_line("1.1.1.1"))
+    follower = log_parser.LogFollower([str(log_path)], FOLLOW_PATTERN)
+    assert [e.ip_str for e in follower.poll()] == ["1.1.1.1"]
+    assert follower.poll() == []
+    with open(log_path, 'ab') as f:
+        line = _access_line("2.2.2.2")
+        # an incomplete line is read when it is complete
+        f.write(line[:10])
+        f.flush()
+        assert follower.poll() == []
+        f.write(line[10:] + _access_line("3.3.3.3"))
+    assert [(e.ip_str, e.line) for e in follower.poll()] == [("2.2.2.2", 2), ("3.3.3.3", 3)]
+    follower.close()
+
+
+def test_log_follower_rotation_and_truncation(tmp_path):
+    log_path = tmp_path / "access.log"
+    log_path.write_bytes(_access_line("1.1.1.1"))
+    saved = {}
+    follower = log_parser.LogFollower([str(log_path)], FOLLOW_PATTERN,
+                                      save_position=lambda file_id, path, position: saved.update({file_id: position}))
+    follower.poll()
+    # logrotate renames the file, the server writes a last line into the old file before it opens a new one
+    os.rename(str(log_path), str(tmp_path / "access.log.1"))
+    with open(str(tmp_path / "access.log.1"), 'ab') as f:
+        f.write(_access_line("2.2.2.2"))
+    log_path.write_bytes(_access_line("3.3.3.3"))
+    assert [(e.ip_str, e.line) for e in follower.poll()] == [("2.2.2.2", 2), ("3.3.3.3", 1)]
+    follower.checkpoint()
+    assert saved == {log_parser.file_identity(str(tmp_path / "access.log.1")): (len(_access_line("1.1.1.1")) * 2, 2),
+                     log_parser.file_identity(str(log_path)): (len(_access_line("3.3.3.3")), 1)}
+    # copytruncate empties the file
+    log_path.write_bytes(b"")
+    assert follower.poll() == []
+    log_path.write_bytes(_access_line("4.4.4.4"))
+    assert [(e.ip_str, e.line) for e in follower.poll()] == [("4.4.4.4", 1)]
+    follower.close()
+
+
+def test_log_follower_reads_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_parser, "READ_CHUNK_SIZE", 2 * len(_access_line("1.1.1.1")) + 1)
+    log_path = tmp_path / "access.log"
+    log_path.write_bytes(b"".join(_access_line("1.1.1.{}".format(i)) for i in range(1, 6)))
+    follower = log_parser.LogFollower([str(log_path)], FOLLOW_PATTERN)
+    assert [e.ip_str for e in follower.poll()] == ["1.1.1.1", "1.1.1.2"]
+    # the rest of a rotated file is read before the new file
+    os.rename(str(log_path), str(tmp_path / "access.log.1"))
+    log_path.write_bytes(_access_line("2.2.2.2"))
+    assert [e.ip_str for e in follower.poll()] == ["1.1.1.3", "1.1.1.4"]
+    assert [e.ip_str for e in follower.poll()] == ["1.1.1.5", "2.2.2.2"]
+    follower.close()
+
+
+def test_log_follower_continues_at_position(tmp_path):
+    log_path = tmp_path / "access.log"
+    log_path.write_bytes(_access_line("1.1.1.1") + _access_line("2.2.2.2"))
+    identity = log_parser.file_identity(str(log_path))
+    positions = {identity: (len(_access_line("1.1.1.1")), 1)}
+    follower = log_parser.LogFollower([str(log_path)], FOLLOW_PATTERN, load_position=positions.get)
+    assert [(e.ip_str, e.line) for e in follower.poll()] == [("2.2.2.2", 2)]
+    follower.close()
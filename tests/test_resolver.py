@@ -0,0 +1,154 @@
+#!/usr/bin/python3
+
+import gzip
+import sqlite3
+import time
+import pytest
+from importlib_resources import read_text
+
+from find2deny import judgment
+from find2deny import log_parser
+from find2deny import network_index
+from find2deny import resolver
+
+
+IP2ASN_DATA = "\n".join([
+    "0.0.0.0\t0.255.255.255\t0\tNone\tNot routed",
+    "1.0.0.0\t1.0.0.255\t13335\tUS\tCLOUDFLARENET",
+    "54.36.0.0\t54.36.255.255\t16276\tFR\tOVH",
+    "134.96.0.0\t134.96.255.255\t553\tDE\tBELWUE",
+    "134.97.0.0\t134.97.0.9\t553\tDE\tBELWUE",
+    "2001:db8::\t2001:db8:ffff:ffff:ffff:ffff:ffff:ffff\t64496\tZZ\tDOCUMENTATION",
+]) + "\n"
+
+
+@pytest.fixture
+def ip2asn_file(tmp_path):
+    path = tmp_path / "ip2asn-combined.tsv.gz"
+    path.write_bytes(gzip.compress(IP2ASN_DATA.encode()))
+    return str(path)
+
+
+def test_ip2asn_resolver(ip2asn_file):
+    ip2asn = resolver.Ip2AsnResolver(ip2asn_file)
+    assert ip2asn.resolve("134.96.210.150") == "134.96.0.0/16"
+    assert ip2asn.resolve("54.36.148.129") == "54.36.0.0/16"
+    assert ip2asn.resolve("134.97.0.5") == "134.97.0.0/29, 134.97.0.8/31"
+    assert ip2asn.resolve("2001:db8::1") == "2001:db8::/32"
+    assert ip2asn.asn("1.0.0.1") == 13335
+    assert ip2asn.resolve("0.1.2.3") is None
+    assert ip2asn.resolve("8.8.8.8") is None
+
+
+class _StaticResolver(resolver.AbstractResolver):
+    def resolve(self, ip: str):
+        return "8.8.8.0/24"
+
+
+def test_chained_resolver(ip2asn_file):
+    chain = resolver.ChainedResolver([resolver.Ip2AsnResolver(ip2asn_file), _StaticResolver()])
+    assert chain.resolve("134.96.210.150") == "134.96.0.0/16"
+    assert chain.resolve("8.8.8.8") == "8.8.8.0/24"
+
+
+def test_lookup_ip_by_resolver(ip2asn_file):
+    try:
+        judgment.set_resolver(resolver.Ip2AsnResolver(ip2asn_file))
+        assert judgment.lookup_ip(log_parser.ip_to_int("134.96.210.150")) == "134.96.0.0/16"
+        assert judgment.lookup_ip("8.8.8.8") == "8.8.8.8"
+    finally:
+        judgment.set_resolver(resolver.RdapResolver())
+
+
+def test_range_index():
+    index = network_index.RangeIndex()
+    index.add(10, 19, "a")
+    index.add(30, 30, "b")
+    assert index.lookup(9) is None
+    assert index.lookup(10) == "a"
+    assert index.lookup(19) == "a"
+    assert index.lookup(20, "none") == "none"
+    assert index.lookup(30) == "b"
+    assert index.range_of(15) == (10, 19)
+    with pytest.raises(ValueError):
+        index.add(25, 30, "c")
+
+
+class _CountingResolver(resolver.AbstractResolver):
+    def __init__(self):
+        self.count = 0
+
+    def resolve(self, ip: str):
+        self.count += 1
+        if ip.startswith("10."):
+            return "10.0.0.0/24, 10.0.1.0/24 10.0.0.0/8"
+        return "54.36.148.0/22 54.36.0.0/16" if ip.startswith("54.36.") else None
+
+
+def test_cached_resolver(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "cache.sqlite"))
+    conn.executescript(read_text("find2deny", "log-data.sql"))
+    counting = _CountingResolver()
+    cached = resolver.CachedResolver(counting, conn, ttl_seconds=3600)
+    assert cached.resolve("54.36.148.129") == "54.36.148.0/22 54.36.0.0/16"
+    assert cached.resolve("54.36.149.1") == "54.36.148.0/22 54.36.0.0/16"
+    assert counting.count == 1
+    # outside of the network, AS network is not used as cache key
+    cached.resolve("54.36.1.1")
+    assert cached.resolve("8.8.8.8") is None
+    assert counting.count == 3
+    assert cached.resolve("10.0.0.1") == cached.resolve("10.0.1.1") == "10.0.0.0/24, 10.0.1.0/24 10.0.0.0/8"
+    assert counting.count == 4
+    # a new run reads the cache from database
+    cached = resolver.CachedResolver(counting, conn, ttl_seconds=3600)
+    assert cached.resolve("54.36.150.2") == "54.36.148.0/22 54.36.0.0/16"
+    assert counting.count == 4
+    conn.execute("UPDATE resolved_network SET resolved_at = ?", (int(time.time()) - 7200,))
+    cached = resolver.CachedResolver(counting, conn, ttl_seconds=3600)
+    cached.resolve("54.36.150.2")
+    assert counting.count == 5
+    conn.close()
+
+
+class _SlowResolver(resolver.AbstractResolver):
+    def __init__(self):
+        self.looked_up = []
+
+    def resolve(self, ip: str):
+        self.looked_up.append(ip)
+        time.sleep(0.2)
+        return ip + "/32"
+
+
+def test_async_resolver():
+    slow = _SlowResolver()
+    async_resolver = resolver.AsyncResolver(slow, workers=4)
+    results = {}
+    start = time.perf_counter()
+    for ip in ["1.1.1.1", "2.2.2.2", "3.3.3.3", "4.4.4.4", "1.1.1.1"]:
+        async_resolver.submit(ip, lambda network, ip=ip: results.setdefault(ip, []).append(network))
+    # submitting does not wait for lookups
+    assert time.perf_counter() - start < 0.1
+    assert async_resolver.pending() == 4
+    assert async_resolver.drain(wait=True) == 4
+    assert time.perf_counter() - start < 0.6
+    assert sorted(slow.looked_up) == ["1.1.1.1", "2.2.2.2", "3.3.3.3", "4.4.4.4"]
+    assert results["1.1.1.1"] == ["1.1.1.1/32", "1.1.1.1/32"]
+    assert results["4.4.4.4"] == ["4.4.4.4/32"]
+    async_resolver.shutdown()
+
+
+def test_lookup_ip_async(ip2asn_file):
+    results = []
+    try:
+        judgment.set_resolver(resolver.Ip2AsnResolver(ip2asn_file))
+        judgment.lookup_ip_async("134.96.210.150", results.append)
+        assert results == ["134.96.0.0/16"]
+        judgment.set_async_lookup(2)
+        judgment.lookup_ip_async(log_parser.ip_to_int("54.36.148.129"), results.append)
+        judgment.lookup_ip_async("8.8.8.8", results.append)
+        judgment.complete_lookups(wait=True)
+        assert sorted(results[1:]) == ["54.36.0.0/16", "8.8.8.8"]
+    finally:
+        judgment.set_async_lookup(0)
+        judgment.set_resolver(resolver.RdapResolver())